@@ -37,6 +37,9 @@ import json
 from io import BytesIO
 import pytz
 
+from telefones import formatar_numero, variantes_nono_digito, telefones_por_linha
+from cache_procedimentos import cache_procedimentos, chave_procedimento
+
 # Timezone de Fortaleza (UTC-3)
 TZ_FORTALEZA = pytz.timezone('America/Fortaleza')
 
@@ -291,6 +294,10 @@ class Campanha(db.Model):
         self.total_rejeitados = self.contatos.filter_by(rejeitado=True).count()
         self.total_erros = self.contatos.filter(Contato.erro.isnot(None)).count()
 
+        # Contadores mudaram: o snapshot do api_status deve ser recalculado
+        from progresso_campanhas import invalidar_progresso
+        invalidar_progresso('fila', self.id)
+
     def pct_validacao(self):
         return round((self.total_validos / self.total_contatos * 100), 1) if self.total_contatos else 0
 
@@ -401,6 +408,11 @@ class Campanha(db.Model):
 
 class Contato(db.Model):
     __tablename__ = 'contatos'
+    __table_args__ = (
+        # Listagens por campanha paginadas por keyset (relatórios)
+        db.Index('ix_contatos_campanha_id', 'campanha_id', 'id'),
+        db.Index('ix_contatos_campanha_nome', 'campanha_id', 'nome', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     campanha_id = db.Column(db.Integer, db.ForeignKey('campanhas.id', ondelete='CASCADE'), nullable=False)
 
@@ -580,6 +592,10 @@ class Contato(db.Model):
 
 class Telefone(db.Model):
     __tablename__ = 'telefones'
+    __table_args__ = (
+        # Telefone principal do contato (menor prioridade, depois menor id)
+        db.Index('ix_telefones_contato_prioridade', 'contato_id', 'prioridade', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     contato_id = db.Column(db.Integer, db.ForeignKey('contatos.id', ondelete='CASCADE'), nullable=False)
     
@@ -611,6 +627,13 @@ class Telefone(db.Model):
 
 class LogMsg(db.Model):
     __tablename__ = 'logs'
+    __table_args__ = (
+        # Keyset de /logs (data, id), com e sem filtro, e histórico do contato
+        db.Index('ix_logs_data_id', 'data', 'id'),
+        db.Index('ix_logs_campanha_data', 'campanha_id', 'data', 'id'),
+        db.Index('ix_logs_direcao_data', 'direcao', 'data', 'id'),
+        db.Index('ix_logs_contato_data', 'contato_id', 'data', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     campanha_id = db.Column(db.Integer, db.ForeignKey('campanhas.id', ondelete='CASCADE'))
     contato_id = db.Column(db.Integer, db.ForeignKey('contatos.id', ondelete='CASCADE'))
@@ -716,6 +739,7 @@ class ProcedimentoNormalizado(db.Model):
     __tablename__ = 'procedimentos_normalizados'
     id = db.Column(db.Integer, primary_key=True)
     termo_original = db.Column(db.String(300), unique=True, index=True, nullable=False)  # Ex: "COLPOPERINEOPLASTIA ANTERIOR E POSTERIOR"
+    chave_canonica = db.Column(db.String(300), index=True)  # Sem acentos/código SUS/abreviações (ver chave_procedimento)
     termo_normalizado = db.Column(db.String(300))  # Ex: "Cirurgia de correção íntima"
     termo_simples = db.Column(db.String(200))  # Ex: "Cirurgia ginecológica"
     explicacao = db.Column(db.Text)  # Explicação breve do procedimento
@@ -726,19 +750,19 @@ class ProcedimentoNormalizado(db.Model):
     fonte = db.Column(db.String(50), default='deepseek')  # deepseek, manual, etc
 
     def incrementar_uso(self):
-        """Incrementa contador de uso"""
-        self.usado_count += 1
-        db.session.commit()
+        """Registra um uso (acumulado no cache e gravado em lote periodicamente)"""
+        cache_procedimentos.registrar_uso(self.termo_original)
 
     @classmethod
     def obter_ou_criar(cls, termo_original):
         """Busca no cache ou retorna None se não existir"""
-        return cls.query.filter_by(termo_original=termo_original.upper().strip()).first()
+        return cls.query.filter_by(chave_canonica=chave_procedimento(termo_original)).first()
 
     @classmethod
     def salvar_normalizacao(cls, termo_original, termo_normalizado, termo_simples, explicacao, fonte='deepseek'):
         """Salva uma normalização no cache"""
         termo_original_upper = termo_original.upper().strip()
+        chave_canonica = chave_procedimento(termo_original)
 
         try:
             # Verificar se já existe um registro com este termo_original
@@ -750,11 +774,13 @@ class ProcedimentoNormalizado(db.Model):
                 proc.termo_simples = termo_simples
                 proc.explicacao = explicacao
                 proc.fonte = fonte
+                proc.chave_canonica = chave_canonica
                 proc.atualizado_em = datetime.utcnow()
             else:
                 # Criar novo registro
                 proc = cls(
                     termo_original=termo_original_upper,
+                    chave_canonica=chave_canonica,
                     termo_normalizado=termo_normalizado,
                     termo_simples=termo_simples,
                     explicacao=explicacao,
@@ -763,6 +789,7 @@ class ProcedimentoNormalizado(db.Model):
                 db.session.add(proc)
 
             db.session.commit()
+            cache_procedimentos.atualizar(proc)
             return proc
 
         except IntegrityError:
@@ -774,8 +801,10 @@ class ProcedimentoNormalizado(db.Model):
                 proc.termo_simples = termo_simples
                 proc.explicacao = explicacao
                 proc.fonte = fonte
+                proc.chave_canonica = chave_canonica
                 proc.atualizado_em = datetime.utcnow()
                 db.session.commit()
+                cache_procedimentos.atualizar(proc)
                 return proc
             else:
                 raise
@@ -933,6 +962,10 @@ class CampanhaConsulta(db.Model):
 class AgendamentoConsulta(db.Model):
     """Agendamento individual de consulta com dados da planilha"""
     __tablename__ = 'agendamentos_consultas'
+    __table_args__ = (
+        # Marca d'água de metricas_diarias._dias_afetados (a cada 5 minutos)
+        db.Index('ix_agendamentos_consultas_updated_at', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     campanha_id = db.Column(db.Integer, db.ForeignKey('campanhas_consultas.id', ondelete='CASCADE'))
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
@@ -989,6 +1022,13 @@ class AgendamentoConsulta(db.Model):
     # Telefone que confirmou (para enviar comprovante ao número certo)
     telefone_confirmacao = db.Column(db.String(20))  # Armazena qual telefone respondeu SIM
 
+    # Envio do comprovante (fila "comprovantes" do Celery)
+    envio_comprovante_status = db.Column(db.String(20))  # PENDENTE, ENVIANDO, MENSAGEM_ENVIADA, ENVIADO, ERRO
+    envio_comprovante_erro = db.Column(db.String(300))
+    envio_comprovante_task_id = db.Column(db.String(100))
+    envio_comprovante_tentativas = db.Column(db.Integer, default=0)
+    envio_comprovante_em = db.Column(db.DateTime)  # Última mudança de status
+
 
     # Rejeição
     motivo_rejeicao = db.Column(db.Text)  # Armazena o motivo quando paciente rejeita
@@ -1000,6 +1040,8 @@ class AgendamentoConsulta(db.Model):
 
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # onupdate vale para o ORM e para update()/query.update(); UPDATE em SQL
+    # puro (text) precisa setar updated_at, senão metricas_diarias não vê a mudança
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     data_confirmacao = db.Column(db.DateTime)
     data_rejeicao = db.Column(db.DateTime)
@@ -1036,6 +1078,10 @@ class TelefoneConsulta(db.Model):
 class LogMsgConsulta(db.Model):
     """Log de todas as mensagens enviadas e recebidas nas campanhas de consultas"""
     __tablename__ = 'logs_msgs_consultas'
+    __table_args__ = (
+        # Histórico da consulta em ordem cronológica
+        db.Index('ix_logs_msgs_consultas_consulta_data', 'consulta_id', 'data', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     campanha_id = db.Column(db.Integer, db.ForeignKey('campanhas_consultas.id', ondelete='CASCADE'))
     consulta_id = db.Column(db.Integer, db.ForeignKey('agendamentos_consultas.id', ondelete='CASCADE'))
@@ -1055,6 +1101,11 @@ class LogMsgConsulta(db.Model):
 class PesquisaSatisfacao(db.Model):
     """Pesquisa de satisfação respondida via WhatsApp"""
     __tablename__ = 'pesquisas_satisfacao'
+    __table_args__ = (
+        # Lista paginada do dashboard (sem filtro / por especialidade) e DISTINCT das especialidades
+        db.Index('ix_pesquisas_usuario_data', 'usuario_id', 'data_resposta', 'id'),
+        db.Index('ix_pesquisas_usuario_especialidade', 'usuario_id', 'especialidade', 'data_resposta', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     consulta_id = db.Column(db.Integer, db.ForeignKey('agendamentos_consultas.id', ondelete='CASCADE'))
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
@@ -1100,9 +1151,14 @@ class Paciente(db.Model):
 class ComprovanteAntecipado(db.Model):
     """Comprovante pré-carregado na campanha para envio automático quando paciente confirmar"""
     __tablename__ = 'comprovantes_antecipados'
+    __table_args__ = (
+        # Matching por nome na confirmação: campanha + nome normalizado + não usado
+        db.Index('ix_comprovantes_antecipados_campanha_nome', 'campanha_id', 'nome_normalizado', 'usado'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     campanha_id = db.Column(db.Integer, db.ForeignKey('campanhas_consultas.id', ondelete='CASCADE'), nullable=False)
     nome_paciente = db.Column(db.String(200), nullable=False)   # extraído do nome do arquivo
+    nome_normalizado = db.Column(db.String(200))                # normalizar_nome_paciente(nome_paciente)
     filename = db.Column(db.String(255), nullable=False)        # nome do arquivo no disco
     filepath = db.Column(db.String(500), nullable=False)        # caminho completo no servidor
     usado = db.Column(db.Boolean, default=False)                # True após ser enviado
@@ -1110,6 +1166,11 @@ class ComprovanteAntecipado(db.Model):
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
     data_upload = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # OCR feito em background logo após o upload (tasks.ocr_comprovante_antecipado_task)
+    ocr_status = db.Column(db.String(20))                       # PENDENTE, CONCLUIDO, ERRO
+    dados_ocr = db.Column(db.Text)                              # JSON de extrair_dados_comprovante
+    ocr_em = db.Column(db.DateTime)
+
     campanha = db.relationship('CampanhaConsulta', backref='comprovantes_antecipados')
     consulta = db.relationship('AgendamentoConsulta', backref='comprovante_antecipado', uselist=False)
     usuario = db.relationship('Usuario', backref='comprovantes_antecipados_upload')
@@ -1124,15 +1185,27 @@ def normalizar_nome_paciente(nome):
 
 
 def buscar_comprovante_antecipado(campanha_id, nome_paciente):
-    """Busca comprovante antecipado não usado com nome matching na campanha."""
-    nome_normalizado = normalizar_nome_paciente(nome_paciente)
-    candidatos = ComprovanteAntecipado.query.filter_by(
-        campanha_id=campanha_id, usado=False
-    ).all()
-    for c in candidatos:
-        if normalizar_nome_paciente(c.nome_paciente) == nome_normalizado:
-            return c
-    return None
+    """Busca comprovante antecipado não usado com nome matching na campanha (consulta indexada)."""
+    return ComprovanteAntecipado.query.filter_by(
+        campanha_id=campanha_id, usado=False, nome_normalizado=normalizar_nome_paciente(nome_paciente)
+    ).order_by(ComprovanteAntecipado.id).first()
+
+
+def buscar_comprovantes_antecipados(campanha_id, nomes_pacientes):
+    """
+    Versão em lote de buscar_comprovante_antecipado: uma única consulta para
+    todos os nomes. Retorna {nome normalizado: comprovante}.
+    """
+    nomes_normalizados = {normalizar_nome_paciente(nome) for nome in nomes_pacientes if nome}
+    if not nomes_normalizados:
+        return {}
+    comprovantes = ComprovanteAntecipado.query.filter(
+        ComprovanteAntecipado.campanha_id == campanha_id,
+        ComprovanteAntecipado.usado == False,
+        ComprovanteAntecipado.nome_normalizado.in_(nomes_normalizados)
+    ).order_by(ComprovanteAntecipado.id.desc()).all()
+    # Ordem decrescente: o de menor id (mesmo critério da busca unitária) prevalece
+    return {c.nome_normalizado: c for c in comprovantes}
 
 
 class HistoricoConsulta(db.Model):
@@ -1341,13 +1414,308 @@ class LogMsgSCIH(db.Model):
     data = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class ResultadoOCR(db.Model):
+    """Cache de resultados de OCR de comprovantes, por conteúdo do arquivo"""
+    __tablename__ = 'resultados_ocr'
+    __table_args__ = (
+        db.UniqueConstraint('hash_arquivo', 'versao_extrator', name='uq_resultado_ocr_hash_versao'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    hash_arquivo = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 do conteúdo
+    versao_extrator = db.Column(db.String(20), nullable=False)
+    dados_json = db.Column(db.Text, nullable=False)
+    tempo_ms = db.Column(db.Integer)  # Quanto o OCR levou (para acompanhar a economia)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SnapshotDashboard(db.Model):
+    """
+    Dados pré-calculados de dashboards (ver dashboard_admin.py) e marcas de
+    controle da atualização deles (metricas_diarias.py), um registro por chave
+    """
+    __tablename__ = 'snapshots_dashboard'
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(50), unique=True, nullable=False)  # ex: 'admin:consulta'
+    dados_json = db.Column(db.Text, nullable=False)
+    gerado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    tempo_ms = db.Column(db.Integer)  # Quanto o cálculo levou
+
+
+class MetricaDiaria(db.Model):
+    """Agregado diário por usuário/modo/métrica para os gráficos (ver metricas_diarias.py)"""
+    __tablename__ = 'daily_metrics'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'usuario_id', 'modo', 'metrica', name='uq_daily_metrics'),
+        db.Index('ix_daily_metrics_modo_metrica_dia', 'modo', 'metrica', 'dia'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    usuario_id = db.Column(db.Integer)  # criador da campanha
+    modo = db.Column(db.String(20), nullable=False)      # consulta, fila
+    metrica = db.Column(db.String(40), nullable=False)   # msg1_enviadas, comprovantes_enviados, ...
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+
 # =============================================================================
 # FUNÇÕES DE OCR - EXTRAÇÃO DE DADOS DO COMPROVANTE
 # =============================================================================
 
+# Incrementar sempre que a extração (OCR ou regex) mudar, para invalidar o cache
+VERSAO_EXTRATOR_OCR = '4'
+
+
+def hash_arquivo(filepath, tamanho_bloco=1024 * 1024):
+    """SHA-256 do conteúdo do arquivo (lido em blocos)"""
+    import hashlib
+
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
 def extrair_dados_comprovante(filepath):
     """
-    Extrai dados do comprovante de consulta usando OCR.
+    Extrai dados do comprovante de consulta, reaproveitando o resultado de
+    OCR já feito para o mesmo arquivo (mesmo conteúdo + mesma versão do extrator).
+
+    Mesmo retorno de _extrair_dados_comprovante_arquivo.
+    """
+    try:
+        hash_conteudo = hash_arquivo(filepath)
+    except OSError as e:
+        logger.error(f"Erro ao ler comprovante {filepath}: {e}")
+        return None
+
+    # Leitura também em conexão própria: se falhar (tabela ausente, banco
+    # instável), a transação dela é desfeita ao sair do bloco e a sessão de
+    # quem chamou não fica em estado abortado no PostgreSQL
+    try:
+        tabela = ResultadoOCR.__table__
+        with db.engine.connect() as conn:
+            dados_json = conn.execute(
+                db.select(tabela.c.dados_json).where(
+                    tabela.c.hash_arquivo == hash_conteudo,
+                    tabela.c.versao_extrator == VERSAO_EXTRATOR_OCR
+                ).limit(1)
+            ).scalar()
+        if dados_json:
+            logger.info(f"OCR em cache para {os.path.basename(filepath)} ({hash_conteudo[:12]})")
+            return json.loads(dados_json)
+    except Exception as e:
+        logger.warning(f"Cache de OCR indisponível: {e}")
+
+    inicio = time.time()
+    dados = _extrair_dados_comprovante_arquivo(filepath)
+    if dados is None:
+        # Falha (dependência ausente, arquivo corrompido...) não é cacheada
+        return None
+
+    # Conexão própria: não faz commit de alterações pendentes na sessão de quem chamou
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(ResultadoOCR.__table__.insert().values(
+                hash_arquivo=hash_conteudo,
+                versao_extrator=VERSAO_EXTRATOR_OCR,
+                dados_json=json.dumps(dados, ensure_ascii=False),
+                tempo_ms=int((time.time() - inicio) * 1000),
+                criado_em=datetime.utcnow()
+            ))
+    except IntegrityError:
+        # Outro processo fez o OCR do mesmo arquivo ao mesmo tempo
+        pass
+    except Exception as e:
+        logger.warning(f"Erro ao salvar cache de OCR: {e}")
+
+    return dados
+
+
+# Mínimo de caracteres alfanuméricos para considerar que o PDF tem camada de texto
+TEXTO_MINIMO_PDF = 50
+
+
+def _texto_pdf_direto(filepath):
+    """
+    Extrai a camada de texto de um PDF gerado (ex: AGHU) com o pdftotext
+    do poppler (mesmo pacote usado pelo pdf2image). Retorna '' se o PDF for
+    digitalizado (sem texto) ou se o pdftotext não estiver disponível.
+    """
+    import subprocess
+
+    try:
+        resultado = subprocess.run(
+            # -layout mantém rótulo e valor na mesma linha, como no OCR
+            ['pdftotext', '-layout', '-enc', 'UTF-8', filepath, '-'],
+            capture_output=True, timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"pdftotext indisponível ou demorou demais: {e}")
+        return ''
+    if resultado.returncode != 0:
+        return ''
+    texto = resultado.stdout.decode('utf-8', errors='ignore')
+    if sum(c.isalnum() for c in texto) < TEXTO_MINIMO_PDF:
+        return ''
+    return texto
+
+
+def _normalizar_texto_extraido(texto):
+    """Deixa o texto no mesmo formato nos dois caminhos (camada de texto e OCR)"""
+    import re
+
+    texto = texto.replace('\f', '\n').replace('\r', '')
+    linhas = [linha.rstrip() for linha in texto.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(linhas)).strip() + '\n'
+
+
+CAMPOS_COMPROVANTE = ('paciente', 'data', 'hora', 'medico', 'especialidade')
+
+# Sem estes campos o texto do PDF não é usado e o comprovante vai para o OCR
+CAMPOS_OBRIGATORIOS_TEXTO_PDF = ('paciente', 'data', 'hora')
+
+
+def _extrair_campos_comprovante(full_text, so_rotulos=False):
+    """
+    Extrai os campos do comprovante a partir do texto (mesmas regras para
+    camada de texto do PDF e para OCR).
+
+    Args:
+        so_rotulos: usa só os padrões ancorados em rótulo ("Data:", "Hora:",
+            "Profissional:"...), sem os genéricos de último recurso (qualquer
+            dd/mm/aaaa, qualquer hh:mm, "Dr"), que podem pegar a data/hora de
+            impressão. Usado pelo OCR adaptativo para decidir se pode parar.
+
+    Returns:
+        dict com paciente, data, hora, medico e especialidade (None se não encontrado)
+    """
+    import re
+
+    dados = dict.fromkeys(CAMPOS_COMPROVANTE)
+
+    # Padrões de regex para extrair campos
+    # Paciente: procura por "Paciente:" ou "Nome:" seguido do nome
+    paciente_patterns = [
+        r'Paciente[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|Data)',
+        r'Nome[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|Data)',
+        r'PACIENTE[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
+    ]
+    for pattern in paciente_patterns:
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            dados['paciente'] = match.group(1).strip()
+            break
+
+    # Data: procura por padrão DD/MM/YYYY ("DATA:" no AGHU, antes do genérico
+    # para não pegar a data de impressão do cabeçalho)
+    data_patterns = [
+        r'Data[:\s]+(\d{2}/\d{2}/\d{4})',
+    ]
+    data_genericos = [
+        r'(\d{2}/\d{2}/\d{4})',
+    ]
+    for pattern in data_patterns + ([] if so_rotulos else data_genericos):
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            dados['data'] = match.group(1)
+            break
+
+    # Hora: procura por padrão HH:MM
+    # Padrões específicos primeiro (maior prioridade) para evitar capturar horário de impressão
+    hora_patterns = [
+        r'Hora[:\s]+(\d{2}:\d{2})',                    # "Hora: 07:00"
+        r'Horário[:\s]+(\d{2}:\d{2})',                 # "Horário: 14:42"
+    ]
+    hora_genericos = [
+        r'(?:às|as)[:\s]+(\d{2}:\d{2})',              # "às 07:00"
+        # Padrão genérico apenas como último recurso
+        # Evita capturar horários de cabeçalho (que geralmente têm data antes)
+        r'(?<![\d/])\s+(\d{2}:\d{2})(?:h|hs|hrs)?(?!\s*[\d/])',  # Evita "11/12/2025 14:52"
+    ]
+    for pattern in hora_patterns + ([] if so_rotulos else hora_genericos):
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            dados['hora'] = match.group(1)
+            break
+
+    # Médico/Profissional
+    medico_patterns = [
+        r'Profissional[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|Unidade)',
+        r'Médico[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
+    ]
+    medico_genericos = [
+        r'Dr\.?\s*([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
+        r'Dra\.?\s*([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
+    ]
+    for pattern in medico_patterns + ([] if so_rotulos else medico_genericos):
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            dados['medico'] = match.group(1).strip()
+            break
+
+    # Especialidade/Unidade Funcional
+    especialidade_patterns = [
+        # Padrão 1: ESPECIALIDADE em uma linha e o valor na linha seguinte
+        # (o valor termina no fim da linha)
+        r'ESPECIALIDADE\s*\n\s*([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ]+(?:[ \t]+[A-ZÁÉÍÓÚÀÂÊÔÃÕÇ]+)*)',
+        # Padrão 2: Unidade Funcional com valor na mesma linha
+        r'Unidade\s+Funcional[:\s]+(?:AMBULATÓRIO\s+)?([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|\.|,)',
+        # Padrão 3: Especialidade: valor na mesma linha
+        r'Especialidade[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
+    ]
+    especialidade_genericos = [
+        # Padrão 4: AMBULATÓRIO seguido do nome
+        r'AMBULATÓRIO\s+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|\.|,)',
+    ]
+    for pattern in especialidade_patterns + ([] if so_rotulos else especialidade_genericos):
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            dados['especialidade'] = match.group(1).strip()
+            break
+
+    return dados
+
+
+def _obter_texto_comprovante(filepath):
+    """
+    Obtém o texto do comprovante.
+
+    PDFs com camada de texto são lidos diretamente (milissegundos), desde que
+    os campos obrigatórios (CAMPOS_OBRIGATORIOS_TEXTO_PDF) sejam encontrados
+    nesse texto; PDFs digitalizados, imagens e PDFs cujo texto não casa com
+    as regras passam pelo OCR adaptativo (ver ocr_preprocessamento).
+
+    Returns:
+        (texto, metodo) com metodo 'texto_pdf', 'ocr_regioes', 'ocr_pagina'
+        ou 'ocr_completo', ou (None, None) em caso de falha
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+
+    if ext == '.pdf':
+        texto = _texto_pdf_direto(filepath)
+        if texto:
+            texto = _normalizar_texto_extraido(texto)
+            campos = _extrair_campos_comprovante(texto)
+            faltando = [c for c in CAMPOS_OBRIGATORIOS_TEXTO_PDF if not campos.get(c)]
+            if not faltando:
+                return texto, 'texto_pdf'
+            logger.info(
+                f"Camada de texto de {os.path.basename(filepath)} sem {', '.join(faltando)}; usando OCR"
+            )
+
+    from ocr_preprocessamento import ocr_adaptativo
+
+    return ocr_adaptativo(
+        filepath,
+        # Só para decidir o estágio: o texto escolhido passa depois pelas regras completas
+        extrair_campos=lambda texto: _extrair_campos_comprovante(_normalizar_texto_extraido(texto), so_rotulos=True),
+        normalizar=_normalizar_texto_extraido
+    )
+
+
+def _extrair_dados_comprovante_arquivo(filepath):
+    """
+    Extrai dados do comprovante de consulta (camada de texto do PDF ou OCR).
     Suporta PDF, JPG e PNG.
 
     Retorna dict com:
@@ -1357,123 +1725,32 @@ def extrair_dados_comprovante(filepath):
     - medico: nome do médico
     - especialidade: especialidade médica
     - raw_text: texto completo extraído
+    - metodo_extracao: 'texto_pdf', 'ocr_regioes', 'ocr_pagina' ou 'ocr_completo'
     """
-    import re
-
-    try:
-        import pytesseract
-        from PIL import Image
-    except ImportError:
-        logger.warning("pytesseract ou PIL não disponível para OCR")
-        return None
-
     dados = {
         'paciente': None,
         'data': None,
         'hora': None,
         'medico': None,
         'especialidade': None,
-        'raw_text': ''
+        'raw_text': '',
+        'metodo_extracao': None
     }
 
     try:
-        ext = os.path.splitext(filepath)[1].lower()
-        images = []
-
-        # Converter PDF para imagens se necessário
-        if ext == '.pdf':
-            try:
-                from pdf2image import convert_from_path
-                images = convert_from_path(filepath, dpi=300)
-            except ImportError:
-                logger.warning("pdf2image não disponível para processar PDF")
-                return None
-            except Exception as e:
-                logger.error(f"Erro ao converter PDF para imagem: {e}")
-                return None
-        else:
-            # Carregar imagem diretamente
-            images = [Image.open(filepath)]
-
-        # Extrair texto de todas as páginas/imagens
-        full_text = ''
-        for img in images:
-            # Configurar pytesseract para português
-            text = pytesseract.image_to_string(img, lang='por')
-            full_text += text + '\n'
+        inicio = time.time()
+        full_text, metodo = _obter_texto_comprovante(filepath)
+        if full_text is None:
+            return None
 
         dados['raw_text'] = full_text
-        logger.info(f"OCR extraído ({len(full_text)} chars): {full_text[:200]}...")
-
-        # Padrões de regex para extrair campos
-        # Paciente: procura por "Paciente:" ou "Nome:" seguido do nome
-        paciente_patterns = [
-            r'Paciente[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|Data)',
-            r'Nome[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|Data)',
-            r'PACIENTE[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
-        ]
-        for pattern in paciente_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                dados['paciente'] = match.group(1).strip()
-                break
-
-        # Data: procura por padrão DD/MM/YYYY
-        data_patterns = [
-            r'Data[:\s]+(\d{2}/\d{2}/\d{4})',
-            r'(\d{2}/\d{2}/\d{4})',
-        ]
-        for pattern in data_patterns:
-            match = re.search(pattern, full_text)
-            if match:
-                dados['data'] = match.group(1)
-                break
-
-        # Hora: procura por padrão HH:MM
-        # Padrões específicos primeiro (maior prioridade) para evitar capturar horário de impressão
-        hora_patterns = [
-            r'Hora[:\s]+(\d{2}:\d{2})',                    # "Hora: 07:00"
-            r'Horário[:\s]+(\d{2}:\d{2})',                 # "Horário: 14:42"
-            r'(?:às|as)[:\s]+(\d{2}:\d{2})',              # "às 07:00"
-            # Padrão genérico apenas como último recurso
-            # Evita capturar horários de cabeçalho (que geralmente têm data antes)
-            r'(?<![\d/])\s+(\d{2}:\d{2})(?:h|hs|hrs)?(?!\s*[\d/])',  # Evita "11/12/2025 14:52"
-        ]
-        for pattern in hora_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                dados['hora'] = match.group(1)
-                break
-
-        # Médico/Profissional
-        medico_patterns = [
-            r'Profissional[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|Unidade)',
-            r'Médico[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
-            r'Dr\.?\s*([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
-            r'Dra\.?\s*([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
-        ]
-        for pattern in medico_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                dados['medico'] = match.group(1).strip()
-                break
+        dados['metodo_extracao'] = metodo
+        logger.info(
+            f"Texto extraído via {metodo} em {time.time() - inicio:.2f}s "
+            f"({len(full_text)} chars): {full_text[:200]}..."
+        )
 
-        # Especialidade/Unidade Funcional
-        especialidade_patterns = [
-            # Padrão 1: ESPECIALIDADE em uma linha e o valor na linha seguinte
-            r'ESPECIALIDADE\s*\n\s*([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ]+(?:\s+[A-ZÁÉÍÓÚÀÂÊÔÃÕÇ]+)*)',
-            # Padrão 2: Unidade Funcional com valor na mesma linha
-            r'Unidade\s+Funcional[:\s]+(?:AMBULATÓRIO\s+)?([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|\.|,)',
-            # Padrão 3: Especialidade: valor na mesma linha
-            r'Especialidade[:\s]+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$)',
-            # Padrão 4: AMBULATÓRIO seguido do nome
-            r'AMBULATÓRIO\s+([A-ZÁÉÍÓÚÀÂÊÔÃÕÇ\s]+?)(?:\n|$|\.|,)',
-        ]
-        for pattern in especialidade_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                dados['especialidade'] = match.group(1).strip()
-                break
+        dados.update(_extrair_campos_comprovante(full_text))
 
         logger.info(f"Dados extraídos do comprovante: {dados}")
         return dados
@@ -2247,14 +2524,14 @@ class DeepSeekAI:
         procedimento_original = procedimento_original.strip()
 
         # 1. Verificar se já está normalizado no cache
-        cached = ProcedimentoNormalizado.obter_ou_criar(procedimento_original)
-        if cached and cached.aprovado:
-            cached.incrementar_uso()
+        cached = cache_procedimentos.obter(procedimento_original)
+        if cached and cached['aprovado']:
+            cache_procedimentos.registrar_uso(procedimento_original)
             return {
                 'original': procedimento_original,
-                'normalizado': cached.termo_normalizado,
-                'simples': cached.termo_simples,
-                'explicacao': cached.explicacao,
+                'normalizado': cached['termo_normalizado'],
+                'simples': cached['termo_simples'],
+                'explicacao': cached['explicacao'],
                 'fonte': 'cache'
             }
 
@@ -2523,6 +2800,95 @@ Responda APENAS com o JSON ARRAY, sem texto adicional. Normalize TODOS os {len(p
             logger.error(f"[BATCH API] Exceção inesperada: {type(e).__name__}: {e}")
             return {}
 
+    def normalizar_em_lote(self, procedimentos, ao_normalizar=None, tamanho_lote=None, max_paralelo=None):
+        """
+        Normaliza muitos procedimentos via API em lotes concorrentes.
+
+        Os lotes rodam em paralelo (limitado por AI_API_CONCORRENCIA). Lote que
+        falha é dividido ao meio (respostas grandes demais costumam truncar o
+        JSON) e termos que a API omitiu são reenviados, com backoff exponencial
+        entre tentativas. As chamadas HTTP ficam nas threads; ao_normalizar é
+        chamado na thread de quem chamou, à medida que cada lote chega.
+
+        Args:
+            procedimentos: lista de termos a normalizar
+            ao_normalizar: callback(termo, resultado) chamado para cada termo normalizado
+            tamanho_lote: termos por requisição (padrão AI_API_TAMANHO_LOTE ou 20)
+            max_paralelo: requisições simultâneas (padrão AI_API_CONCORRENCIA ou 4)
+
+        Returns:
+            dict {termo: resultado} dos termos normalizados com sucesso
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        tamanho_lote = tamanho_lote or int(os.getenv('AI_API_TAMANHO_LOTE', '20'))
+        max_paralelo = max_paralelo or int(os.getenv('AI_API_CONCORRENCIA', '4'))
+        max_tentativas = int(os.getenv('AI_API_MAX_TENTATIVAS', '3'))
+
+        procedimentos = list(dict.fromkeys(p for p in procedimentos if p))
+        if not procedimentos:
+            return {}
+
+        def chamar(lote, tentativa):
+            if tentativa:
+                time.sleep(2 ** (tentativa - 1))
+            return self._chamar_api_batch(lote)
+
+        resultados = {}
+        inicio = time.time()
+
+        with ThreadPoolExecutor(max_workers=max_paralelo) as executor:
+            pendentes = {}
+
+            def enviar(lote, tentativa=0):
+                pendentes[executor.submit(chamar, lote, tentativa)] = (lote, tentativa)
+
+            for i in range(0, len(procedimentos), tamanho_lote):
+                enviar(procedimentos[i:i + tamanho_lote])
+
+            while pendentes:
+                concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    lote, tentativa = pendentes.pop(futuro)
+                    try:
+                        resposta = futuro.result() or {}
+                    except Exception as e:
+                        logger.error(f"[BATCH API] Erro no lote de {len(lote)} procedimentos: {e}")
+                        resposta = {}
+
+                    faltando = []
+                    for termo in lote:
+                        resultado = resposta.get(termo.upper().strip())
+                        if resultado and resultado.get('termo_simples'):
+                            resultados[termo] = resultado
+                            if ao_normalizar:
+                                try:
+                                    ao_normalizar(termo, resultado)
+                                except Exception as e:
+                                    logger.error(f"[BATCH API] Erro ao salvar '{termo}': {e}")
+                        else:
+                            faltando.append(termo)
+
+                    if not faltando:
+                        continue
+                    if tentativa + 1 >= max_tentativas:
+                        logger.warning(f"[BATCH API] {len(faltando)} procedimentos sem normalização após {max_tentativas} tentativas")
+                        continue
+
+                    if not resposta and len(faltando) > 1:
+                        # Lote inteiro falhou: divide ao meio
+                        meio = len(faltando) // 2
+                        enviar(faltando[:meio], tentativa + 1)
+                        enviar(faltando[meio:], tentativa + 1)
+                    else:
+                        enviar(faltando, tentativa + 1)
+
+        logger.info(
+            f"[BATCH API] {len(resultados)}/{len(procedimentos)} procedimentos normalizados "
+            f"em {time.time() - inicio:.1f}s (até {max_paralelo} requisições simultâneas)"
+        )
+        return resultados
+
 
 # =============================================================================
 # SERVICO WHATSAPP
@@ -2592,9 +2958,41 @@ class WhatsApp:
             state = data.get('instance', {}).get('state', '')
             if not state:
                 state = data.get('state', '')
+            self.gravar_estado(state == 'open')
             return state == 'open', state
         return False, "Erro ao verificar conexao"
 
+    def gravar_estado(self, conectado):
+        """
+        Grava o estado da conexão em config_whatsapp (lido pelo dashboard sem chamar a API).
+
+        Usa conexão própria: conectado() é chamado no meio de rotas e tasks, e
+        um commit aqui gravaria junto as alterações ainda pela metade do chamador.
+        """
+        from sqlalchemy import update as sa_update
+        from sqlalchemy.exc import OperationalError
+        from sqlalchemy.orm.attributes import set_committed_value
+
+        if self.cfg_user.conectado == conectado:
+            return
+        valores = {'conectado': conectado, 'atualizado_em': datetime.utcnow()}
+        if conectado:
+            valores['data_conexao'] = valores['atualizado_em']
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    sa_update(ConfigWhatsApp.__table__)
+                    .where(ConfigWhatsApp.__table__.c.id == self.cfg_user.id)
+                    .values(**valores)
+                )
+        except OperationalError as e:
+            # Só um cache do estado: a próxima verificação grava de novo
+            logger.warning(f"Não foi possível gravar o estado do WhatsApp (usuário {self.cfg_user.usuario_id}): {e}")
+            return
+        # Atualiza o objeto da sessão sem marcá-lo como alterado
+        for campo, valor in valores.items():
+            set_committed_value(self.cfg_user, campo, valor)
+
     def listar_instancias(self):
         """Lista todas as instancias"""
         if not self.ok():
@@ -3171,19 +3569,6 @@ def inject_dashboard_route():
     """Disponibiliza get_dashboard_route nos templates"""
     return dict(get_dashboard_route=get_dashboard_route)
 
-def formatar_numero(num):
-    if not num:
-        return None
-    num = ''.join(filter(str.isdigit, str(num))).lstrip('0')
-    if not num:
-        return None
-    if num.startswith('55'):
-        return num if len(num) in [12, 13] else None
-    if len(num) in [10, 11]:
-        return '55' + num
-    return None
-
-
 def processar_planilha(arquivo, campanha_id):
     try:
         df = pd.read_excel(arquivo)
@@ -3215,7 +3600,10 @@ def processar_planilha(arquivo, campanha_id):
         # Agrupar por Nome e Data de Nascimento (se houver) para unificar contatos
         pessoas = {} # chave: (nome, data_nascimento_str) -> {telefones: set(), proc: str, data_nasc_obj: date}
 
-        for _, row in df.iterrows():
+        # Normalizar a coluna de telefones inteira de uma vez
+        telefones_linha = telefones_por_linha(df[col_tel])
+
+        for idx, row in df.iterrows():
             nome = str(row.get(col_nome, '')).strip()
             if not nome or nome.lower() == 'nan':
                 continue
@@ -3270,14 +3658,7 @@ def processar_planilha(arquivo, campanha_id):
                 }
 
             # Telefones
-            tels = str(row.get(col_tel, '')).strip()
-            if tels and tels.lower() != 'nan':
-                for tel in tels.replace(',', ' ').replace(';', ' ').replace('/', ' ').split():
-                    tel = tel.strip()
-                    if not tel: continue
-                    fmt = formatar_numero(tel)
-                    if fmt:
-                        pessoas[chave]['telefones'].add((tel, fmt))
+            pessoas[chave]['telefones'].update(telefones_linha.get(idx, []))
 
         # =========================================================================
         # NORMALIZAÇÃO DE PROCEDIMENTOS COM IA (DeepSeek)
@@ -3295,97 +3676,65 @@ def processar_planilha(arquivo, campanha_id):
         logger.info(f"Normalizando {len(procedimentos_unicos)} procedimentos únicos...")
 
         # Separar procedimentos que já estão no cache vs que precisam normalizar
-        procedimentos_para_normalizar = []
+        # Variações do mesmo termo (acentos, código SUS, abreviações) compartilham a chave canônica
+        # e geram uma única chamada à API
+        variacoes_por_chave = {}  # chave canônica -> [termos originais]
+        em_cache = cache_procedimentos.obter_varios(procedimentos_unicos)
         for proc_original in procedimentos_unicos:
-            cached = ProcedimentoNormalizado.obter_ou_criar(proc_original)
-            if cached and cached.aprovado:
+            cached = em_cache.get(proc_original)
+            if cached and cached['aprovado']:
                 # Usar do cache
-                mapa_normalizacao[proc_original] = cached.termo_simples
-                logger.info(f"[CACHE] '{proc_original}' -> '{cached.termo_simples}'")
-                cached.incrementar_uso()
+                mapa_normalizacao[proc_original] = cached['termo_simples']
+                logger.info(f"[CACHE] '{proc_original}' -> '{cached['termo_simples']}'")
+                cache_procedimentos.registrar_uso(proc_original)
             else:
                 # Adicionar para normalizar em batch
-                procedimentos_para_normalizar.append(proc_original)
+                variacoes_por_chave.setdefault(chave_procedimento(proc_original), []).append(proc_original)
+        procedimentos_para_normalizar = [variacoes[0] for variacoes in variacoes_por_chave.values()]
 
-        # Normalizar em BATCH (dividir em chunks de 20 procedimentos)
+        # Normalizar em BATCH (lotes concorrentes, salvando no cache à medida que chegam)
         if procedimentos_para_normalizar:
-            BATCH_SIZE = 20  # Processar 20 procedimentos por vez
-            total = len(procedimentos_para_normalizar)
-            logger.info(f"Normalizando {total} procedimentos em lotes de {BATCH_SIZE}...")
-
-            # Dividir em chunks
-            for i in range(0, total, BATCH_SIZE):
-                chunk = procedimentos_para_normalizar[i:i+BATCH_SIZE]
-                chunk_num = (i // BATCH_SIZE) + 1
-                total_chunks = (total + BATCH_SIZE - 1) // BATCH_SIZE
+            logger.info(f"Normalizando {len(procedimentos_para_normalizar)} procedimentos via API...")
 
-                logger.info(f"[LOTE {chunk_num}/{total_chunks}] Processando {len(chunk)} procedimentos...")
+            def salvar_resultado(proc_original, resultado):
+                ProcedimentoNormalizado.salvar_normalizacao(
+                    termo_original=proc_original,
+                    termo_normalizado=resultado['termo_normalizado'],
+                    termo_simples=resultado['termo_simples'],
+                    explicacao=resultado.get('explicacao', ''),
+                    fonte='deepseek'
+                )
+                for variacao in variacoes_por_chave[chave_procedimento(proc_original)]:
+                    mapa_normalizacao[variacao] = resultado['termo_simples']
+                logger.info(f"[API] '{proc_original}' -> '{resultado['termo_simples']}'")
 
-                try:
-                    resultados_batch = ai._chamar_api_batch(chunk)
-                    logger.info(f"[LOTE {chunk_num}/{total_chunks}] API retornou {len(resultados_batch)} resultados")
+            ai.normalizar_em_lote(procedimentos_para_normalizar, ao_normalizar=salvar_resultado)
 
-                    for proc_original in chunk:
-                        resultado = resultados_batch.get(proc_original.upper())
-                        if resultado and resultado.get('termo_simples'):
-                            # Salvar no cache
-                            ProcedimentoNormalizado.salvar_normalizacao(
-                                termo_original=proc_original,
-                                termo_normalizado=resultado['termo_normalizado'],
-                                termo_simples=resultado['termo_simples'],
-                                explicacao=resultado.get('explicacao', ''),
-                                fonte='deepseek'
-                            )
-                            mapa_normalizacao[proc_original] = resultado['termo_simples']
-                            logger.info(f"[API] '{proc_original}' -> '{resultado['termo_simples']}'")
-                        else:
-                            # Fallback: usar o original
-                            mapa_normalizacao[proc_original] = proc_original.title()
-                            logger.warning(f"[FALLBACK] '{proc_original}' -> usando original")
-
-                except Exception as e:
-                    logger.error(f"[LOTE {chunk_num}/{total_chunks}] Erro ao processar batch: {e}")
-                    # Em caso de erro, usar original para este chunk
-                    for proc_original in chunk:
-                        if proc_original not in mapa_normalizacao:
-                            mapa_normalizacao[proc_original] = proc_original.title()
-                            logger.warning(f"[ERRO-FALLBACK] '{proc_original}' -> usando original")
+            # Fallback: usar o original para o que a API não normalizou
+            for proc_original in (v for variacoes in variacoes_por_chave.values() for v in variacoes):
+                if proc_original not in mapa_normalizacao:
+                    mapa_normalizacao[proc_original] = proc_original.title()
+                    logger.warning(f"[FALLBACK] '{proc_original}' -> usando original")
 
         logger.info(f"Normalização concluída. {len(mapa_normalizacao)} mapeamentos criados.")
         # =========================================================================
 
-        # Salvar no Banco
-        for chave, dados in pessoas.items():
+        # Salvar no Banco em lotes (INSERT multi-linha de contatos + telefones)
+        from importacao_lote import salvar_contatos_em_lote
+
+        pessoas_com_telefone = []
+        for dados in pessoas.values():
             if not dados['telefones']:
                 continue
-
-            # Obter procedimento normalizado
             proc_original = dados['procedimento']
-            proc_normalizado = mapa_normalizacao.get(proc_original, proc_original)
-
-            c = Contato(
-                campanha_id=campanha_id,
-                nome=dados['nome'][:200],
-                data_nascimento=dados['nascimento'],
-                procedimento=proc_original[:500],  # Termo original
-                procedimento_normalizado=proc_normalizado[:300],  # Termo normalizado
-                status='pendente'
-            )
-            db.session.add(c)
-            db.session.flush() # Para ter o ID
+            pessoas_com_telefone.append(dict(
+                dados,
+                telefones=sorted(dados['telefones']),
+                procedimento_normalizado=mapa_normalizacao.get(proc_original, proc_original)
+            ))
 
-            for i, (original, fmt) in enumerate(dados['telefones']):
-                t = Telefone(
-                    contato_id=c.id,
-                    numero=original[:20],
-                    numero_fmt=fmt,
-                    prioridade=i+1
-                )
-                db.session.add(t)
-
-            criados += 1
+        criados = salvar_contatos_em_lote(campanha_id, pessoas_com_telefone)
 
-        db.session.commit()
         camp = db.session.get(Campanha, campanha_id)
         if camp:
             camp.atualizar_stats()
@@ -4875,28 +5224,11 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Filtrar apenas campanhas do usuario atual
-    camps = Campanha.query.filter_by(criador_id=current_user.id).order_by(Campanha.data_criacao.desc()).all()
-    for c in camps:
-        c.atualizar_stats()
-
-    ws = WhatsApp(current_user.id)
-    ws_ativo = ws.ok()
-    ws_conn = False
-    if ws_ativo:
-        ws_conn, _ = ws.conectado()
-
-    # Estatisticas apenas das campanhas do usuario atual
-    user_campanhas_ids = [c.id for c in camps]
-    stats = {
-        'campanhas': len(camps),
-        'contatos': Contato.query.filter(Contato.campanha_id.in_(user_campanhas_ids)).count() if user_campanhas_ids else 0,
-        'confirmados': Contato.query.filter(Contato.campanha_id.in_(user_campanhas_ids), Contato.confirmado == True).count() if user_campanhas_ids else 0,
-        'rejeitados': Contato.query.filter(Contato.campanha_id.in_(user_campanhas_ids), Contato.rejeitado == True).count() if user_campanhas_ids else 0
-    }
-
-    return render_template('dashboard.html', campanhas=camps, whatsapp_ativo=ws_ativo,
-                           whatsapp_conectado=ws_conn, mensagem_padrao=MENSAGEM_PADRAO, stats=stats)
+    # Somente leitura: contadores gravados nas campanhas e estado do WhatsApp
+    # em cache (ver dashboard_usuario.py)
+    from dashboard_usuario import dados_dashboard
+    return render_template('dashboard.html', mensagem_padrao=MENSAGEM_PADRAO,
+                           **dados_dashboard(current_user.id))
 
 
 @app.route('/campanha/criar', methods=['POST'])
@@ -5016,76 +5348,59 @@ def status_processamento(task_id):
             'percent': 0
         })
 
-    task = AsyncResult(task_id, app=celery_app)
+    from progresso_campanhas import obter_status_task
 
-    if task.state == 'PENDING':
-        response = {
-            'state': task.state,
-            'status': 'Aguardando processamento...',
-            'percent': 0
-        }
-    elif task.state == 'PROGRESS':
-        response = {
-            'state': task.state,
-            'status': task.info.get('status', ''),
-            'percent': task.info.get('percent', 0),
-            'current': task.info.get('current', 0),
-            'total': task.info.get('total', 100)
-        }
-    elif task.state == 'SUCCESS':
-        result = task.info
-        response = {
-            'state': task.state,
-            'status': 'Processamento concluído!',
-            'percent': 100,
-            'result': result
-        }
-    else:  # FAILURE ou outro estado
-        response = {
-            'state': task.state,
-            'status': str(task.info) if task.info else 'Erro desconhecido',
-            'percent': 0
-        }
+    def calcular():
+        task = AsyncResult(task_id, app=celery_app)
+
+        if task.state == 'PENDING':
+            response = {
+                'state': task.state,
+                'status': 'Aguardando processamento...',
+                'percent': 0
+            }
+        elif task.state == 'PROGRESS':
+            response = {
+                'state': task.state,
+                'status': task.info.get('status', ''),
+                'percent': task.info.get('percent', 0),
+                'current': task.info.get('current', 0),
+                'total': task.info.get('total', 100)
+            }
+        elif task.state == 'SUCCESS':
+            result = task.info
+            response = {
+                'state': task.state,
+                'status': 'Processamento concluído!',
+                'percent': 100,
+                'result': result
+            }
+        else:  # FAILURE ou outro estado
+            response = {
+                'state': task.state,
+                'status': str(task.info) if task.info else 'Erro desconhecido',
+                'percent': 0
+            }
 
-    return jsonify(response)
+        return response
+
+    return app.response_class(obter_status_task(task_id, calcular), mimetype='application/json')
 
 
 @app.route('/campanha/<int:id>')
 @login_required
 def campanha_detalhe(id):
+    from busca_contatos import pagina_contatos
     camp = verificar_acesso_campanha(id)
-    camp.atualizar_stats()
 
     filtro = request.args.get('filtro', 'todos')
     busca = request.args.get('busca', '').strip()
-    page = request.args.get('page', 1, type=int)
-
-    q = camp.contatos
-
-    if filtro == 'validos':
-        q = q.join(Telefone).filter(Telefone.whatsapp_valido == True).distinct()
-    elif filtro == 'invalidos':
-        # Contatos onde TODOS os telefones sao invalidos ou nao tem telefone
-        # Dificil fazer em uma query simples, vamos filtrar por status se possivel
-        # Ou usar status 'sem_whatsapp'
-        q = q.filter(Contato.status == 'sem_whatsapp')
-    elif filtro == 'confirmados':
-        q = q.filter_by(confirmado=True)
-    elif filtro == 'rejeitados':
-        q = q.filter_by(rejeitado=True)
-    elif filtro == 'pendentes':
-        q = q.filter(Contato.status.in_(['pendente', 'pronto_envio']))
-    elif filtro == 'aguardando':
-        q = q.filter(Contato.status == 'enviado', Contato.confirmado == False, Contato.rejeitado == False)
-    elif filtro == 'erros':
-        q = q.filter(Contato.erro.isnot(None))
-    elif filtro == 'nao_validados':
-        q = q.join(Telefone).filter(Telefone.whatsapp_valido == None).distinct()
-
-    if busca:
-        q = q.join(Telefone).filter((Contato.nome.ilike(f'%{busca}%')) | (Telefone.numero.ilike(f'%{busca}%'))).distinct()
 
-    contatos = q.order_by(Contato.id).paginate(page=page, per_page=50)
+    contatos = pagina_contatos(
+        camp, filtro=filtro, busca=busca,
+        apos=request.args.get('apos', type=int),
+        antes=request.args.get('antes', type=int)
+    )
 
     return render_template('campanha.html', campanha=camp, contatos=contatos, filtro=filtro, busca=busca)
 
@@ -5147,6 +5462,8 @@ def pausar_campanha(id):
     camp.status = 'pausada'
     camp.status_msg = 'Pausada'
     db.session.commit()
+    from progresso_campanhas import invalidar_progresso
+    invalidar_progresso('fila', camp.id)
     return jsonify({'sucesso': True})
 
 
@@ -5177,6 +5494,8 @@ def cancelar_campanha(id):
     camp.status = 'cancelada'
     camp.status_msg = 'Cancelada'
     db.session.commit()
+    from progresso_campanhas import invalidar_progresso
+    invalidar_progresso('fila', camp.id)
     return jsonify({'sucesso': True})
 
 
@@ -5245,28 +5564,45 @@ def exportar_campanha(id):
 @app.route('/api/campanha/<int:id>/status')
 @login_required
 def api_status(id):
+    # Snapshot compartilhado entre as abas, com ETag/304 (ver progresso_campanhas.py)
+    from progresso_campanhas import resposta_progresso
     camp = verificar_acesso_campanha(id)
-    camp.atualizar_stats()
-    return jsonify({
-        'status': camp.status,
-        'status_msg': camp.status_msg,
-        'total_contatos': camp.total_contatos,
-        'total_validos': camp.total_validos,
-        'total_invalidos': camp.total_invalidos,
-        'total_enviados': camp.total_enviados,
-        'total_confirmados': camp.total_confirmados,
-        'total_rejeitados': camp.total_rejeitados,
-        'total_erros': camp.total_erros,
-        'pct_validacao': camp.pct_validacao(),
-        'pct_envio': camp.pct_envio(),
-        'pct_confirmacao': camp.pct_confirmacao(),
-        'percentual_validacao': camp.percentual_validacao(),
-        'percentual_envio': camp.percentual_envio(),
-        'percentual_confirmacao': camp.percentual_confirmacao(),
-        'percentual_conclusao': camp.percentual_conclusao(),
-        'pendentes_validar': camp.pendentes_validar(),
-        'pendentes_enviar': camp.pendentes_enviar()
-    })
+    return resposta_progresso('fila', camp.id)
+
+
+@app.route('/api/progresso/<tipo>/<int:id>/eventos')
+@login_required
+def progresso_eventos(tipo, id):
+    """Server-Sent Events com o progresso da campanha, publicado pelos workers de envio"""
+    from flask import abort, Response, stream_with_context
+    from progresso_campanhas import TIPOS_PROGRESSO, stream_progresso, reservar_stream, liberar_stream
+
+    if tipo not in TIPOS_PROGRESSO:
+        abort(404)
+    if tipo == 'fila':
+        verificar_acesso_campanha(id)
+    else:
+        if tipo == 'scih':
+            from scih_routes import _exige_scih
+            if not _exige_scih():
+                abort(403)
+        modelo = CampanhaConsulta if tipo == 'consulta' else CampanhaSCIH
+        camp = modelo.query.get_or_404(id)
+        if camp.criador_id != current_user.id and not current_user.is_admin:
+            abort(403)
+
+    if not reservar_stream():
+        # Vagas de stream do processo ocupadas: o EventSource fecha com o 503
+        # e a página passa a usar o polling
+        return Response('Limite de streams de progresso atingido', status=503, mimetype='text/plain')
+
+    resposta = Response(
+        stream_with_context(stream_progresso(tipo, id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    resposta.call_on_close(liberar_stream)
+    return resposta
 
 
 @app.route('/api/contato/<int:id>/confirmar', methods=['POST'])
@@ -5648,536 +5984,21 @@ def configuracoes_global():
 @login_required
 @admin_required
 def admin_dashboard():
-    """Dashboard administrativo com métricas globais do sistema"""
-    from sqlalchemy import func, case
-
-    # Parâmetro de modo selecionado
-    modo_selecionado = request.args.get('modo', 'todos')  # 'consulta', 'fila' ou 'todos'
-
-    # =====================================================================
-    # ESTATÍSTICAS DE USUÁRIOS (filtradas por modo)
-    # =====================================================================
-    if modo_selecionado == 'consulta':
-        total_usuarios = Usuario.query.filter_by(tipo_sistema='AGENDAMENTO_CONSULTA').count()
-        usuarios_ativos = Usuario.query.filter_by(ativo=True, tipo_sistema='AGENDAMENTO_CONSULTA').count()
-    elif modo_selecionado == 'fila':
-        total_usuarios = Usuario.query.filter_by(tipo_sistema='BUSCA_ATIVA').count()
-        usuarios_ativos = Usuario.query.filter_by(ativo=True, tipo_sistema='BUSCA_ATIVA').count()
-    elif modo_selecionado == 'scih':
-        total_usuarios = Usuario.query.filter_by(tipo_sistema='PESQUISA_SCIH').count()
-        usuarios_ativos = Usuario.query.filter_by(ativo=True, tipo_sistema='PESQUISA_SCIH').count()
-    else:
-        total_usuarios = Usuario.query.count()
-        usuarios_ativos = Usuario.query.filter_by(ativo=True).count()
-
-    usuarios_admin = Usuario.query.filter_by(is_admin=True).count()
-
-    # Usuários por tipo de sistema
-    usuarios_fila = Usuario.query.filter_by(tipo_sistema='BUSCA_ATIVA').count()
-    usuarios_consulta = Usuario.query.filter_by(tipo_sistema='AGENDAMENTO_CONSULTA').count()
-
-    # =====================================================================
-    # ESTATÍSTICAS DO MODO FILA (BUSCA_ATIVA)
-    # =====================================================================
-    total_campanhas_fila = Campanha.query.count()
-    campanhas_fila_ativas = Campanha.query.filter(Campanha.status.in_(['validando', 'pronta', 'enviando'])).count()
-
-    # Totais agregados de todas as campanhas de fila
-    stats_fila = db.session.query(
-        func.coalesce(func.sum(Campanha.total_contatos), 0).label('total_contatos'),
-        func.coalesce(func.sum(Campanha.total_enviados), 0).label('total_enviados'),
-        func.coalesce(func.sum(Campanha.total_confirmados), 0).label('total_confirmados'),
-        func.coalesce(func.sum(Campanha.total_rejeitados), 0).label('total_rejeitados'),
-        func.coalesce(func.sum(Campanha.total_erros), 0).label('total_erros')
-    ).first()
-
-    fila_total_contatos = stats_fila.total_contatos or 0
-    fila_total_enviados = stats_fila.total_enviados or 0
-    fila_total_confirmados = stats_fila.total_confirmados or 0
-    fila_total_rejeitados = stats_fila.total_rejeitados or 0
-    fila_total_erros = stats_fila.total_erros or 0
-
-    # Taxa de confirmação da fila
-    fila_taxa_confirmacao = round((fila_total_confirmados / fila_total_enviados * 100), 1) if fila_total_enviados > 0 else 0
-
-    # =====================================================================
-    # ESTATÍSTICAS DO MODO CONSULTA (AGENDAMENTO_CONSULTA)
-    # =====================================================================
-    total_campanhas_consulta = CampanhaConsulta.query.count()
-    campanhas_consulta_ativas = CampanhaConsulta.query.filter(CampanhaConsulta.status.in_(['pronta', 'enviando'])).count()
-
-    # Totais agregados de todas as campanhas de consulta
-    stats_consulta = db.session.query(
-        func.coalesce(func.sum(CampanhaConsulta.total_consultas), 0).label('total_consultas'),
-        func.coalesce(func.sum(CampanhaConsulta.total_enviados), 0).label('total_enviados'),
-        func.coalesce(func.sum(CampanhaConsulta.total_confirmados), 0).label('total_confirmados'),
-        func.coalesce(func.sum(CampanhaConsulta.total_rejeitados), 0).label('total_rejeitados')
-    ).first()
-
-    consulta_total = stats_consulta.total_consultas or 0
-    consulta_enviados = stats_consulta.total_enviados or 0
-    consulta_confirmados = stats_consulta.total_confirmados or 0
-    consulta_rejeitados = stats_consulta.total_rejeitados or 0
-
-    # Taxa de confirmação de consultas
-    consulta_taxa_confirmacao = round((consulta_confirmados / consulta_enviados * 100), 1) if consulta_enviados > 0 else 0
-
-    # =====================================================================
-    # ESTATÍSTICAS DO MODO SCIH (PESQUISA_SCIH)
-    # =====================================================================
-    total_campanhas_scih = CampanhaSCIH.query.count()
-    campanhas_scih_ativas = CampanhaSCIH.query.filter(
-        CampanhaSCIH.status.in_(['enviando', 'pausado'])
-    ).count()
-    usuarios_scih = Usuario.query.filter_by(tipo_sistema='PESQUISA_SCIH').count()
-
-    scih_total_pacientes = db.session.query(
-        func.coalesce(func.count(PacienteSCIH.id), 0)
-    ).scalar() or 0
-    scih_total_enviados = PacienteSCIH.query.filter(
-        PacienteSCIH.status.in_(['ENVIADO', 'RESPONDIDO', 'SEM_RESPOSTA'])
-    ).count()
-    scih_total_respondidos = PacienteSCIH.query.filter_by(status='RESPONDIDO').count()
-    scih_total_sem_resposta = PacienteSCIH.query.filter_by(status='SEM_RESPOSTA').count()
-    scih_total_erros = PacienteSCIH.query.filter_by(status='ERRO').count()
-    scih_taxa_resposta = round(
-        (scih_total_respondidos / scih_total_enviados * 100), 1
-    ) if scih_total_enviados > 0 else 0
-
-    # Indicadores das respostas SCIH (agregado de todas as campanhas)
-    scih_com_sintoma = RespostaSCIH.query.filter_by(apresentou_sintoma=True).count()
-    scih_buscou_atendimento = RespostaSCIH.query.filter_by(buscou_atendimento=True).count()
-    scih_usou_remedio = RespostaSCIH.query.filter_by(usou_remedio=True).count()
-
-    # =====================================================================
-    # ESTATÍSTICAS DETALHADAS - AGENDAMENTO DE CONSULTAS
-    # =====================================================================
-    # Disparos de MSG 1 (agendamentos enviados)
-    total_disparos_msg1 = AgendamentoConsulta.query.filter_by(mensagem_enviada=True).count()
-
-    # Comprovantes enviados (status CONFIRMADO = comprovante foi enviado)
-    total_comprovantes_enviados = AgendamentoConsulta.query.filter_by(status='CONFIRMADO').count()
-
-    # Aguardando comprovante
-    total_aguardando_comprovante = AgendamentoConsulta.query.filter_by(status='AGUARDANDO_COMPROVANTE').count()
-
-    # Cancelados (sem resposta)
-    total_cancelados = AgendamentoConsulta.query.filter_by(status='CANCELADO').count()
-
-    # =====================================================================
-    # DESEMPENHO POR USUÁRIO (MODO CONSULTA)
-    # =====================================================================
-    # Filtrar por modo se necessário
-    desempenho_query = db.session.query(
-        Usuario.id,
-        Usuario.nome,
-        Usuario.tipo_sistema,
-        # MSG 1 enviadas (disparos)
-        func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).label('disparos_msg1'),
-        # Comprovantes enviados
-        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('comprovantes_enviados'),
-        # Aguardando comprovante
-        func.sum(case((AgendamentoConsulta.status == 'AGUARDANDO_COMPROVANTE', 1), else_=0)).label('aguardando_comprovante'),
-        # Rejeitados
-        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados'),
-        # Cancelados
-        func.sum(case((AgendamentoConsulta.status == 'CANCELADO', 1), else_=0)).label('cancelados'),
-        # Total de agendamentos
-        func.count(AgendamentoConsulta.id).label('total_agendamentos')
-    ).join(CampanhaConsulta, CampanhaConsulta.criador_id == Usuario.id
-    ).join(AgendamentoConsulta, AgendamentoConsulta.campanha_id == CampanhaConsulta.id
-    )
-
-    # Aplicar filtro de modo
-    if modo_selecionado == 'consulta':
-        desempenho_query = desempenho_query.filter(Usuario.tipo_sistema == 'AGENDAMENTO_CONSULTA')
-    elif modo_selecionado == 'fila':
-        desempenho_query = desempenho_query.filter(Usuario.tipo_sistema == 'BUSCA_ATIVA')
-
-    desempenho_usuarios = desempenho_query.group_by(Usuario.id, Usuario.nome, Usuario.tipo_sistema
-    ).having(func.count(AgendamentoConsulta.id) > 0
-    ).order_by(func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).desc()
-    ).all()
-
-    # =====================================================================
-    # MENSAGENS POR USUÁRIO
-    # =====================================================================
-    # Modo Consulta - mensagens enviadas por usuário (via criador da campanha)
-    msgs_por_usuario_consulta = db.session.query(
-        Usuario.nome,
-        Usuario.id.label('usuario_id'),
-        func.count(LogMsgConsulta.id).label('total_msgs'),
-        func.sum(case((LogMsgConsulta.direcao == 'enviada', 1), else_=0)).label('enviadas'),
-        func.sum(case((LogMsgConsulta.direcao == 'recebida', 1), else_=0)).label('recebidas')
-    ).join(CampanhaConsulta, CampanhaConsulta.id == LogMsgConsulta.campanha_id
-    ).join(Usuario, Usuario.id == CampanhaConsulta.criador_id
-    ).group_by(Usuario.id, Usuario.nome
-    ).order_by(func.count(LogMsgConsulta.id).desc()
-    ).limit(15).all()
-
-    # Modo Fila - mensagens enviadas por usuário
-    msgs_por_usuario_fila = db.session.query(
-        Usuario.nome,
-        Usuario.id.label('usuario_id'),
-        func.count(LogMsg.id).label('total_msgs'),
-        func.sum(case((LogMsg.direcao == 'enviada', 1), else_=0)).label('enviadas'),
-        func.sum(case((LogMsg.direcao == 'recebida', 1), else_=0)).label('recebidas')
-    ).join(Campanha, Campanha.id == LogMsg.campanha_id
-    ).join(Usuario, Usuario.id == Campanha.criador_id
-    ).group_by(Usuario.id, Usuario.nome
-    ).order_by(func.count(LogMsg.id).desc()
-    ).limit(15).all()
-
-    # =====================================================================
-    # TAXA DE CONFIRMAÇÃO POR USUÁRIO (MODO CONSULTA)
-    # =====================================================================
-    confirmacao_por_usuario = db.session.query(
-        Usuario.nome,
-        func.count(AgendamentoConsulta.id).label('total'),
-        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('confirmados'),
-        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados'),
-        func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).label('enviados')
-    ).join(CampanhaConsulta, CampanhaConsulta.id == AgendamentoConsulta.campanha_id
-    ).join(Usuario, Usuario.id == CampanhaConsulta.criador_id
-    ).group_by(Usuario.id, Usuario.nome
-    ).having(func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)) > 0
-    ).order_by(func.count(AgendamentoConsulta.id).desc()
-    ).limit(15).all()
-
-    # =====================================================================
-    # PESQUISAS DE SATISFAÇÃO
-    # =====================================================================
-    # Total de pesquisas
-    total_pesquisas = PesquisaSatisfacao.query.count()
-    pesquisas_respondidas = PesquisaSatisfacao.query.filter(PesquisaSatisfacao.nota_satisfacao.isnot(None)).count()
-    pesquisas_puladas = PesquisaSatisfacao.query.filter_by(pulou=True).count()
-
-    # Média de nota
-    media_nota = db.session.query(func.avg(PesquisaSatisfacao.nota_satisfacao)).filter(
-        PesquisaSatisfacao.nota_satisfacao.isnot(None)
-    ).scalar() or 0
-    media_nota = round(media_nota, 1)
-
-    # Porcentagem de equipe atenciosa
-    total_com_resposta_atenciosa = PesquisaSatisfacao.query.filter(PesquisaSatisfacao.equipe_atenciosa.isnot(None)).count()
-    equipe_atenciosa_sim = PesquisaSatisfacao.query.filter_by(equipe_atenciosa=True).count()
-    pct_atenciosa = round((equipe_atenciosa_sim / total_com_resposta_atenciosa * 100), 1) if total_com_resposta_atenciosa > 0 else 0
-
-    # Distribuição de notas para gráfico
-    distribuicao_notas = db.session.query(
-        PesquisaSatisfacao.nota_satisfacao,
-        func.count(PesquisaSatisfacao.id)
-    ).filter(PesquisaSatisfacao.nota_satisfacao.isnot(None)
-    ).group_by(PesquisaSatisfacao.nota_satisfacao
-    ).order_by(PesquisaSatisfacao.nota_satisfacao
-    ).all()
-
-    notas_labels = [str(n[0]) for n in distribuicao_notas]
-    notas_data = [n[1] for n in distribuicao_notas]
-
-    # Comentários recentes
-    comentarios_recentes = db.session.query(
-        PesquisaSatisfacao,
-        AgendamentoConsulta.paciente
-    ).join(AgendamentoConsulta, AgendamentoConsulta.id == PesquisaSatisfacao.consulta_id
-    ).filter(
-        PesquisaSatisfacao.comentario.isnot(None),
-        PesquisaSatisfacao.comentario != ''
-    ).order_by(PesquisaSatisfacao.data_resposta.desc()
-    ).limit(20).all()
-
-    # =====================================================================
-    # DADOS PARA GRÁFICOS - EVOLUÇÃO DIÁRIA (últimos 30 dias)
-    # =====================================================================
-    from datetime import timedelta
-    data_inicio = datetime.utcnow() - timedelta(days=30)
-
-    # MSG 1 (Disparos de agendamento) por dia
-    msg1_por_dia = db.session.query(
-        func.date(AgendamentoConsulta.data_envio_mensagem).label('dia'),
-        func.count(AgendamentoConsulta.id).label('total')
-    ).filter(
-        AgendamentoConsulta.data_envio_mensagem >= data_inicio,
-        AgendamentoConsulta.mensagem_enviada == True
-    ).group_by(func.date(AgendamentoConsulta.data_envio_mensagem)
-    ).order_by(func.date(AgendamentoConsulta.data_envio_mensagem)
-    ).all()
-
-    # Comprovantes enviados por dia (status CONFIRMADO)
-    comprovantes_por_dia = db.session.query(
-        func.date(AgendamentoConsulta.data_confirmacao).label('dia'),
-        func.count(AgendamentoConsulta.id).label('total')
-    ).filter(
-        AgendamentoConsulta.data_confirmacao >= data_inicio,
-        AgendamentoConsulta.status == 'CONFIRMADO'
-    ).group_by(func.date(AgendamentoConsulta.data_confirmacao)
-    ).order_by(func.date(AgendamentoConsulta.data_confirmacao)
-    ).all()
-
-    # Rejeitados por dia
-    rejeitados_por_dia = db.session.query(
-        func.date(AgendamentoConsulta.data_confirmacao).label('dia'),
-        func.count(AgendamentoConsulta.id).label('total')
-    ).filter(
-        AgendamentoConsulta.data_confirmacao >= data_inicio,
-        AgendamentoConsulta.status == 'REJEITADO'
-    ).group_by(func.date(AgendamentoConsulta.data_confirmacao)
-    ).order_by(func.date(AgendamentoConsulta.data_confirmacao)
-    ).all()
-
-    # Preparar dados para Chart.js
-    dias_labels = [(data_inicio + timedelta(days=i)).strftime('%d/%m') for i in range(31)]
-
-    # Mapear dados
-    msg1_dict = {str(m.dia): m.total for m in msg1_por_dia}
-    comprovantes_dict = {str(c.dia): c.total for c in comprovantes_por_dia}
-    rejeitados_dict = {str(r.dia): r.total for r in rejeitados_por_dia}
-
-    msg1_data = []
-    comprovantes_data = []
-    rejeitados_data = []
-
-    for i in range(31):
-        dia = (data_inicio + timedelta(days=i)).strftime('%Y-%m-%d')
-        msg1_data.append(msg1_dict.get(dia, 0))
-        comprovantes_data.append(comprovantes_dict.get(dia, 0))
-        rejeitados_data.append(rejeitados_dict.get(dia, 0))
-
-    # =====================================================================
-    # DADOS PARA GRÁFICOS - MODO FILA (últimos 30 dias)
-    # =====================================================================
-    fila_enviados_por_dia = db.session.query(
-        func.date(LogMsg.data).label('dia'),
-        func.count(LogMsg.id).label('total')
-    ).filter(
-        LogMsg.data >= data_inicio,
-        LogMsg.direcao == 'enviada'
-    ).group_by(func.date(LogMsg.data)
-    ).order_by(func.date(LogMsg.data)
-    ).all()
-
-    fila_confirmados_por_dia = db.session.query(
-        func.date(Contato.data_resposta).label('dia'),
-        func.count(Contato.id).label('total')
-    ).filter(
-        Contato.data_resposta >= data_inicio,
-        Contato.confirmado == True
-    ).group_by(func.date(Contato.data_resposta)
-    ).order_by(func.date(Contato.data_resposta)
-    ).all()
-
-    fila_rejeitados_por_dia = db.session.query(
-        func.date(Contato.data_resposta).label('dia'),
-        func.count(Contato.id).label('total')
-    ).filter(
-        Contato.data_resposta >= data_inicio,
-        Contato.rejeitado == True
-    ).group_by(func.date(Contato.data_resposta)
-    ).order_by(func.date(Contato.data_resposta)
-    ).all()
-
-    fila_dias_labels = [(data_inicio + timedelta(days=i)).strftime('%d/%m') for i in range(31)]
-
-    fila_env_dict = {str(r.dia): r.total for r in fila_enviados_por_dia}
-    fila_conf_dict = {str(r.dia): r.total for r in fila_confirmados_por_dia}
-    fila_rej_dict = {str(r.dia): r.total for r in fila_rejeitados_por_dia}
-
-    fila_enviados_data = []
-    fila_confirmados_data = []
-    fila_rejeitados_data = []
-    for i in range(31):
-        dia = (data_inicio + timedelta(days=i)).strftime('%Y-%m-%d')
-        fila_enviados_data.append(fila_env_dict.get(dia, 0))
-        fila_confirmados_data.append(fila_conf_dict.get(dia, 0))
-        fila_rejeitados_data.append(fila_rej_dict.get(dia, 0))
-
-    # Distribuição de status atual (Fila)
-    fila_status_counts = db.session.query(
-        Contato.status,
-        func.count(Contato.id).label('total')
-    ).group_by(Contato.status).all()
-    fila_status_labels = [r.status or 'pendente' for r in fila_status_counts]
-    fila_status_data = [r.total for r in fila_status_counts]
-
-    # =====================================================================
-    # ESPECIALIDADES MAIS FREQUENTES
-    # =====================================================================
-    especialidades_top = db.session.query(
-        AgendamentoConsulta.especialidade,
-        func.count(AgendamentoConsulta.id).label('total'),
-        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('confirmados'),
-        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados')
-    ).filter(AgendamentoConsulta.especialidade.isnot(None)
-    ).group_by(AgendamentoConsulta.especialidade
-    ).order_by(func.count(AgendamentoConsulta.id).desc()
-    ).limit(10).all()
-
-    # =====================================================================
-    # NOTAS MÉDIAS POR ESPECIALIDADE (Pesquisa de Satisfação)
-    # =====================================================================
-    notas_por_especialidade = db.session.query(
-        PesquisaSatisfacao.especialidade,
-        func.avg(PesquisaSatisfacao.nota_satisfacao).label('media_nota'),
-        func.count(PesquisaSatisfacao.id).label('total_respostas'),
-        func.sum(case((PesquisaSatisfacao.equipe_atenciosa == True, 1), else_=0)).label('atenciosa_sim'),
-        func.count(case((PesquisaSatisfacao.equipe_atenciosa.isnot(None), 1))).label('total_atenciosa')
-    ).filter(
-        PesquisaSatisfacao.especialidade.isnot(None),
-        PesquisaSatisfacao.nota_satisfacao.isnot(None)
-    ).group_by(PesquisaSatisfacao.especialidade
-    ).order_by(func.count(PesquisaSatisfacao.id).desc()
-    ).limit(20).all()
-
-    # =====================================================================
-    # ESTATÍSTICAS DETALHADAS POR USUÁRIO
-    # =====================================================================
-    # Performance por usuário com mais detalhes
-    stats_query = db.session.query(
-        Usuario.id,
-        Usuario.nome,
-        Usuario.tipo_sistema,
-        # Campanhas criadas
-        func.count(func.distinct(CampanhaConsulta.id)).label('campanhas_criadas'),
-        # Agendamentos
-        func.count(AgendamentoConsulta.id).label('total_agendamentos'),
-        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('confirmados'),
-        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados'),
-        func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).label('enviados'),
-        # Pesquisas de satisfação
-        func.count(PesquisaSatisfacao.id).label('total_pesquisas'),
-        func.avg(PesquisaSatisfacao.nota_satisfacao).label('media_nota_usuario')
-    ).outerjoin(CampanhaConsulta, CampanhaConsulta.criador_id == Usuario.id
-    ).outerjoin(AgendamentoConsulta, AgendamentoConsulta.campanha_id == CampanhaConsulta.id
-    ).outerjoin(PesquisaSatisfacao, PesquisaSatisfacao.consulta_id == AgendamentoConsulta.id
-    )
-
-    # Aplicar filtro de modo
-    if modo_selecionado == 'consulta':
-        stats_query = stats_query.filter(Usuario.tipo_sistema == 'AGENDAMENTO_CONSULTA')
-    elif modo_selecionado == 'fila':
-        stats_query = stats_query.filter(Usuario.tipo_sistema == 'BUSCA_ATIVA')
-
-    stats_detalhadas_usuario = stats_query.group_by(Usuario.id, Usuario.nome, Usuario.tipo_sistema
-    ).having(func.count(AgendamentoConsulta.id) > 0
-    ).order_by(func.count(AgendamentoConsulta.id).desc()
-    ).limit(20).all()
-
-    # Total de comentários disponíveis
-    total_comentarios = db.session.query(func.count(PesquisaSatisfacao.id)).filter(
-        PesquisaSatisfacao.comentario.isnot(None),
-        PesquisaSatisfacao.comentario != ''
-    ).scalar() or 0
-
-    # =====================================================================
-    # TOTAIS GERAIS DO SISTEMA
-    # =====================================================================
-    total_msgs_consulta = LogMsgConsulta.query.count()
-    total_msgs_fila = LogMsg.query.count()
-    total_msgs_sistema = total_msgs_consulta + total_msgs_fila
-
-    total_campanhas = total_campanhas_fila + total_campanhas_consulta
-    total_enviados = fila_total_enviados + consulta_enviados
-    total_confirmados = fila_total_confirmados + consulta_confirmados
-
-    taxa_confirmacao_geral = round((total_confirmados / total_enviados * 100), 1) if total_enviados > 0 else 0
-
-    return render_template('admin_dashboard.html',
-        # Modo selecionado
-        modo_selecionado=modo_selecionado,
-
-        # Usuários
-        total_usuarios=total_usuarios,
-        usuarios_ativos=usuarios_ativos,
-        usuarios_admin=usuarios_admin,
-        usuarios_fila=usuarios_fila,
-        usuarios_consulta=usuarios_consulta,
-
-        # Modo Fila
-        total_campanhas_fila=total_campanhas_fila,
-        campanhas_fila_ativas=campanhas_fila_ativas,
-        fila_total_contatos=fila_total_contatos,
-        fila_total_enviados=fila_total_enviados,
-        fila_total_confirmados=fila_total_confirmados,
-        fila_total_rejeitados=fila_total_rejeitados,
-        fila_total_erros=fila_total_erros,
-        fila_taxa_confirmacao=fila_taxa_confirmacao,
-
-        # Modo Consulta
-        total_campanhas_consulta=total_campanhas_consulta,
-        campanhas_consulta_ativas=campanhas_consulta_ativas,
-        consulta_total=consulta_total,
-        consulta_enviados=consulta_enviados,
-        consulta_confirmados=consulta_confirmados,
-        consulta_rejeitados=consulta_rejeitados,
-        consulta_taxa_confirmacao=consulta_taxa_confirmacao,
-
-        # Modo SCIH
-        usuarios_scih=usuarios_scih,
-        total_campanhas_scih=total_campanhas_scih,
-        campanhas_scih_ativas=campanhas_scih_ativas,
-        scih_total_pacientes=scih_total_pacientes,
-        scih_total_enviados=scih_total_enviados,
-        scih_total_respondidos=scih_total_respondidos,
-        scih_total_sem_resposta=scih_total_sem_resposta,
-        scih_total_erros=scih_total_erros,
-        scih_taxa_resposta=scih_taxa_resposta,
-        scih_com_sintoma=scih_com_sintoma,
-        scih_buscou_atendimento=scih_buscou_atendimento,
-        scih_usou_remedio=scih_usou_remedio,
-
-        # Estatísticas detalhadas de agendamento
-        total_disparos_msg1=total_disparos_msg1,
-        total_comprovantes_enviados=total_comprovantes_enviados,
-        total_aguardando_comprovante=total_aguardando_comprovante,
-        total_cancelados=total_cancelados,
-        desempenho_usuarios=desempenho_usuarios,
-
-        # Mensagens por usuário
-        msgs_por_usuario_consulta=msgs_por_usuario_consulta,
-        msgs_por_usuario_fila=msgs_por_usuario_fila,
-        confirmacao_por_usuario=confirmacao_por_usuario,
-        stats_detalhadas_usuario=stats_detalhadas_usuario,
-
-        # Pesquisas de satisfação
-        total_pesquisas=total_pesquisas,
-        pesquisas_respondidas=pesquisas_respondidas,
-        pesquisas_puladas=pesquisas_puladas,
-        media_nota=media_nota,
-        pct_atenciosa=pct_atenciosa,
-        notas_labels=notas_labels,
-        notas_data=notas_data,
-        comentarios_recentes=comentarios_recentes,
-        total_comentarios=total_comentarios,
-
-        # Dados para gráficos - Modo Consulta
-        dias_labels=dias_labels,
-        msg1_data=msg1_data,
-        comprovantes_data=comprovantes_data,
-        rejeitados_data=rejeitados_data,
+    """
+    Dashboard administrativo com métricas globais do sistema.
 
-        # Dados para gráficos - Modo Fila
-        fila_dias_labels=fila_dias_labels,
-        fila_enviados_data=fila_enviados_data,
-        fila_confirmados_data=fila_confirmados_data,
-        fila_rejeitados_data=fila_rejeitados_data,
-        fila_status_labels=fila_status_labels,
-        fila_status_data=fila_status_data,
+    Lê o snapshot pré-calculado do modo (tasks.atualizar_snapshots_dashboard);
+    ?atualizar=1 recalcula na hora.
+    """
+    from dashboard_admin import obter_dashboard
 
-        # Especialidades
-        especialidades_top=especialidades_top,
-        notas_por_especialidade=notas_por_especialidade,
+    # Parâmetro de modo selecionado
+    modo_selecionado = request.args.get('modo', 'todos')  # 'consulta', 'fila', 'scih' ou 'todos'
 
-        # Totais gerais
-        total_msgs_sistema=total_msgs_sistema,
-        total_campanhas=total_campanhas,
-        total_enviados=total_enviados,
-        total_confirmados=total_confirmados,
-        taxa_confirmacao_geral=taxa_confirmacao_geral,
+    dados, gerado_em = obter_dashboard(modo_selecionado, forcar=request.args.get('atualizar') == '1')
+    dashboard_gerado_em = pytz.utc.localize(gerado_em).astimezone(TZ_FORTALEZA).strftime('%d/%m/%Y %H:%M')
 
-        # Lista de usuários para exportação
-        usuarios_export=Usuario.query.filter_by(tipo_sistema='AGENDAMENTO_CONSULTA').order_by(Usuario.nome).all(),
-        usuarios_fila_export=Usuario.query.filter_by(tipo_sistema='BUSCA_ATIVA').order_by(Usuario.nome).all()
-    )
+    return render_template('admin_dashboard.html', dashboard_gerado_em=dashboard_gerado_em, **dados)
 
 
 @app.route('/admin/exportar', methods=['GET', 'POST'])
@@ -6585,7 +6406,6 @@ def admin_exportar_fila():
 def admin_usuario_detalhes(usuario_id):
     """Página de detalhes completos de um usuário específico"""
     from sqlalchemy import func, case
-    from datetime import timedelta
 
     usuario = Usuario.query.get_or_404(usuario_id)
 
@@ -6624,59 +6444,13 @@ def admin_usuario_detalhes(usuario_id):
         # =====================================================================
         # ATIVIDADE DOS ÚLTIMOS 30 DIAS
         # =====================================================================
-        data_inicio = datetime.utcnow() - timedelta(days=30)
-
-        # MSG 1 enviadas por dia
-        msg1_por_dia = db.session.query(
-            func.date(AgendamentoConsulta.data_envio_mensagem).label('dia'),
-            func.count(AgendamentoConsulta.id).label('total')
-        ).filter(
-            AgendamentoConsulta.campanha_id.in_(campanha_ids),
-            AgendamentoConsulta.data_envio_mensagem >= data_inicio,
-            AgendamentoConsulta.mensagem_enviada == True
-        ).group_by(func.date(AgendamentoConsulta.data_envio_mensagem)
-        ).order_by(func.date(AgendamentoConsulta.data_envio_mensagem)
-        ).all()
-
-        # Comprovantes enviados por dia
-        comprovantes_por_dia = db.session.query(
-            func.date(AgendamentoConsulta.data_confirmacao).label('dia'),
-            func.count(AgendamentoConsulta.id).label('total')
-        ).filter(
-            AgendamentoConsulta.campanha_id.in_(campanha_ids),
-            AgendamentoConsulta.data_confirmacao >= data_inicio,
-            AgendamentoConsulta.status == 'CONFIRMADO'
-        ).group_by(func.date(AgendamentoConsulta.data_confirmacao)
-        ).order_by(func.date(AgendamentoConsulta.data_confirmacao)
-        ).all()
-
-        # Rejeitados por dia
-        rejeitados_por_dia = db.session.query(
-            func.date(AgendamentoConsulta.data_confirmacao).label('dia'),
-            func.count(AgendamentoConsulta.id).label('total')
-        ).filter(
-            AgendamentoConsulta.campanha_id.in_(campanha_ids),
-            AgendamentoConsulta.data_confirmacao >= data_inicio,
-            AgendamentoConsulta.status == 'REJEITADO'
-        ).group_by(func.date(AgendamentoConsulta.data_confirmacao)
-        ).order_by(func.date(AgendamentoConsulta.data_confirmacao)
-        ).all()
-
-        # Preparar dados para Chart.js
-        dias_labels = [(data_inicio + timedelta(days=i)).strftime('%d/%m') for i in range(31)]
-        msg1_dict = {str(m.dia): m.total for m in msg1_por_dia}
-        comprovantes_dict = {str(c.dia): c.total for c in comprovantes_por_dia}
-        rejeitados_dict = {str(r.dia): r.total for r in rejeitados_por_dia}
-
-        msg1_data = []
-        comprovantes_data = []
-        rejeitados_data = []
-
-        for i in range(31):
-            dia = (data_inicio + timedelta(days=i)).strftime('%Y-%m-%d')
-            msg1_data.append(msg1_dict.get(dia, 0))
-            comprovantes_data.append(comprovantes_dict.get(dia, 0))
-            rejeitados_data.append(rejeitados_dict.get(dia, 0))
+        from metricas_diarias import series_diarias
+        dias_labels, series = series_diarias(
+            'consulta', ('msg1_enviadas', 'comprovantes_enviados', 'rejeitados'), usuario_id=usuario_id
+        )
+        msg1_data = series['msg1_enviadas']
+        comprovantes_data = series['comprovantes_enviados']
+        rejeitados_data = series['rejeitados']
 
         # =====================================================================
         # ATIVIDADE POR HORA DO DIA (padrão de trabalho)
@@ -7185,6 +6959,17 @@ def webhook():
 
         # Normalizar nome do evento (aceita MESSAGES_UPSERT ou messages.upsert)
         event = data.get('event', '').upper().replace('.', '_')
+        if event == 'CONNECTION_UPDATE':
+            # Mantém config_whatsapp.conectado atualizado para o dashboard
+            cfg = ConfigWhatsApp.query.filter_by(instance_name=data.get('instance')).first()
+            estado = (data.get('data') or {}).get('state')
+            if cfg and estado in ('open', 'close'):
+                cfg.conectado = estado == 'open'
+                cfg.atualizado_em = datetime.utcnow()
+                if cfg.conectado:
+                    cfg.data_conexao = datetime.utcnow()
+                db.session.commit()
+            return jsonify({'status': 'ok'}), 200
         if event != 'MESSAGES_UPSERT':
             logger.debug(f"Evento ignorado: {event}")
             return jsonify({'status': 'ok'}), 200
@@ -7250,11 +7035,7 @@ def webhook():
         # PROTEÇÃO GLOBAL: Evitar duplicação quando mesmo telefone está em múltiplos usuários
         # =====================================================================
         # Buscar TODAS as variações do número
-        numeros_buscar = [numero]
-        if len(numero) == 12:
-            numeros_buscar.append(numero[:4] + '9' + numero[4:])  # Com 9º dígito
-        elif len(numero) == 13:
-            numeros_buscar.append(numero[:4] + numero[5:])  # Sem 9º dígito
+        numeros_buscar = variantes_nono_digito(numero)  # Com e sem 9º dígito
 
         # Verificar se esta mensagem já foi processada por OUTRO webhook (outro usuário)
         from datetime import timedelta
@@ -7480,11 +7261,7 @@ def webhook():
                                     send_fn_todos = app.extensions.get('enviar_comprovante_background')
                                     if send_fn_todos:
                                         base_url_todos = request.host_url.rstrip('/')
-                                        threading.Thread(
-                                            target=send_fn_todos,
-                                            args=(item.campanha.criador_id, item.id, comp_ant_todos.filepath, tel_numero, base_url_todos),
-                                            daemon=True
-                                        ).start()
+                                        send_fn_todos(item.campanha.criador_id, item.id, comp_ant_todos.filepath, tel_numero, base_url_todos)
                             except Exception as e_todos:
                                 logger.error(f"[AUTO] Erro ao processar comprovante antecipado (TODOS) para {item.paciente}: {e_todos}")
                     else:
@@ -7539,11 +7316,7 @@ def webhook():
                                     send_fn_menu = app.extensions.get('enviar_comprovante_background')
                                     if send_fn_menu:
                                         base_url_menu = request.host_url.rstrip('/')
-                                        threading.Thread(
-                                            target=send_fn_menu,
-                                            args=(item.campanha.criador_id, item.id, comp_ant_menu.filepath, tel_numero, base_url_menu),
-                                            daemon=True
-                                        ).start()
+                                        send_fn_menu(item.campanha.criador_id, item.id, comp_ant_menu.filepath, tel_numero, base_url_menu)
                             except Exception as e_menu:
                                 logger.error(f"[AUTO] Erro ao processar comprovante antecipado (menu) para {item.paciente}: {e_menu}")
 
@@ -7688,18 +7461,11 @@ def webhook():
         # Isso garante que ambos os sistemas (Consultas e Fila) funcionem independentemente
         # Busca por telefone do usuário correto (mesmo filtro de instância)
         # IMPORTANTE: Tentar variações do número (com/sem 9º dígito)
-        consulta_telefones = TelefoneConsulta.query.filter_by(numero=numero).all()
-
-        if not consulta_telefones:
-            # Tenta variação 9º dígito (mesmo código usado para fila cirúrgica)
-            if len(numero) == 12:
-                # Número sem 9, tentar com 9
-                num9 = numero[:4] + '9' + numero[4:]
-                consulta_telefones = TelefoneConsulta.query.filter_by(numero=num9).all()
-            elif len(numero) == 13:
-                # Número com 9, tentar sem 9
-                num_sem9 = numero[:4] + numero[5:]
-                consulta_telefones = TelefoneConsulta.query.filter_by(numero=num_sem9).all()
+        # Número exato primeiro; se não achar, tenta variação 9º dígito
+        for num in numeros_buscar:
+            consulta_telefones = TelefoneConsulta.query.filter_by(numero=num).all()
+            if consulta_telefones:
+                break
 
         # Priorizar consulta mais apropriada quando há múltiplas consultas do mesmo telefone
         # PRIORIDADE:
@@ -7871,12 +7637,7 @@ def webhook():
                                         send_fn = app.extensions.get('enviar_comprovante_background')
                                         if send_fn:
                                             base_url = request.host_url.rstrip('/')
-                                            t = threading.Thread(
-                                                target=send_fn,
-                                                args=(consulta.campanha.criador_id, consulta.id, comp_ant.filepath, numero_resposta, base_url),
-                                                daemon=True
-                                            )
-                                            t.start()
+                                            send_fn(consulta.campanha.criador_id, consulta.id, comp_ant.filepath, numero_resposta, base_url)
                                         enviar_e_registrar_consulta(ws, numero_resposta, "✅ Consulta confirmada! Seu comprovante está sendo enviado agora.", consulta)
                                         logger.info(f"[AUTO] Comprovante antecipado enviado automaticamente para {consulta.paciente}")
                                 except Exception as e_ant:
@@ -8097,12 +7858,7 @@ _Hospital Universitário Walter Cantídio_""", consulta)
                                 send_fn = app.extensions.get('enviar_comprovante_background')
                                 if rows_reag > 0 and send_fn:
                                     base_url = request.host_url.rstrip('/')
-                                    t = threading.Thread(
-                                        target=send_fn,
-                                        args=(consulta.campanha.criador_id, consulta.id, comp_ant_reag.filepath, numero_resposta, base_url),
-                                        daemon=True
-                                    )
-                                    t.start()
+                                    send_fn(consulta.campanha.criador_id, consulta.id, comp_ant_reag.filepath, numero_resposta, base_url)
                                     msg_confirmacao = f"""✅ *Reagendamento confirmado!*
 
 📅 Data: {nova_data}
@@ -8340,16 +8096,10 @@ _Hospital Universitário Walter Cantídio_""", consulta)
         # Buscar Telefone e Contato
         # Prioriza contatos NAO concluidos, depois os mais recentes
         # Tenta encontrar o telefone exato ou variacoes
-        telefones = Telefone.query.filter_by(numero_fmt=numero).all()
-        
-        if not telefones:
-            # Tenta variacao 9o digito
-            if len(numero) == 12:
-                num9 = numero[:4] + '9' + numero[4:]
-                telefones = Telefone.query.filter_by(numero_fmt=num9).all()
-            elif len(numero) == 13:
-                num_sem9 = numero[:4] + numero[5:]
-                telefones = Telefone.query.filter_by(numero_fmt=num_sem9).all()
+        for num in numeros_buscar:
+            telefones = Telefone.query.filter_by(numero_fmt=num).all()
+            if telefones:
+                break
         
         if not telefones:
             logger.warning(f"Webhook: Telefone nao encontrado para {numero}")
@@ -9313,21 +9063,21 @@ def dashboard_sentimentos():
 @app.route('/logs')
 @login_required
 def logs():
-    page = request.args.get('page', 1, type=int)
+    from historico_mensagens import pagina_logs, total_aproximado
     camp_id = request.args.get('campanha_id', type=int)
     direcao = request.args.get('direcao')
 
-    q = LogMsg.query
-    if camp_id:
-        q = q.filter_by(campanha_id=camp_id)
-    if direcao:
-        q = q.filter_by(direcao=direcao)
-
-    logs = q.order_by(LogMsg.data.desc()).paginate(page=page, per_page=100)
+    logs = pagina_logs(
+        campanha_id=camp_id, direcao=direcao,
+        apos=request.args.get('apos'), antes=request.args.get('antes')
+    )
+    total = total_aproximado(camp_id, direcao)
     # Filtrar apenas campanhas do usuario atual
     camps = Campanha.query.filter_by(criador_id=current_user.id).order_by(Campanha.data_criacao.desc()).all()
+    nomes_campanhas = {c.id: c.nome for c in camps}
 
-    return render_template('logs.html', logs=logs, campanhas=camps, campanha_id=camp_id, direcao=direcao)
+    return render_template('logs.html', logs=logs, total=total, campanhas=camps, nomes_campanhas=nomes_campanhas,
+                           campanha_id=camp_id, direcao=direcao)
 
 
 @app.route('/relatorios')
@@ -9352,38 +9102,9 @@ def relatorios():
 @app.route('/api/relatorios/<int:campanha_id>')
 @login_required
 def api_relatorios(campanha_id):
-    """API para retornar dados de relatórios de uma campanha específica"""
+    """Resumo (KPIs) de uma campanha; os contatos vêm paginados de api_relatorios_contatos"""
     campanha = verificar_acesso_campanha(campanha_id)
 
-    # Atualizar estatísticas
-    campanha.atualizar_stats()
-    db.session.commit()
-
-    # Buscar contatos da campanha
-    contatos = Contato.query.filter_by(campanha_id=campanha_id).all()
-
-    # Preparar dados dos contatos para a tabela
-    contatos_data = []
-    for contato in contatos:
-        # Buscar o primeiro telefone do contato
-        telefone_obj = Telefone.query.filter_by(contato_id=contato.id).first()
-        telefone_str = telefone_obj.numero if telefone_obj else None
-        data_envio = telefone_obj.data_envio if telefone_obj and telefone_obj.data_envio else None
-
-        contatos_data.append({
-            'id': contato.id,
-            'nome': contato.nome,
-            'telefone': telefone_str,
-            'procedimento': contato.procedimento,
-            'procedimento_normalizado': contato.procedimento_normalizado,
-            'status': contato.status,
-            'confirmado': contato.confirmado,
-            'rejeitado': contato.rejeitado,
-            'erro': contato.erro,
-            'data_envio': data_envio.isoformat() if data_envio else None,
-            'resposta': contato.resposta
-        })
-
     return jsonify({
         'campanha_id': campanha.id,
         'campanha_nome': campanha.nome,
@@ -9391,11 +9112,31 @@ def api_relatorios(campanha_id):
         'total_enviados': campanha.total_enviados,
         'total_confirmados': campanha.total_confirmados,
         'total_rejeitados': campanha.total_rejeitados,
-        'total_erros': campanha.total_erros,
-        'contatos': contatos_data
+        'total_erros': campanha.total_erros
     })
 
 
+@app.route('/api/relatorios/<int:campanha_id>/contatos')
+@login_required
+def api_relatorios_contatos(campanha_id):
+    """
+    Contatos da campanha paginados por keyset (ver relatorio_contatos.py)
+
+    Query params: filtro, busca, ordem (id, -id, nome, -nome), cursor, limite
+    """
+    from relatorio_contatos import pagina_contatos, LIMITE_PADRAO
+    campanha = verificar_acesso_campanha(campanha_id)
+
+    return jsonify(pagina_contatos(
+        campanha.id,
+        filtro=request.args.get('filtro', 'todos'),
+        busca=request.args.get('busca', '').strip(),
+        ordem=request.args.get('ordem', 'id'),
+        cursor=request.args.get('cursor'),
+        limite=request.args.get('limite', LIMITE_PADRAO, type=int)
+    ))
+
+
 # CLI
 @app.cli.command('init-db')
 def init_db():
@@ -9426,32 +9167,36 @@ def task_status(task_id):
             'error': 'Celery não configurado'
         })
 
-    task = AsyncResult(task_id, app=celery_app)
+    from progresso_campanhas import obter_status_task
 
-    response = {
-        'task_id': task_id,
-        'state': task.state,
-        'ready': task.ready(),
-        'successful': task.successful() if task.ready() else None,
-        'failed': task.failed() if task.ready() else None
-    }
+    def calcular():
+        task = AsyncResult(task_id, app=celery_app)
 
-    if task.state == 'PENDING':
-        response['meta'] = {
-            'status': 'Aguardando processamento...'
+        response = {
+            'task_id': task_id,
+            'state': task.state,
+            'ready': task.ready(),
+            'successful': task.successful() if task.ready() else None,
+            'failed': task.failed() if task.ready() else None
         }
-    elif task.state == 'PROGRESS':
-        response['meta'] = task.info
-    elif task.state == 'SUCCESS':
-        response['result'] = task.result
-    elif task.state == 'FAILURE':
-        response['error'] = str(task.info)
-    elif task.state == 'RETRY':
-        response['meta'] = task.info
-    else:
-        response['meta'] = task.info
 
-    return jsonify(response)
+        if task.state == 'PENDING':
+            response['meta'] = {
+                'status': 'Aguardando processamento...'
+            }
+        elif task.state == 'PROGRESS':
+            response['meta'] = task.info
+        elif task.state == 'SUCCESS':
+            response['result'] = task.result
+        elif task.state == 'FAILURE':
+            response['error'] = str(task.info)
+        elif task.state == 'RETRY':
+            response['meta'] = task.info
+        else:
+            response['meta'] = task.info
+        return response
+
+    return app.response_class(obter_status_task(task_id, calcular, 'detalhe'), mimetype='application/json')
 
 
 @app.route('/api/task/<task_id>/cancel', methods=['POST'])
@@ -9496,6 +9241,8 @@ init_scih_routes(app, db)
 with app.app_context():
     db.create_all()
     criar_admin()
+    from busca_contatos import preparar_busca_sqlite
+    preparar_busca_sqlite()
     criar_faqs_padrao()
     criar_tutoriais_padrao()
 
@@ -10,13 +10,22 @@ Uso:
     docker compose exec -T celery_worker python /app/backfill_hora_aghu.py --all      # processa tudo (cuidado!)
     docker compose exec -T celery_worker python /app/backfill_hora_aghu.py --limit 50 # processa só 50
     docker compose exec -T celery_worker python /app/backfill_hora_aghu.py --sleep 2  # 2s entre cada OCR
+    docker compose exec -T celery_worker python /app/backfill_hora_aghu.py --all --paralelo
+    docker compose exec -T celery_worker python /app/backfill_hora_aghu.py --all --paralelo --workers 4 --carga-maxima 0.7
 
 Throttling: por padrão dorme 500ms entre cada OCR pra não estourar CPU.
+
+Modo --paralelo (backfills grandes, janela de manutenção): OCR num pool de
+processos do tamanho dos núcleos disponíveis, reduzindo o paralelismo quando a
+carga da máquina (load average por núcleo) passa de --carga-maxima. Commit a
+cada --lote arquivos, com os itens gravados no arquivo de checkpoint: rodar de
+novo retoma de onde parou (--recomecar ignora o checkpoint). Mostra vazão e ETA.
 """
 import argparse
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 sys.path.insert(0, '/app')
 
@@ -32,17 +41,238 @@ from app import (
 # o paciente já recebeu a mensagem sem horário.
 STATUS_ATIVOS = ('AGUARDANDO_ENVIO',)
 
+CHECKPOINT_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backfill_hora_aghu.checkpoint')
+
 
 def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument('--all', action='store_true', help='Processa TODAS as consultas, mesmo as já finalizadas')
     p.add_argument('--limit', type=int, default=0, help='Limita ao número N de consultas')
     p.add_argument('--sleep', type=float, default=0.5, help='Segundos entre cada OCR (default 0.5)')
+    p.add_argument('--paralelo', action='store_true', help='OCR em pool de processos, com checkpoint')
+    p.add_argument('--workers', type=int, default=0, help='Processos de OCR no modo paralelo (default: núcleos disponíveis)')
+    p.add_argument('--carga-maxima', type=float, default=0.85,
+                   help='Load average por núcleo acima do qual o paralelismo é reduzido (default 0.85)')
+    p.add_argument('--lote', type=int, default=50, help='Commit + checkpoint a cada N arquivos (default 50)')
+    p.add_argument('--checkpoint', default=CHECKPOINT_PADRAO, help='Arquivo de checkpoint do modo paralelo')
+    p.add_argument('--recomecar', action='store_true', help='Ignora o checkpoint e processa tudo de novo')
     return p.parse_args()
 
 
+def _tem_hora(hora):
+    hora = (hora or '').strip()
+    return bool(hora) and hora != '00:00'
+
+
+def _nucleos_disponiveis():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _carga_por_nucleo(nucleos):
+    try:
+        return os.getloadavg()[0] / nucleos
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def _formatar_duracao(segundos):
+    segundos = int(segundos)
+    return f"{segundos // 3600:d}h{segundos % 3600 // 60:02d}m{segundos % 60:02d}s"
+
+
+# =============================================================================
+# MODO PARALELO
+# =============================================================================
+
+def ler_checkpoint(caminho):
+    """Chaves já processadas ('c:<consulta_id>' / 'a:<comprovante_id>')"""
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return {linha.strip() for linha in f if linha.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def gravar_checkpoint(caminho, chaves):
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.writelines(f"{chave}\n" for chave in chaves)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def coletar_itens(args, processados):
+    """
+    Lista (chave, consulta_id, filepath) a processar, nas mesmas regras do modo
+    serial, sem carregar os objetos inteiros. Retorna (itens, contadores).
+    """
+    contadores = {'ja_tinha': 0, 'sem_arquivo': 0, 'checkpoint': 0}
+    itens = []
+    consultas_na_fila = set()
+
+    # 1) Consultas com comprovante já vinculado
+    q = db.session.query(
+        AgendamentoConsulta.id, AgendamentoConsulta.comprovante_path, AgendamentoConsulta.hora_aghu
+    ).filter(
+        AgendamentoConsulta.comprovante_path.isnot(None),
+        AgendamentoConsulta.comprovante_path != '',
+    )
+    if not args.all:
+        q = q.filter(AgendamentoConsulta.status.in_(STATUS_ATIVOS))
+    for consulta_id, filepath, hora in q.order_by(AgendamentoConsulta.id):
+        chave = f"c:{consulta_id}"
+        if chave in processados:
+            contadores['checkpoint'] += 1
+        elif _tem_hora(hora):
+            contadores['ja_tinha'] += 1
+        elif not os.path.exists(filepath):
+            contadores['sem_arquivo'] += 1
+        else:
+            itens.append((chave, consulta_id, filepath))
+            consultas_na_fila.add(consulta_id)
+
+    # 2) ComprovanteAntecipado de campanhas ainda ativas
+    q2 = db.session.query(
+        ComprovanteAntecipado.id, ComprovanteAntecipado.consulta_id,
+        ComprovanteAntecipado.filepath, AgendamentoConsulta.hora_aghu
+    ).join(
+        AgendamentoConsulta, AgendamentoConsulta.id == ComprovanteAntecipado.consulta_id
+    ).filter(
+        ComprovanteAntecipado.usado == False,  # ainda não foi usado = campanha em andamento
+    )
+    for comp_id, consulta_id, filepath, hora in q2.order_by(ComprovanteAntecipado.id):
+        chave = f"a:{comp_id}"
+        if consulta_id in consultas_na_fila:
+            continue
+        if chave in processados:
+            contadores['checkpoint'] += 1
+        elif _tem_hora(hora):
+            contadores['ja_tinha'] += 1
+        elif not filepath or not os.path.exists(filepath):
+            contadores['sem_arquivo'] += 1
+        else:
+            itens.append((chave, consulta_id, filepath))
+            consultas_na_fila.add(consulta_id)
+
+    if args.limit > 0:
+        itens = itens[:args.limit]
+    return itens, contadores
+
+
+def _iniciar_processo_ocr():
+    """Inicializa cada processo do pool: conexões próprias com o banco + app context"""
+    db.engine.dispose(close=False)
+    app.app_context().push()
+
+
+def _ocr_hora(filepath):
+    """
+    Hora do comprovante ('' se o PDF não tem horário extraível). Executado
+    também nos processos do pool.
+
+    extrair_dados_comprovante devolve None quando o OCR falhou ou não está
+    disponível: isso é erro (o arquivo deve ser tentado de novo), não
+    "sem horário".
+    """
+    dados = extrair_dados_comprovante(filepath)
+    if dados is None:
+        raise RuntimeError('falha na extração (OCR indisponível ou erro ao ler o arquivo)')
+    return (dados.get('hora') or '').strip()
+
+
+def main_paralelo(args):
+    nucleos = _nucleos_disponiveis()
+    workers = args.workers or nucleos
+
+    with app.app_context():
+        processados = set() if args.recomecar else ler_checkpoint(args.checkpoint)
+        if args.recomecar and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+
+        itens, contadores = coletar_itens(args, processados)
+        total = len(itens)
+        modo = 'TODAS' if args.all else 'ativas'
+        print(f"Consultas {modo} + antecipados a processar: {total}")
+        print(f"  (já no checkpoint: {contadores['checkpoint']}, já tinham horário: {contadores['ja_tinha']}, "
+              f"sem arquivo: {contadores['sem_arquivo']})")
+        print(f"  ({workers} processos, carga máxima {args.carga_maxima:.2f}/núcleo, commit a cada {args.lote}, "
+              f"checkpoint em {args.checkpoint})")
+
+        atualizadas = sem_hora_no_pdf = erros_ocr = concluidos = 0
+        lote = []  # chaves processadas desde o último commit
+        inicio = time.monotonic()
+        db.session.close()  # devolve a conexão ao pool antes de criar os processos
+
+        def fechar_lote():
+            db.session.commit()
+            gravar_checkpoint(args.checkpoint, lote)
+            lote.clear()
+            decorrido = time.monotonic() - inicio
+            vazao = concluidos / decorrido if decorrido else 0
+            eta = (total - concluidos) / vazao if vazao else 0
+            print(f"  ... {concluidos}/{total} processadas ({atualizadas} preenchidas) | "
+                  f"{vazao * 60:.1f} arquivos/min | carga {_carga_por_nucleo(nucleos):.2f}/núcleo | "
+                  f"ETA {_formatar_duracao(eta)}")
+
+        pendentes = {}
+        fila = iter(itens)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_processo_ocr) as pool:
+            while True:
+                # Acima da carga máxima, não repõe os processos que terminam
+                # (o paralelismo cai até 1 enquanto a máquina estiver carregada)
+                limite = workers if _carga_por_nucleo(nucleos) <= args.carga_maxima else 1
+                while len(pendentes) < limite:
+                    item = next(fila, None)
+                    if item is None:
+                        break
+                    pendentes[pool.submit(_ocr_hora, item[2])] = item
+                if not pendentes:
+                    break
+
+                prontos, _ = wait(pendentes, timeout=5, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    chave, consulta_id, _ = pendentes.pop(futuro)
+                    concluidos += 1
+                    try:
+                        hora = futuro.result()
+                    except Exception as e:
+                        # Não entra no checkpoint: será tentado de novo na próxima execução
+                        erros_ocr += 1
+                        print(f"  ! erro OCR {chave}: {str(e)[:80]}")
+                        continue
+
+                    if _tem_hora(hora):
+                        ag = db.session.get(AgendamentoConsulta, consulta_id)
+                        if ag and not _tem_hora(ag.hora_aghu):
+                            ag.hora_aghu = hora
+                            atualizadas += 1
+                    else:
+                        sem_hora_no_pdf += 1
+                    lote.append(chave)
+                    if len(lote) >= args.lote:
+                        fechar_lote()
+
+        if lote:
+            fechar_lote()
+
+        print("")
+        print("=" * 60)
+        print(f"BACKFILL CONCLUÍDO em {_formatar_duracao(time.monotonic() - inicio)}")
+        print(f"  hora_aghu preenchido:        {atualizadas}")
+        print(f"  já tinham horário:           {contadores['ja_tinha']}")
+        print(f"  já no checkpoint:            {contadores['checkpoint']}")
+        print(f"  PDF sem horário extraível:   {sem_hora_no_pdf}")
+        print(f"  PDF não encontrado em disco: {contadores['sem_arquivo']}")
+        print(f"  erros de OCR:                {erros_ocr}")
+        print("=" * 60)
+
+
 def main():
     args = parse_args()
+    if args.paralelo:
+        return main_paralelo(args)
 
     with app.app_context():
         atualizadas = 0
@@ -73,8 +303,7 @@ def main():
                 sem_arquivo += 1
                 continue
             try:
-                dados = extrair_dados_comprovante(ag.comprovante_path) or {}
-                hora = (dados.get('hora') or '').strip()
+                hora = _ocr_hora(ag.comprovante_path)
                 if hora and hora != '00:00':
                     ag.hora_aghu = hora
                     atualizadas += 1
@@ -113,8 +342,7 @@ def main():
                 sem_arquivo += 1
                 continue
             try:
-                dados = extrair_dados_comprovante(comp.filepath) or {}
-                hora = (dados.get('hora') or '').strip()
+                hora = _ocr_hora(comp.filepath)
                 if hora and hora != '00:00':
                     ag.hora_aghu = hora
                     atualizadas += 1
@@ -0,0 +1,226 @@
+"""
+Benchmark do OCR de comprovantes: OCR original (página inteira, 300 dpi) x OCR
+adaptativo (regiões de interesse binarizadas, ver ocr_preprocessamento.py).
+
+Para cada arquivo da amostra mede o tempo dos dois caminhos, o estágio em que o
+adaptativo parou e se os campos extraídos batem com os do OCR original. Com
+--gabarito (CSV arquivo,paciente,data,hora,medico,especialidade) mede também a
+acurácia de cada caminho contra os valores corretos.
+
+Uso:
+    docker compose exec -T celery_worker python /app/benchmark_ocr.py /app/uploads/comprovantes
+    docker compose exec -T celery_worker python /app/benchmark_ocr.py amostra/ --limit 30
+    docker compose exec -T celery_worker python /app/benchmark_ocr.py amostra/ --gabarito gabarito.csv
+    docker compose exec -T celery_worker python /app/benchmark_ocr.py amostra/ --aprender-regioes
+
+--aprender-regioes localiza os rótulos (PACIENTE, DATA, HORA, PROFISSIONAL...)
+na 1ª página de cada arquivo e grava em regioes_ocr.json as faixas da página
+onde eles aparecem, usadas pelo estágio ocr_regioes.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, '/app')
+
+from app import CAMPOS_COMPROVANTE, _extrair_campos_comprovante, _normalizar_texto_extraido
+import ocr_preprocessamento
+
+EXTENSOES = ('.pdf', '.jpg', '.jpeg', '.png')
+
+# Rótulos do comprovante AGHU que antecedem os campos de interesse
+ROTULOS = ('PACIENTE', 'DATA', 'HORA', 'HORARIO', 'PROFISSIONAL', 'ESPECIALIDADE', 'UNIDADE')
+
+# Cada faixa vai do topo do rótulo até ALTURAS_ABAIXO alturas de linha abaixo dele
+ALTURAS_ABAIXO = 3
+MARGEM = 0.02
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('amostra', help='Diretório com comprovantes (pdf/jpg/png)')
+    p.add_argument('--limit', type=int, default=0, help='Limita ao número N de arquivos')
+    p.add_argument('--gabarito', help='CSV com os valores corretos (arquivo,paciente,data,hora,medico,especialidade)')
+    p.add_argument('--aprender-regioes', action='store_true', help='Gera regioes_ocr.json a partir da amostra')
+    p.add_argument('--saida-regioes', default=ocr_preprocessamento.ARQUIVO_REGIOES)
+    return p.parse_args()
+
+
+def listar_amostra(diretorio, limite):
+    arquivos = sorted(
+        os.path.join(diretorio, nome) for nome in os.listdir(diretorio)
+        if nome.lower().endswith(EXTENSOES)
+    )
+    return arquivos[:limite] if limite > 0 else arquivos
+
+
+def _comparavel(valor):
+    valor = unicodedata.normalize('NFKD', (valor or '').upper())
+    return ' '.join(''.join(c for c in valor if not unicodedata.combining(c)).split())
+
+
+def extrair(texto):
+    return _extrair_campos_comprovante(_normalizar_texto_extraido(texto or ''))
+
+
+def extrair_rotulos(texto):
+    """Mesmo critério de parada usado em produção (_obter_texto_comprovante)"""
+    return _extrair_campos_comprovante(_normalizar_texto_extraido(texto or ''), so_rotulos=True)
+
+
+def carregar_gabarito(caminho):
+    if not caminho:
+        return {}
+    with open(caminho, encoding='utf-8') as f:
+        return {os.path.basename(linha['arquivo']): linha for linha in csv.DictReader(f)}
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def benchmark(arquivos, gabarito):
+    total_original = total_adaptativo = 0.0
+    estagios = {}
+    concordancia = {campo: 0 for campo in CAMPOS_COMPROVANTE}
+    acertos_original = {campo: 0 for campo in CAMPOS_COMPROVANTE}
+    acertos_adaptativo = {campo: 0 for campo in CAMPOS_COMPROVANTE}
+    com_gabarito = 0
+
+    for i, arquivo in enumerate(arquivos, 1):
+        nome = os.path.basename(arquivo)
+        try:
+            t0 = time.monotonic()
+            campos_original = extrair(ocr_preprocessamento.ocr_completo(arquivo))
+            t1 = time.monotonic()
+            texto, estagio = ocr_preprocessamento.ocr_adaptativo(arquivo, extrair_campos=extrair_rotulos)
+            t2 = time.monotonic()
+        except Exception as e:
+            print(f"  [{i}/{len(arquivos)}] {nome}: ERRO {e}")
+            continue
+
+        campos_adaptativo = extrair(texto)
+        total_original += t1 - t0
+        total_adaptativo += t2 - t1
+        estagios[estagio] = estagios.get(estagio, 0) + 1
+
+        divergentes = []
+        for campo in CAMPOS_COMPROVANTE:
+            if _comparavel(campos_original.get(campo)) == _comparavel(campos_adaptativo.get(campo)):
+                concordancia[campo] += 1
+            else:
+                divergentes.append(campo)
+
+        esperado = gabarito.get(nome)
+        if esperado:
+            com_gabarito += 1
+            for campo in CAMPOS_COMPROVANTE:
+                correto = _comparavel(esperado.get(campo))
+                if _comparavel(campos_original.get(campo)) == correto:
+                    acertos_original[campo] += 1
+                if _comparavel(campos_adaptativo.get(campo)) == correto:
+                    acertos_adaptativo[campo] += 1
+
+        print(f"  [{i}/{len(arquivos)}] {nome}: original {t1 - t0:.2f}s | adaptativo {t2 - t1:.2f}s "
+              f"({estagio})" + (f" | divergem: {', '.join(divergentes)}" if divergentes else ''))
+
+    processados = sum(estagios.values())
+    if not processados:
+        print("\nNenhum arquivo processado.")
+        return
+
+    print()
+    print("=" * 60)
+    print(f"Arquivos:          {processados}")
+    print(f"Tempo original:    {total_original:.1f}s ({total_original / processados:.2f}s/arquivo)")
+    print(f"Tempo adaptativo:  {total_adaptativo:.1f}s ({total_adaptativo / processados:.2f}s/arquivo)")
+    if total_adaptativo:
+        print(f"Ganho:             {total_original / total_adaptativo:.1f}x")
+    print("Estágio final:     " + ', '.join(f"{k}={v}" for k, v in sorted(estagios.items())))
+    print("Concordância com o OCR original:")
+    for campo in CAMPOS_COMPROVANTE:
+        print(f"  {campo:<15} {concordancia[campo]}/{processados} ({100 * concordancia[campo] / processados:.0f}%)")
+    if com_gabarito:
+        print(f"Acurácia contra o gabarito ({com_gabarito} arquivos), original x adaptativo:")
+        for campo in CAMPOS_COMPROVANTE:
+            print(f"  {campo:<15} {acertos_original[campo]}/{com_gabarito} x {acertos_adaptativo[campo]}/{com_gabarito}")
+    print("=" * 60)
+
+
+# =============================================================================
+# APRENDIZADO DAS REGIÕES DE INTERESSE
+# =============================================================================
+
+def faixas_dos_rotulos(arquivo):
+    """Faixas verticais (y0, y1), em frações da página, a partir dos rótulos encontrados"""
+    import pytesseract
+
+    pagina = ocr_preprocessamento.binarizar(
+        ocr_preprocessamento.carregar_paginas(
+            arquivo, ocr_preprocessamento.DPI_RAPIDO, so_primeira=True, tons_de_cinza=True
+        )[0]
+    )
+    _, altura_pagina = pagina.size
+    dados = pytesseract.image_to_data(pagina, lang='por', output_type=pytesseract.Output.DICT)
+
+    faixas = []
+    for palavra, topo, altura in zip(dados['text'], dados['top'], dados['height']):
+        if _comparavel(palavra).strip(':') in ROTULOS:
+            faixas.append((topo / altura_pagina, (topo + altura * (1 + ALTURAS_ABAIXO)) / altura_pagina))
+    return faixas
+
+
+def unir_faixas(faixas):
+    """Une faixas sobrepostas (ou separadas por menos que MARGEM)"""
+    unidas = []
+    for y0, y1 in sorted(faixas):
+        y0, y1 = max(0.0, y0 - MARGEM), min(1.0, y1 + MARGEM)
+        if unidas and y0 <= unidas[-1][1]:
+            unidas[-1] = (unidas[-1][0], max(unidas[-1][1], y1))
+        else:
+            unidas.append((y0, y1))
+    return unidas
+
+
+def aprender_regioes(arquivos, saida):
+    faixas = []
+    for i, arquivo in enumerate(arquivos, 1):
+        try:
+            encontradas = faixas_dos_rotulos(arquivo)
+        except Exception as e:
+            print(f"  [{i}/{len(arquivos)}] {os.path.basename(arquivo)}: ERRO {e}")
+            continue
+        print(f"  [{i}/{len(arquivos)}] {os.path.basename(arquivo)}: {len(encontradas)} rótulos")
+        faixas.extend(encontradas)
+
+    if not faixas:
+        print("\nNenhum rótulo encontrado, regiões não alteradas.")
+        return
+
+    regioes = [[0.0, round(y0, 3), 1.0, round(y1, 3)] for y0, y1 in unir_faixas(faixas)]
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'regioes': regioes}, f, indent=2)
+
+    area = sum(y1 - y0 for _, y0, _, y1 in regioes)
+    print(f"\n{len(regioes)} regiões gravadas em {saida} ({100 * area:.0f}% da altura da página)")
+    for regiao in regioes:
+        print(f"  {regiao}")
+
+
+def main():
+    args = parse_args()
+    arquivos = listar_amostra(args.amostra, args.limit)
+    print(f"Amostra: {len(arquivos)} arquivos em {args.amostra}")
+
+    if args.aprender_regioes:
+        aprender_regioes(arquivos, args.saida_regioes)
+    else:
+        benchmark(arquivos, carregar_gabarito(args.gabarito))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+=============================================================================
+BUSCA E PAGINAÇÃO DA LISTA DE CONTATOS (/campanha/<id>)
+=============================================================================
+- Busca por nome ou telefone atendida por índice:
+  PostgreSQL: índices GIN pg_trgm em contatos.nome e telefones.numero_fmt
+  (criados por migrate_busca_contatos.py), usados por ILIKE '%termo%';
+  SQLite: tabela FTS5 contatos_busca (tokenizer trigram), mantida por
+  triggers e criada por preparar_busca_sqlite().
+- Telefone buscado só pelos dígitos, em numero_fmt (558599999999), então
+  "(85) 9999-9999" e "8599999999" encontram o mesmo contato.
+- Filtros que dependem de telefones são EXISTS, sem JOIN + DISTINCT.
+- Paginação por keyset em Contato.id (?apos=<id> / ?antes=<id>), sem OFFSET
+  e sem COUNT (paginacao_keyset.py).
+"""
+
+import logging
+import re
+
+from paginacao_keyset import pagina_keyset
+
+logger = logging.getLogger(__name__)
+
+POR_PAGINA = 50
+
+# Trigramas: termos menores não usam o índice
+MIN_CARACTERES_INDICE = 3
+
+_RE_TELEFONE = re.compile(r'^[\d\s()+\-.]+$')
+
+# Tabela FTS5 (rowid = contatos.id) e triggers que a mantêm em dia
+_SQL_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contatos_busca USING fts5(nome, numeros, tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS contatos_busca_ai AFTER INSERT ON contatos BEGIN
+        INSERT INTO contatos_busca(rowid, nome, numeros) VALUES (NEW.id, NEW.nome, '');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contatos_busca_au AFTER UPDATE OF nome ON contatos BEGIN
+        UPDATE contatos_busca SET nome = NEW.nome WHERE rowid = NEW.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contatos_busca_ad AFTER DELETE ON contatos BEGIN
+        DELETE FROM contatos_busca WHERE rowid = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS telefones_busca_ai AFTER INSERT ON telefones BEGIN
+        UPDATE contatos_busca SET numeros = (
+            SELECT group_concat(numero_fmt, ' ') FROM telefones WHERE contato_id = NEW.contato_id
+        ) WHERE rowid = NEW.contato_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS telefones_busca_au AFTER UPDATE OF numero_fmt ON telefones BEGIN
+        UPDATE contatos_busca SET numeros = (
+            SELECT group_concat(numero_fmt, ' ') FROM telefones WHERE contato_id = NEW.contato_id
+        ) WHERE rowid = NEW.contato_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS telefones_busca_ad AFTER DELETE ON telefones BEGIN
+        UPDATE contatos_busca SET numeros = (
+            SELECT group_concat(numero_fmt, ' ') FROM telefones WHERE contato_id = OLD.contato_id
+        ) WHERE rowid = OLD.contato_id;
+    END""",
+]
+
+_SQL_FTS_RECONSTRUIR = [
+    "DELETE FROM contatos_busca",
+    """INSERT INTO contatos_busca(rowid, nome, numeros)
+       SELECT c.id, c.nome,
+              (SELECT group_concat(t.numero_fmt, ' ') FROM telefones t WHERE t.contato_id = c.id)
+       FROM contatos c""",
+]
+
+_fts_disponivel = None
+
+
+def preparar_busca_sqlite():
+    """
+    Cria a tabela FTS5 e os triggers no SQLite (idempotente). Se os triggers
+    ainda não existiam (primeira execução ou tabelas recriadas), reconstrói
+    o índice a partir de contatos/telefones.
+
+    Returns:
+        True se a busca FTS5 está disponível
+    """
+    global _fts_disponivel
+    from sqlalchemy import text
+    from app import db
+
+    if db.engine.dialect.name != 'sqlite':
+        _fts_disponivel = False
+        return False
+
+    try:
+        with db.engine.begin() as conn:
+            existia = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'contatos_busca_ai'"
+            )).first() is not None
+            for sql in _SQL_FTS:
+                conn.execute(text(sql))
+            if not existia:
+                for sql in _SQL_FTS_RECONSTRUIR:
+                    conn.execute(text(sql))
+        _fts_disponivel = True
+    except Exception as e:
+        # SQLite sem FTS5/trigram: a busca cai para ILIKE sem índice
+        logger.warning(f"Busca FTS5 indisponível: {e}")
+        _fts_disponivel = False
+    return _fts_disponivel
+
+
+def _usar_fts():
+    if _fts_disponivel is None:
+        return preparar_busca_sqlite()
+    return _fts_disponivel
+
+
+def _frase_fts(coluna, termo):
+    return '%s:"%s"' % (coluna, termo.replace('"', '""'))
+
+
+def condicao_busca(campanha_id, busca):
+    """Condição 'Contato.id IN (...)' para o termo buscado (nome ou dígitos do telefone)"""
+    from sqlalchemy import select, text, union, literal_column
+    from app import Contato, Telefone
+
+    digitos = re.sub(r'\D', '', busca) if _RE_TELEFONE.match(busca) else ''
+
+    if len(busca) >= MIN_CARACTERES_INDICE and _usar_fts():
+        expressao = _frase_fts('nome', busca)
+        if len(digitos) >= MIN_CARACTERES_INDICE:
+            expressao += ' OR ' + _frase_fts('numeros', digitos)
+        ids = select(literal_column('rowid')).select_from(text('contatos_busca')).where(
+            text('contatos_busca MATCH :busca_fts').bindparams(busca_fts=expressao)
+        )
+        return Contato.id.in_(ids)
+
+    consultas = [select(Contato.id).where(Contato.campanha_id == campanha_id, Contato.nome.ilike(f'%{busca}%'))]
+    if digitos:
+        consultas.append(select(Telefone.contato_id).where(Telefone.numero_fmt.like(f'%{digitos}%')))
+    return Contato.id.in_(union(*consultas) if len(consultas) > 1 else consultas[0])
+
+
+def condicao_filtro(filtro):
+    """Condição do filtro da lista de contatos (None = todos)"""
+    from app import Contato, Telefone
+
+    if filtro == 'validos':
+        return Contato.telefones.any(Telefone.whatsapp_valido == True)
+    if filtro == 'invalidos':
+        return Contato.status == 'sem_whatsapp'
+    if filtro == 'confirmados':
+        return Contato.confirmado == True
+    if filtro == 'rejeitados':
+        return Contato.rejeitado == True
+    if filtro == 'pendentes':
+        return Contato.status.in_(['pendente', 'pronto_envio'])
+    if filtro == 'aguardando':
+        return (Contato.status == 'enviado') & (Contato.confirmado == False) & (Contato.rejeitado == False)
+    if filtro == 'erros':
+        return Contato.erro.isnot(None)
+    if filtro == 'nao_validados':
+        return Contato.telefones.any(Telefone.whatsapp_valido == None)
+    return None
+
+
+def pagina_contatos(campanha, filtro='todos', busca='', apos=None, antes=None, por_pagina=POR_PAGINA):
+    """
+    Uma página de contatos da campanha, em ordem de id.
+
+    Args:
+        apos: id do último contato da página anterior (avançar)
+        antes: id do primeiro contato da página seguinte (voltar)
+    """
+    from app import Contato
+
+    q = campanha.contatos
+    condicao = condicao_filtro(filtro)
+    if condicao is not None:
+        q = q.filter(condicao)
+    if busca:
+        q = q.filter(condicao_busca(campanha.id, busca))
+
+    return pagina_keyset(
+        q, (Contato.id,), lambda contato: contato.id,
+        apos=(apos,) if apos else None, antes=(antes,) if antes else None,
+        por_pagina=por_pagina
+    )
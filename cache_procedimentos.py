@@ -0,0 +1,399 @@
+"""
+=============================================================================
+CACHE DE PROCEDIMENTOS NORMALIZADOS
+=============================================================================
+Cache em dois níveis na frente da tabela procedimentos_normalizados:
+
+1. LRU local do processo (sem round-trip nenhum)
+2. Redis compartilhado entre web e workers
+
+Só vai ao banco quando os dois níveis erram. O contador de uso
+(usado_count) não é mais gravado a cada acerto: os incrementos são
+acumulados no Redis e descarregados em lote pela task periódica
+tasks.descarregar_uso_procedimentos.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+from cache_redis import obter_redis, marcar_indisponivel
+
+logger = logging.getLogger(__name__)
+
+# Nível 1 (local)
+TAMANHO_LRU = 2000
+TTL_LOCAL = 600  # segundos
+
+# Nível 2 (Redis)
+TTL_REDIS = 24 * 3600
+PREFIXO_REDIS = 'procedimento:'
+CHAVE_USO_REDIS = 'procedimentos:uso'
+
+# Sem Redis, os incrementos locais são gravados direto no banco a cada N usos
+LIMITE_USO_LOCAL = 50
+
+
+# Código SIGTAP/SUS no início do termo (ex: "0405050372 - ", "04.05.05.037-2 ")
+_RE_CODIGO_SUS = re.compile(r'^\s*\d[\d.\-]{6,}\d\s*[-–:]?\s*')
+
+# Abreviações comuns nas planilhas -> forma por extenso
+ABREVIACOES_PROCEDIMENTO = {
+    'C/': 'COM',
+    'S/': 'SEM',
+    'P/': 'PARA',
+    'BILAT': 'BILATERAL',
+    'UNILAT': 'UNILATERAL',
+    'ESQ': 'ESQUERDO',
+    'DIR': 'DIREITO',
+    'VIDEOLAP': 'VIDEOLAPAROSCOPICA',
+    'LIO': 'LENTE INTRAOCULAR',
+}
+_RE_ABREVIACOES = re.compile(
+    r'(?<![A-Z0-9])(' + '|'.join(
+        re.escape(a) if a.endswith('/') else re.escape(a) + r'(?![A-Z0-9])'
+        for a in ABREVIACOES_PROCEDIMENTO
+    ) + r')'
+)
+
+
+def chave_procedimento(termo):
+    """
+    Chave canônica de um procedimento, usada para casar variações do mesmo termo.
+
+    Remove acentos e código SUS inicial, expande abreviações, descarta
+    pontuação e colapsa espaços. Ex: "0405050372 - Facoemulsificação c/ implante"
+    e "FACOEMULSIFICACAO C/ IMPLANTE" geram a mesma chave.
+    """
+    if not termo:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(termo))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).upper()
+    texto = _RE_CODIGO_SUS.sub('', texto)
+    texto = _RE_ABREVIACOES.sub(lambda m: ' ' + ABREVIACOES_PROCEDIMENTO[m.group(1)] + ' ', texto)
+    texto = re.sub(r'[^A-Z0-9]+', ' ', texto)
+    return texto.strip()
+
+
+class _LRULocal:
+    """LRU thread-safe com expiração por item"""
+
+    def __init__(self, tamanho, ttl):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em < time.time():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def definir(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (valor, time.time() + self.ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+class CacheProcedimentos:
+    """Cache LRU local + Redis para ProcedimentoNormalizado"""
+
+    def __init__(self):
+        self._local = _LRULocal(TAMANHO_LRU, TTL_LOCAL)
+        self._uso_pendente = Counter()
+        self._lock_uso = threading.Lock()
+
+    @staticmethod
+    def _serializar(proc):
+        return {
+            'id': proc.id,
+            'termo_original': proc.termo_original,
+            'chave_canonica': proc.chave_canonica,
+            'termo_normalizado': proc.termo_normalizado,
+            'termo_simples': proc.termo_simples,
+            'explicacao': proc.explicacao,
+            'aprovado': bool(proc.aprovado),
+            'fonte': proc.fonte,
+        }
+
+    def obter(self, termo):
+        """
+        Busca um procedimento normalizado (local -> Redis -> banco).
+
+        Returns:
+            dict com termo_normalizado, termo_simples, explicacao, aprovado...
+            ou None se o termo ainda não foi normalizado
+        """
+        chave = chave_procedimento(termo)
+        if not chave:
+            return None
+
+        dados = self._local.obter(chave)
+        if dados is not None:
+            return dados
+
+        r = obter_redis()
+        if r is not None:
+            try:
+                bruto = r.get(PREFIXO_REDIS + chave)
+                if bruto:
+                    dados = json.loads(bruto)
+                    self._local.definir(chave, dados)
+                    return dados
+            except Exception as e:
+                marcar_indisponivel(e)
+
+        proc = _buscar_no_banco([chave]).get(chave)
+        if not proc:
+            return None
+
+        dados = self._serializar(proc)
+        self._armazenar(chave, dados)
+        return dados
+
+    def obter_varios(self, termos):
+        """Busca vários termos de uma vez; os que erram no cache vão ao banco em uma única query"""
+        resultado = {}
+        faltando = {}
+
+        r = obter_redis()
+        for termo in termos:
+            chave = chave_procedimento(termo)
+            if not chave:
+                continue
+            dados = self._local.obter(chave)
+            if dados is not None:
+                resultado[termo] = dados
+            else:
+                faltando.setdefault(chave, []).append(termo)
+
+        if faltando and r is not None:
+            chaves = list(faltando)
+            try:
+                brutos = r.mget([PREFIXO_REDIS + c for c in chaves])
+                for chave, bruto in zip(chaves, brutos):
+                    if bruto:
+                        dados = json.loads(bruto)
+                        self._local.definir(chave, dados)
+                        for termo in faltando.pop(chave):
+                            resultado[termo] = dados
+            except Exception as e:
+                marcar_indisponivel(e)
+
+        if faltando:
+            for chave, proc in _buscar_no_banco(list(faltando)).items():
+                dados = self._serializar(proc)
+                self._armazenar(chave, dados)
+                for termo in faltando[chave]:
+                    resultado[termo] = dados
+
+        return resultado
+
+    def _armazenar(self, chave, dados):
+        self._local.definir(chave, dados)
+        r = obter_redis()
+        if r is not None:
+            try:
+                r.set(PREFIXO_REDIS + chave, json.dumps(dados, ensure_ascii=False), ex=TTL_REDIS)
+            except Exception as e:
+                marcar_indisponivel(e)
+
+    def atualizar(self, proc):
+        """Atualiza os dois níveis após salvar/alterar um ProcedimentoNormalizado"""
+        self._armazenar(proc.chave_canonica or chave_procedimento(proc.termo_original), self._serializar(proc))
+
+    def invalidar(self, termo):
+        """Remove um termo dos dois níveis"""
+        chave = chave_procedimento(termo)
+        self._local.remover(chave)
+        r = obter_redis()
+        if r is not None:
+            try:
+                r.delete(PREFIXO_REDIS + chave)
+            except Exception as e:
+                marcar_indisponivel(e)
+
+    # -------------------------------------------------------------------------
+    # Contador de uso (acumulado e descarregado em lote)
+    # -------------------------------------------------------------------------
+
+    def registrar_uso(self, termo, quantidade=1):
+        """Acumula um uso do termo (sem tocar no banco)"""
+        chave = chave_procedimento(termo)
+        if not chave:
+            return
+
+        r = obter_redis()
+        if r is not None:
+            try:
+                r.hincrby(CHAVE_USO_REDIS, chave, quantidade)
+                return
+            except Exception as e:
+                marcar_indisponivel(e)
+
+        # Sem Redis: acumula no processo e grava em lote a cada LIMITE_USO_LOCAL usos
+        with self._lock_uso:
+            self._uso_pendente[chave] += quantidade
+            total_pendente = sum(self._uso_pendente.values())
+        if total_pendente >= LIMITE_USO_LOCAL:
+            try:
+                self.descarregar_uso_local()
+            except Exception as e:
+                # Os usos voltam para o acumulado e vão na próxima gravação
+                logger.warning(f"Erro ao gravar usos de procedimentos: {e}")
+
+    def descarregar_uso_local(self):
+        """Grava no banco os usos acumulados neste processo"""
+        with self._lock_uso:
+            pendentes = dict(self._uso_pendente)
+            self._uso_pendente.clear()
+        try:
+            return gravar_usos(pendentes)
+        except Exception:
+            # Devolve os usos para a próxima gravação não perder a contagem
+            with self._lock_uso:
+                self._uso_pendente.update(pendentes)
+            raise
+
+    def descarregar_uso(self):
+        """
+        Move os usos acumulados no Redis (e no processo) para o banco.
+        Chamado periodicamente pela task descarregar_uso_procedimentos.
+        """
+        total = self.descarregar_uso_local()
+
+        r = obter_redis()
+        if r is None:
+            return total
+
+        chave_tmp = f'{CHAVE_USO_REDIS}:descarregando:{int(time.time() * 1000)}'
+        try:
+            # RENAME é atômico: novos incrementos vão para um hash novo
+            r.rename(CHAVE_USO_REDIS, chave_tmp)
+        except Exception as e:
+            if 'no such key' in str(e).lower():
+                return total
+            marcar_indisponivel(e)
+            return total
+
+        try:
+            pendentes = {k: int(v) for k, v in r.hgetall(chave_tmp).items()}
+            total += gravar_usos(pendentes)
+            r.delete(chave_tmp)
+        except Exception:
+            # Devolve os incrementos para não perder a contagem
+            try:
+                for k, v in r.hgetall(chave_tmp).items():
+                    r.hincrby(CHAVE_USO_REDIS, k, int(v))
+                r.delete(chave_tmp)
+            except Exception as e2:
+                marcar_indisponivel(e2)
+            raise
+
+        return total
+
+    def limpar_local(self):
+        self._local.limpar()
+
+
+def _buscar_no_banco(chaves):
+    """
+    Busca procedimentos por chave canônica em uma única query.
+
+    Se houver mais de um registro com a mesma chave (variações gravadas antes
+    da chave canônica existir), prefere o aprovado e mais usado.
+
+    Returns:
+        dict {chave: ProcedimentoNormalizado}
+    """
+    if not chaves:
+        return {}
+
+    from app import ProcedimentoNormalizado
+
+    procs = ProcedimentoNormalizado.query.filter(
+        ProcedimentoNormalizado.chave_canonica.in_(chaves)
+    ).all()
+
+    return _escolher_por_chave(procs)
+
+
+def _escolher_por_chave(procs):
+    """{chave: registro} preferindo, entre os de mesma chave, o aprovado e mais usado"""
+    escolhidos = {}
+    for proc in procs:
+        atual = escolhidos.get(proc.chave_canonica)
+        if atual is None or (bool(proc.aprovado), proc.usado_count or 0) > (bool(atual.aprovado), atual.usado_count or 0):
+            escolhidos[proc.chave_canonica] = proc
+    return escolhidos
+
+
+def gravar_usos(pendentes):
+    """
+    UPDATE em lote: usado_count += n para cada chave.
+
+    Usa conexão própria: sem Redis, registrar_uso chega aqui no meio do
+    trabalho do chamador, e um commit da sessão gravaria as alterações dele
+    pela metade.
+    """
+    if not pendentes:
+        return 0
+
+    from app import db, ProcedimentoNormalizado
+    from sqlalchemy import select, update, bindparam, func
+
+    # Usos acumulados antes da chave canônica estão no hash com a chave
+    # antiga (termo em maiúsculas); chave_procedimento() leva as duas formas
+    # para a mesma chave, e o que é canônico não muda
+    canonicos = Counter()
+    for chave, quantidade in pendentes.items():
+        canonica = chave_procedimento(chave)
+        if canonica:
+            canonicos[canonica] += quantidade
+    pendentes = canonicos
+
+    tabela = ProcedimentoNormalizado.__table__
+    with db.engine.begin() as conn:
+        procs = conn.execute(
+            select(tabela.c.id, tabela.c.chave_canonica, tabela.c.aprovado, tabela.c.usado_count)
+            .where(tabela.c.chave_canonica.in_(list(pendentes)))
+        ).all()
+        ids = {chave: proc.id for chave, proc in _escolher_por_chave(procs).items()}
+        parametros = [
+            {'proc_id': ids[chave], 'quantidade': quantidade}
+            for chave, quantidade in pendentes.items()
+            if chave in ids
+        ]
+        if parametros:
+            stmt = (
+                update(tabela)
+                .where(tabela.c.id == bindparam('proc_id'))
+                .values(usado_count=func.coalesce(tabela.c.usado_count, 0) + bindparam('quantidade'))
+            )
+            conn.execute(stmt, parametros)
+    return sum(p['quantidade'] for p in parametros)
+
+
+# Instância única por processo
+cache_procedimentos = CacheProcedimentos()
@@ -0,0 +1,64 @@
+"""
+=============================================================================
+CACHE REDIS
+=============================================================================
+Conexão Redis compartilhada pelos caches da aplicação (web e workers).
+
+O Redis é o mesmo usado como broker do Celery (REDIS_URL). Se estiver fora
+do ar, obter_redis() retorna None e os caches seguem funcionando só com o
+nível local / banco de dados.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+# Após uma falha de conexão, aguarda este tempo antes de tentar de novo
+INTERVALO_RECONEXAO = 30
+
+_cliente = None
+_indisponivel_ate = 0
+_lock = threading.Lock()
+
+
+def obter_redis():
+    """Retorna o cliente Redis compartilhado ou None se o Redis estiver indisponível"""
+    global _cliente, _indisponivel_ate
+
+    if _cliente is not None:
+        return _cliente
+    if time.time() < _indisponivel_ate:
+        return None
+
+    with _lock:
+        if _cliente is not None:
+            return _cliente
+        try:
+            import redis
+            cliente = redis.Redis.from_url(
+                REDIS_URL,
+                socket_connect_timeout=1,
+                socket_timeout=1,
+                decode_responses=True
+            )
+            cliente.ping()
+            _cliente = cliente
+        except Exception as e:
+            _indisponivel_ate = time.time() + INTERVALO_RECONEXAO
+            logger.warning(f"Redis indisponível para cache ({e}). Tentando novamente em {INTERVALO_RECONEXAO}s")
+            return None
+
+    return _cliente
+
+
+def marcar_indisponivel(erro):
+    """Descarta o cliente após erro de comunicação (força reconexão posterior)"""
+    global _cliente, _indisponivel_ate
+    _cliente = None
+    _indisponivel_ate = time.time() + INTERVALO_RECONEXAO
+    logger.warning(f"Erro de comunicação com Redis ({erro}). Cache compartilhado desativado por {INTERVALO_RECONEXAO}s")
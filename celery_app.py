@@ -45,6 +45,15 @@ celery.conf.update(
     broker_connection_retry_on_startup=True,  # Retry ao conectar no broker
     worker_cancel_long_running_tasks_on_connection_loss=False,  # Não cancela tasks em andamento
 
+    # Filas: envio de comprovantes (OCR, CPU-bound) tem worker próprio com
+    # concorrência baixa, para não competir com os envios de campanha. O OCR
+    # antecipado (upload em lote) fica em fila separada no mesmo worker, para
+    # um upload grande não represar os envios.
+    task_routes={
+        'tasks.enviar_comprovante_task': {'queue': 'comprovantes'},
+        'tasks.ocr_comprovante_antecipado_task': {'queue': 'ocr_comprovantes'},
+    },
+
     # Logging
     worker_log_format='[%(asctime)s: %(levelname)s/%(processName)s] %(message)s',
     worker_task_log_format='[%(asctime)s: %(levelname)s/%(processName)s][%(task_name)s(%(task_id)s)] %(message)s',
@@ -104,6 +113,27 @@ celery.conf.beat_schedule = {
         'options': {'expires': 1800}
     },
 
+    # Gravar contadores de uso de procedimentos normalizados (acumulados no cache)
+    'descarregar-uso-procedimentos': {
+        'task': 'tasks.descarregar_uso_procedimentos',
+        'schedule': crontab(minute='*/5'),  # A cada 5 minutos
+        'options': {'expires': 240}
+    },
+
+    # Agregados diários dos gráficos (daily_metrics), só os dias alterados
+    'atualizar-metricas-diarias': {
+        'task': 'tasks.atualizar_metricas_diarias',
+        'schedule': crontab(minute='*/5'),  # A cada 5 minutos
+        'options': {'expires': 240}
+    },
+
+    # Snapshots do dashboard administrativo (a página só lê o resultado)
+    'atualizar-snapshots-dashboard': {
+        'task': 'tasks.atualizar_snapshots_dashboard',
+        'schedule': crontab(minute='*/5'),  # A cada 5 minutos
+        'options': {'expires': 240}
+    },
+
     # Limpar tasks antigas a cada 6 horas
     'limpar-tasks-antigas': {
         'task': 'tasks.limpar_tasks_antigas',
@@ -12,12 +12,17 @@ from werkzeug.utils import secure_filename
 from datetime import datetime, date
 import pandas as pd
 import os
+import json
 import time
-import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# Usado só quando o Celery não está disponível: limita o envio de comprovantes
+# (OCR é CPU-bound) a poucas threads no processo web
+_executor_comprovantes = ThreadPoolExecutor(max_workers=2, thread_name_prefix='comprovante')
+
 
 def init_consultas_routes(app, db):
     """
@@ -31,161 +36,124 @@ def init_consultas_routes(app, db):
     # Importar modelos e funções (evita circular import)
     from app import (
         CampanhaConsulta, AgendamentoConsulta, TelefoneConsulta,
-        LogMsgConsulta, WhatsApp, formatar_numero,
-        formatar_mensagem_comprovante, formatar_mensagem_voltar_posto,
-        extrair_dados_comprovante, PesquisaSatisfacao, enviar_e_registrar_consulta,
+        LogMsgConsulta, WhatsApp,
+        formatar_mensagem_voltar_posto, enviar_e_registrar_consulta,
         Paciente, HistoricoConsulta, ComprovanteAntecipado, normalizar_nome_paciente,
-        TZ_FORTALEZA, obter_hoje_fortaleza, obter_hora_fortaleza
+        obter_hoje_fortaleza, obter_hora_fortaleza
+    )
+    from importacao_lote import COLUNAS_CONSULTA_OBRIGATORIAS
+    from envio_comprovantes import (
+        enviar_comprovante, marcar_status_envio, processar_ocr_comprovante_antecipado, aplicar_hora_ocr
     )
 
     try:
         from celery.result import AsyncResult
-        from tasks import enviar_campanha_consultas_task
+        from tasks import (
+            enviar_campanha_consultas_task, importar_consultas_task, enviar_comprovante_task,
+            ocr_comprovante_antecipado_task
+        )
     except ImportError:
         AsyncResult = None
         enviar_campanha_consultas_task = None
+        importar_consultas_task = None
+        enviar_comprovante_task = None
+        ocr_comprovante_antecipado_task = None
         logger.warning("Celery não disponível para modo consulta")
 
 
     # =========================================================================
     # FUNÇÃO AUXILIAR - Envio de comprovante em background
     # =========================================================================
+    def _enviar_comprovante_local(usuario_id, consulta_id, filepath, telefone, base_url):
+        """Fallback sem Celery: envia no pool limitado do processo web (sem retry)"""
+        with app.app_context():
+            try:
+                enviar_comprovante(usuario_id, consulta_id, filepath, telefone, base_url)
+            except Exception as e:
+                logger.error(f"[COMPROVANTE] Erro ao enviar comprovante para consulta {consulta_id}: {e}")
+                db.session.rollback()
+                consulta = db.session.get(AgendamentoConsulta, consulta_id)
+                if consulta:
+                    marcar_status_envio(consulta, 'ERRO', str(e))
+                    db.session.commit()
+
     def enviar_comprovante_background(usuario_id, consulta_id, filepath, telefone, base_url):
         """
-        Envia comprovante em background (OCR + mensagem + arquivo + pesquisa).
-        Executado em thread separada para não bloquear a interface do usuário.
+        Enfileira o envio do comprovante (OCR + mensagem + arquivo) na fila
+        "comprovantes" do Celery, com retry e status em envio_comprovante_status.
+        Não bloqueia a requisição nem roda OCR no processo web.
+
+        Quem chama faz o commit das próprias alterações (comprovante_path,
+        status CONFIRMADO...) antes: o worker lê a consulta do banco. O status
+        PENDENTE e o task_id são gravados em conexão própria, sem fazer commit
+        da sessão de quem chamou.
         """
-        try:
-            logger.info(f"[BG] Iniciando envio de comprovante para consulta {consulta_id}")
-
-            with app.app_context():
-                consulta = AgendamentoConsulta.query.get(consulta_id)
-                if not consulta:
-                    logger.error(f"[BG] Consulta {consulta_id} não encontrada")
-                    return
+        from sqlalchemy import update as sa_update
 
-                # Extrair dados do comprovante via OCR
-                dados_ocr = None
-                try:
-                    dados_ocr = extrair_dados_comprovante(filepath)
-                    if dados_ocr:
-                        logger.info(f"[BG] Dados extraídos do comprovante via OCR: {dados_ocr}")
-                except Exception as ocr_err:
-                    logger.warning(f"[BG] Erro ao extrair dados via OCR (continuando sem): {ocr_err}")
-                    dados_ocr = {}
-
-                if not dados_ocr:
-                    dados_ocr = {}
-
-                # Configurar WhatsApp
-                ws = WhatsApp(usuario_id)
-                if not ws.ok():
-                    logger.error(f"[BG] WhatsApp não configurado para usuário {usuario_id}")
-                    return
-
-                # Gerar link público do comprovante
-                link_comprovante = f"{base_url}/consulta/comprovante/{consulta_id}"
-
-                # Enviar mensagem de texto (personalizada com dados do OCR + link)
-                msg = formatar_mensagem_comprovante(consulta=consulta, dados_ocr=dados_ocr, link_comprovante=link_comprovante)
-                ok_msg, result_msg = ws.enviar(telefone, msg)
-
-                if not ok_msg:
-                    logger.error(f"[BG] Erro ao enviar mensagem: {result_msg}")
-                    return
-
-                # Log da mensagem
-                log = LogMsgConsulta(
-                    campanha_id=consulta.campanha_id,
-                    consulta_id=consulta.id,
-                    direcao='enviada',
-                    telefone=telefone,
-                    mensagem=f'{msg[:200]}... [COMPROVANTE ANEXO]',
-                    status='sucesso',
-                    msg_id=result_msg
+        def gravar(**valores):
+            with db.engine.begin() as conn:
+                conn.execute(
+                    sa_update(AgendamentoConsulta.__table__)
+                    .where(AgendamentoConsulta.__table__.c.id == consulta_id)
+                    .values(**valores)
                 )
-                db.session.add(log)
-                db.session.commit()
 
-                # Aguardar antes de enviar o arquivo
-                time.sleep(7)
-
-                # Enviar arquivo
-                ok_file, result_file = ws.enviar_arquivo(telefone, filepath)
-                if not ok_file:
-                    logger.warning(f"[BG] Erro ao enviar arquivo: {result_file}")
-
-                # =====================================================
-                # HISTÓRICO DO PACIENTE
-                # =====================================================
-                try:
-                    paciente_db = Paciente.query.filter_by(usuario_id=usuario_id, telefone=telefone).first()
-                    if not paciente_db:
-                        paciente_db = Paciente.query.filter_by(usuario_id=usuario_id, nome=dados_ocr.get('paciente', consulta.paciente)).first()
-
-                    if not paciente_db:
-                        paciente_db = Paciente(
-                            usuario_id=usuario_id,
-                            nome=dados_ocr.get('paciente', consulta.paciente),
-                            telefone=telefone,
-                            data_nascimento=dados_ocr.get('data_nascimento'),
-                            prontuario=dados_ocr.get('prontuario'),
-                            codigo=dados_ocr.get('codigo')
-                        )
-                        db.session.add(paciente_db)
-                        db.session.commit()
-                    else:
-                        if dados_ocr.get('data_nascimento'): paciente_db.data_nascimento = dados_ocr.get('data_nascimento')
-                        if dados_ocr.get('prontuario'): paciente_db.prontuario = dados_ocr.get('prontuario')
-                        if dados_ocr.get('codigo'): paciente_db.codigo = dados_ocr.get('codigo')
-                        db.session.commit()
-
-                    historico = HistoricoConsulta(
-                        paciente_id=paciente_db.id,
-                        consulta_id=consulta.id,
-                        usuario_id=usuario_id,
-                        nro_consulta=dados_ocr.get('nro_consulta'),
-                        data_consulta=dados_ocr.get('data'),
-                        hora_consulta=dados_ocr.get('hora'),
-                        dia_semana=dados_ocr.get('dia'),
-                        grade=dados_ocr.get('grade'),
-                        unidade_funcional=dados_ocr.get('unidade_funcional'),
-                        andar=dados_ocr.get('andar'),
-                        ala_bloco=dados_ocr.get('ala_bloco'),
-                        setor=dados_ocr.get('setor'),
-                        sala=dados_ocr.get('sala'),
-                        tipo_consulta=dados_ocr.get('consulta'),
-                        tipo_demanda=dados_ocr.get('tipo'),
-                        equipe=dados_ocr.get('equipe'),
-                        profissional=dados_ocr.get('profissional'),
-                        especialidade=consulta.especialidade,
-                        exames=consulta.exames,
-                        marcado_por=dados_ocr.get('marcado_por'),
-                        observacao=dados_ocr.get('observacao'),
-                        nro_autorizacao=dados_ocr.get('nro_autorizacao'),
-                        status='CONFIRMADA',
-                        comprovante_path=filepath
-                    )
-                    db.session.add(historico)
-                    db.session.commit()
-                    logger.info(f"[BG] Histórico salvo para paciente {paciente_db.nome}")
-                except Exception as e:
-                    logger.error(f"[BG] Erro ao salvar histórico: {e}")
-
-                # =====================================================
-                # PESQUISA DE SATISFAÇÃO - DESATIVADA
-                # =====================================================
-                # Pesquisa via WhatsApp desativada. Link do formulário
-                # já incluído na mensagem do comprovante.
+        # Antes de enfileirar: o worker precisa ver o status PENDENTE
+        gravar(
+            envio_comprovante_status='PENDENTE', envio_comprovante_erro=None,
+            envio_comprovante_em=datetime.utcnow(), envio_comprovante_tentativas=0,
+            envio_comprovante_task_id=None
+        )
 
-                logger.info(f"[BG] Envio de comprovante concluído para consulta {consulta_id}")
+        try:
+            if enviar_comprovante_task is None:
+                raise RuntimeError('Celery não disponível')
+            task = enviar_comprovante_task.apply_async(
+                args=[usuario_id, consulta_id, filepath, telefone, base_url]
+            )
+            logger.info(f"[COMPROVANTE] Envio enfileirado para consulta {consulta_id} (task {task.id})")
+        except Exception as e:
+            logger.warning(f"[COMPROVANTE] Fila indisponível ({e}), enviando no processo web")
+            _executor_comprovantes.submit(
+                _enviar_comprovante_local, usuario_id, consulta_id, filepath, telefone, base_url
+            )
+            return
 
+        try:
+            gravar(envio_comprovante_task_id=task.id)
         except Exception as e:
-            logger.error(f"[BG] Erro ao enviar comprovante para consulta {consulta_id}: {e}")
+            logger.warning(f"[COMPROVANTE] Erro ao gravar task_id da consulta {consulta_id}: {e}")
 
     # Expor função para uso no webhook (auto-envio de comprovante antecipado)
     app.extensions['enviar_comprovante_background'] = enviar_comprovante_background
 
+    def _ocr_antecipado_local(comp_id):
+        """Fallback sem Celery: OCR do comprovante antecipado no pool do processo web"""
+        with app.app_context():
+            try:
+                processar_ocr_comprovante_antecipado(comp_id)
+            except Exception as e:
+                logger.error(f"[OCR ANTECIPADO] Erro no comprovante {comp_id}: {e}")
+                db.session.rollback()
+
+    def enfileirar_ocr_antecipado(comp_ids):
+        """
+        Enfileira o OCR dos comprovantes antecipados recém-enviados (fila
+        "ocr_comprovantes"). Quando o paciente confirmar, o envio usa os dados
+        já extraídos em vez de fazer OCR na hora.
+        """
+        for i, comp_id in enumerate(comp_ids):
+            try:
+                if ocr_comprovante_antecipado_task is None:
+                    raise RuntimeError('Celery não disponível')
+                ocr_comprovante_antecipado_task.apply_async(args=[comp_id])
+            except Exception as e:
+                # Não tenta a fila de novo para cada arquivo: o restante vai direto pro pool
+                logger.warning(f"[OCR ANTECIPADO] Fila indisponível ({e}), OCR no processo web")
+                for restante in comp_ids[i:]:
+                    _executor_comprovantes.submit(_ocr_antecipado_local, restante)
+                break
+
     # =========================================================================
     # COMPROVANTES ANTECIPADOS - Upload em lote na campanha
     # =========================================================================
@@ -200,6 +168,9 @@ def init_consultas_routes(app, db):
 
         agendamentos = campanha.agendamentos
         pacientes_camp = {ag.id: ag.paciente for ag in agendamentos}
+        pacientes_por_nome = {}
+        for ag in agendamentos:
+            pacientes_por_nome.setdefault(normalizar_nome_paciente(ag.paciente), ag.paciente)
 
         comps = ComprovanteAntecipado.query.filter_by(campanha_id=campanha_id).order_by(ComprovanteAntecipado.data_upload.desc()).all()
         resultado = []
@@ -211,13 +182,9 @@ def init_consultas_routes(app, db):
             # Match potencial: paciente na campanha com mesmo nome (sem vínculo ainda)
             match_potencial = None
             if not c.consulta_id:
-                nome_norm = normalizar_nome_paciente(c.nome_paciente)
-                ag_match = next(
-                    (ag for ag in agendamentos if normalizar_nome_paciente(ag.paciente) == nome_norm),
-                    None
+                match_potencial = pacientes_por_nome.get(
+                    c.nome_normalizado or normalizar_nome_paciente(c.nome_paciente)
                 )
-                if ag_match:
-                    match_potencial = ag_match.paciente
 
             resultado.append({
                 'id': c.id,
@@ -227,6 +194,7 @@ def init_consultas_routes(app, db):
                 'consulta_id': c.consulta_id,
                 'paciente_vinculado': paciente_vinculado,
                 'match_potencial': match_potencial,
+                'ocr_status': c.ocr_status,
                 'data_upload': c.data_upload.strftime('%d/%m/%Y %H:%M') if c.data_upload else None,
             })
         return jsonify({'comprovantes': resultado})
@@ -246,10 +214,24 @@ def init_consultas_routes(app, db):
         EXTS_PERMITIDAS = {'.pdf', '.jpg', '.jpeg', '.png'}
         salvos = []
         erros = []
+        novos = []  # (comprovante, consulta vinculada ou None)
 
         # Suporte a inserção manual: nome_paciente_manual sobrescreve o nome do arquivo
         nome_paciente_manual = request.form.get('nome_paciente_manual', '').strip()
 
+        # Índices por nome normalizado, montados uma vez por requisição:
+        # - nomes com comprovante pendente (não usado) na campanha
+        # - primeira consulta sem comprovante de cada paciente (auto-vínculo)
+        nomes_pendentes = {
+            nome for (nome,) in db.session.query(ComprovanteAntecipado.nome_normalizado).filter_by(
+                campanha_id=campanha_id, usado=False
+            )
+        }
+        consultas_por_nome = {}
+        for ag in campanha.agendamentos:
+            if not ag.comprovante_path:
+                consultas_por_nome.setdefault(normalizar_nome_paciente(ag.paciente), ag)
+
         for arquivo in arquivos:
             if not arquivo or not arquivo.filename:
                 continue
@@ -269,105 +251,80 @@ def init_consultas_routes(app, db):
                 erros.append(f'{arquivo.filename}: nome inválido')
                 continue
 
-            # Verificar se já existe comprovante não-usado para o mesmo paciente (normalizado)
+            # Verificar se já existe comprovante não-usado para o mesmo paciente
+            # (inclusive outro arquivo deste mesmo upload)
             nome_norm = normalizar_nome_paciente(nome_paciente)
-            existentes = ComprovanteAntecipado.query.filter_by(campanha_id=campanha_id, usado=False).all()
-            if any(normalizar_nome_paciente(e.nome_paciente) == nome_norm for e in existentes):
+            if nome_norm in nomes_pendentes:
                 erros.append(f'"{nome_paciente}": já possui comprovante pendente — remova o existente na lista antes de enviar outro')
                 continue
+            nomes_pendentes.add(nome_norm)
 
-            # Salvar arquivo no servidor
+            # Salvar arquivo no servidor: cópia em blocos do arquivo temporário
+            # do upload, que é fechado logo em seguida (não acumula em memória)
             ts = datetime.now().strftime('%Y%m%d%H%M%S%f')
             filename_disk = secure_filename(f'comp_ant_{campanha_id}_{ts}{ext}')
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename_disk)
-            arquivo.save(filepath)
+            try:
+                arquivo.save(filepath, buffer_size=64 * 1024)
+            finally:
+                arquivo.close()
+
+            # Vincular automaticamente ao paciente com mesmo nome na campanha
+            consulta_match = consultas_por_nome.get(nome_norm)
+            if consulta_match:
+                logger.info(f"[UPLOAD] Auto-vínculo: '{nome_paciente}' → consulta {consulta_match.id}")
+                # O horário (hora_aghu) é preenchido pelo OCR em background,
+                # enfileirado logo após o commit (enfileirar_ocr_antecipado)
 
-            comp = ComprovanteAntecipado(
+            novos.append((ComprovanteAntecipado(
                 campanha_id=campanha_id,
                 nome_paciente=nome_paciente,
+                nome_normalizado=nome_norm,
                 filename=arquivo.filename,
                 filepath=filepath,
                 usuario_id=current_user.id,
-            )
-            db.session.add(comp)
-
-            # Tentar vincular automaticamente ao paciente com mesmo nome na campanha
-            nome_norm = normalizar_nome_paciente(nome_paciente)
-            consulta_match = next(
-                (ag for ag in campanha.agendamentos
-                 if normalizar_nome_paciente(ag.paciente) == nome_norm and not ag.comprovante_path),
-                None
-            )
-            if consulta_match:
-                comp.consulta_id = consulta_match.id
-                logger.info(f"[UPLOAD] Auto-vínculo: '{nome_paciente}' → consulta {consulta_match.id}")
-
-                # Extrair horário do PDF via OCR e gravar em consulta.hora_aghu
-                # (só se ainda não tem horário definido). Faz isso na hora do
-                # upload pra que a MSG1 do disparador já saia com 'às HHhMM'.
-                if not (consulta_match.hora_aghu or '').strip():
-                    try:
-                        from app import extrair_dados_comprovante
-                        dados_ocr = extrair_dados_comprovante(filepath) or {}
-                        hora_ocr = (dados_ocr.get('hora') or '').strip()
-                        if hora_ocr and hora_ocr != '00:00':
-                            consulta_match.hora_aghu = hora_ocr
-                            logger.info(
-                                f"[UPLOAD/OCR] Horário {hora_ocr} extraído do PDF e salvo "
-                                f"em consulta {consulta_match.id} ({consulta_match.paciente})"
-                            )
-                    except Exception as e_ocr:
-                        logger.warning(
-                            f"[UPLOAD/OCR] Falha ao extrair horário do PDF de "
-                            f"{nome_paciente}: {e_ocr}"
-                        )
-
+                consulta_id=consulta_match.id if consulta_match else None,
+                ocr_status='PENDENTE',
+            ), consulta_match))
             salvos.append({'nome_paciente': nome_paciente, 'filename': arquivo.filename, 'match': bool(consulta_match)})
 
-        if salvos:
+        if novos:
+            db.session.add_all([comp for comp, _ in novos])
             db.session.commit()
+            enfileirar_ocr_antecipado([comp.id for comp, _ in novos])
 
             # Disparar envio se a consulta já estiver aguardando comprovante
             send_fn = app.extensions.get('enviar_comprovante_background')
             base_url = request.host_url.rstrip('/')
-            for s in salvos:
-                if s.get('match'):
-                    comp_enviado = next(
-                        (ag for ag in campanha.agendamentos
-                         if normalizar_nome_paciente(ag.paciente) == normalizar_nome_paciente(s['nome_paciente'])),
-                        None
-                    )
-                    comp_rec = ComprovanteAntecipado.query.filter_by(
-                        campanha_id=campanha_id,
-                        nome_paciente=s['nome_paciente'],
-                        usado=False
-                    ).order_by(ComprovanteAntecipado.id.desc()).first()
-                    if comp_enviado and comp_rec and comp_enviado.status == 'AGUARDANDO_COMPROVANTE' and send_fn:
-                        tel = comp_enviado.telefone_confirmacao or next((t.numero for t in comp_enviado.telefones if t.enviado and not t.invalido), None)
-                        if tel:
-                            try:
-                                from sqlalchemy import update as sa_update
-                                rows_up = db.session.execute(
-                                    sa_update(ComprovanteAntecipado)
-                                    .where(ComprovanteAntecipado.id == comp_rec.id, ComprovanteAntecipado.usado == False)
-                                    .values(usado=True, consulta_id=comp_enviado.id)
-                                ).rowcount
-                                db.session.commit()
-                                if rows_up > 0:
-                                    comp_enviado.comprovante_path = comp_rec.filepath
-                                    comp_enviado.comprovante_nome = comp_rec.filename
-                                    comp_enviado.status = 'CONFIRMADO'
-                                    db.session.commit()
-                                    campanha.atualizar_stats()
-                                    db.session.commit()
-                                    threading.Thread(
-                                        target=send_fn,
-                                        args=(current_user.id, comp_enviado.id, comp_rec.filepath, tel, base_url),
-                                        daemon=True
-                                    ).start()
-                            except Exception as e_up:
-                                logger.error(f"[UPLOAD] Erro ao auto-enviar comprovante para {comp_enviado.paciente}: {e_up}")
-                                db.session.rollback()
+            enviados = 0
+            for comp_rec, comp_enviado in novos:
+                if not (comp_enviado and comp_enviado.status == 'AGUARDANDO_COMPROVANTE' and send_fn):
+                    continue
+                tel = comp_enviado.telefone_confirmacao or next((t.numero for t in comp_enviado.telefones if t.enviado and not t.invalido), None)
+                if not tel:
+                    continue
+                try:
+                    from sqlalchemy import update as sa_update
+                    rows_up = db.session.execute(
+                        sa_update(ComprovanteAntecipado)
+                        .where(ComprovanteAntecipado.id == comp_rec.id, ComprovanteAntecipado.usado == False)
+                        .values(usado=True, consulta_id=comp_enviado.id)
+                    ).rowcount
+                    db.session.commit()
+                    if rows_up > 0:
+                        comp_enviado.comprovante_path = comp_rec.filepath
+                        comp_enviado.comprovante_nome = comp_rec.filename
+                        comp_enviado.status = 'CONFIRMADO'
+                        db.session.commit()
+                        send_fn(current_user.id, comp_enviado.id, comp_rec.filepath, tel, base_url)
+                        enviados += 1
+                except Exception as e_up:
+                    logger.error(f"[UPLOAD] Erro ao auto-enviar comprovante para {comp_enviado.paciente}: {e_up}")
+                    db.session.rollback()
+
+            if enviados:
+                campanha.atualizar_stats()
+                db.session.commit()
 
         return jsonify({'sucesso': True, 'salvos': salvos, 'erros': erros})
 
@@ -437,16 +394,13 @@ def init_consultas_routes(app, db):
             send_fn = app.extensions.get('enviar_comprovante_background')
             if send_fn:
                 base_url = request.host_url.rstrip('/')
-                t = threading.Thread(
-                    target=send_fn,
-                    args=(current_user.id, consulta.id, comp.filepath, telefone, base_url),
-                    daemon=True
-                )
-                t.start()
+                send_fn(current_user.id, consulta.id, comp.filepath, telefone, base_url)
             return jsonify({'sucesso': True, 'enviado': True})
 
         # Apenas vincula para envio automático quando confirmar
         comp.consulta_id = consulta.id
+        if comp.ocr_status == 'CONCLUIDO' and comp.dados_ocr:
+            aplicar_hora_ocr(consulta, json.loads(comp.dados_ocr))
         db.session.commit()
         return jsonify({'sucesso': True, 'enviado': False})
 
@@ -458,7 +412,7 @@ def init_consultas_routes(app, db):
         if campanha.criador_id != current_user.id:
             return jsonify({'erro': 'Acesso negado'}), 403
 
-        from app import buscar_comprovante_antecipado, ComprovanteAntecipado
+        from app import buscar_comprovantes_antecipados, ComprovanteAntecipado
         from sqlalchemy import update as sa_update
         enviados = 0
         erros = []
@@ -470,8 +424,12 @@ def init_consultas_routes(app, db):
         send_fn = app.extensions.get('enviar_comprovante_background')
         base_url = request.host_url.rstrip('/')
 
+        # Uma consulta só para os comprovantes de todos os pacientes aguardando
+        comps_por_nome = buscar_comprovantes_antecipados(campanha_id, [c.paciente for c in consultas_ag])
+
         for consulta in consultas_ag:
-            comp = buscar_comprovante_antecipado(campanha_id, consulta.paciente)
+            nome_norm = normalizar_nome_paciente(consulta.paciente)
+            comp = comps_por_nome.get(nome_norm)
             if not comp:
                 continue
             telefone = consulta.telefone_confirmacao
@@ -491,6 +449,7 @@ def init_consultas_routes(app, db):
                     .values(usado=True, consulta_id=consulta.id)
                 ).rowcount
                 db.session.commit()
+                comps_por_nome.pop(nome_norm, None)
                 if rows == 0:
                     erros.append(f'{consulta.paciente}: comprovante já utilizado')
                     continue
@@ -500,12 +459,7 @@ def init_consultas_routes(app, db):
                 consulta.data_confirmacao = datetime.utcnow()
                 db.session.commit()
                 if send_fn:
-                    t = threading.Thread(
-                        target=send_fn,
-                        args=(current_user.id, consulta.id, comp.filepath, telefone, base_url),
-                        daemon=True
-                    )
-                    t.start()
+                    send_fn(current_user.id, consulta.id, comp.filepath, telefone, base_url)
                 enviados += 1
             except Exception as e:
                 erros.append(f'{consulta.paciente}: {str(e)}')
@@ -615,16 +569,17 @@ def init_consultas_routes(app, db):
                           'Acesse Configurações no menu superior e configure o WhatsApp.', 'danger')
                     return redirect(url_for('consultas_dashboard'))
 
-                # Ler planilha
-                df = pd.read_excel(arquivo, dtype=str)
-                df = df.fillna('')
+                if not importar_consultas_task:
+                    flash('Celery não está disponível', 'danger')
+                    return redirect(request.url)
 
-                # Validar colunas obrigatórias
-                colunas_obrigatorias = ['PACIENTE', 'TIPO']
-                colunas_faltando = [c for c in colunas_obrigatorias if c not in df.columns]
+                # Validar colunas obrigatórias lendo apenas o cabeçalho
+                colunas = pd.read_excel(arquivo, dtype=str, nrows=0).columns
+                colunas_faltando = [c for c in COLUNAS_CONSULTA_OBRIGATORIAS if c not in colunas]
                 if colunas_faltando:
                     flash(f'Colunas obrigatórias faltando: {", ".join(colunas_faltando)}', 'danger')
                     return redirect(request.url)
+                arquivo.stream.seek(0)
 
                 # Criar campanha
                 campanha = CampanhaConsulta(
@@ -635,129 +590,27 @@ def init_consultas_routes(app, db):
                     hora_inicio=hora_inicio,
                     hora_fim=hora_fim,
                     tempo_entre_envios=tempo_entre_envios,
-                    status='pendente'
+                    status='processando',
+                    status_msg='Aguardando processamento...'
                 )
                 db.session.add(campanha)
-                db.session.flush()  # Para obter o ID
-
-                # Processar cada linha
-                consultas_criadas = 0
-                for idx, row in df.iterrows():
-                    try:
-                        # Criar agendamento
-                        consulta = AgendamentoConsulta(
-                            campanha_id=campanha.id,
-                            usuario_id=current_user.id,
-                            # Dados da planilha
-                            posicao=str(row.get('POSICAO', '')).strip(),
-                            cod_master=str(row.get('COD MASTER', '')).strip(),
-                            codigo_aghu=str(row.get('CODIGO AGHU', '')).strip(),
-                            paciente=str(row.get('PACIENTE', '')).strip(),
-                            telefone_cadastro=str(row.get('TELEFONE CADASTRO', '')).strip(),
-                            telefone_registro=str(row.get('TELEFONE REGISTRO', '')).strip(),
-                            data_registro=str(row.get('DATA DO REGISTRO', '')).strip(),
-                            procedencia=str(row.get('PROCEDÊNCIA', '')).strip(),
-                            medico_solicitante=str(row.get('MEDICO_SOLICITANTE', '') or row.get('MEDICO SOLICITANTE', '') or row.get('MEDICO', '')).strip(),
-                            tipo=str(row.get('TIPO', '')).strip().upper(),  # RETORNO ou INTERCONSULTA
-                            observacoes=str(row.get('OBSERVAÇÕES', '')).strip(),
-                            exames=str(row.get('EXAMES', '')).strip(),
-                            sub_especialidade=str(row.get('SUB-ESPECIALIDADE', '')).strip(),
-                            especialidade=str(row.get('ESPECIALIDADE', '')).strip(),
-                            grade_aghu=str(row.get('GRADE_AGHU', '')).strip(),
-                            prioridade=str(row.get('PRIORIDADE', '')).strip(),
-                            indicacao_data=str(row.get('INDICACAO DATA', '')).strip(),
-                            data_requisicao=str(row.get('DATA REQUISIÇÃO', '')).strip(),
-                            data_exata_ou_dias=str(row.get('DATA EXATA OU DIAS', '')).strip(),
-                            estimativa_agendamento=str(row.get('ESTIMATIVA AGENDAMENTO', '')).strip(),
-                            data_aghu=str(row.get('DATA AGHU', '')).strip(),
-                            hora_aghu=str(
-                                row.get('HORA AGHU', '')
-                                or row.get('HORA', '')
-                                or row.get('HORARIO', '')
-                                or row.get('HORÁRIO', '')
-                            ).strip(),
-                            paciente_voltar_posto_sms=str(row.get('PACIENTE_VOLTAR_POSTO_SMS', '')).strip().upper(),
-                            # Campos específicos para REMARCACAO
-                            motivo_remarcacao=str(row.get('MOTIVO_REMARCACAO', '')).strip(),
-                            data_anterior=str(row.get('DATA_ANTERIOR', '')).strip(),
-                            status='AGUARDANDO_ENVIO',
-                            # Campos de retry tracking (inicializar com valores padrão)
-                            tentativas_contato=0,
-                            data_ultima_tentativa=None,
-                            cancelado_sem_resposta=False
-                        )
-
-                        if not consulta.paciente:
-                            logger.warning(f"Linha {idx+2}: Paciente vazio, pulando")
-                            continue
-
-                        # Normalizar tipo INTERCONSULTA (aceitar variações)
-                        if 'INTERCONSULTA' in consulta.tipo:
-                            consulta.tipo = 'INTERCONSULTA'
-                            # Para INTERCONSULTA, ignorar campo EXAMES (pode conter data de registro)
-                            consulta.exames = ''
-                            logger.info(f"Linha {idx+2}: Tipo normalizado para INTERCONSULTA, campo exames ignorado")
-
-                        # Validar tipo
-                        if consulta.tipo not in ['RETORNO', 'INTERCONSULTA', 'REMARCACAO']:
-                            logger.warning(f"Linha {idx+2}: Tipo inválido '{consulta.tipo}', ajustando para RETORNO")
-                            consulta.tipo = 'RETORNO'
-
-                        db.session.add(consulta)
-                        db.session.flush()  # Para obter ID da consulta
-
-                        # Criar telefones (com formatação)
-                        # Suporta múltiplos números separados por " / " na mesma célula
-                        prioridade_atual = 1
-                        numeros_adicionados = set()  # Evitar duplicatas
-
-                        if consulta.telefone_cadastro:
-                            # Dividir por " / " caso haja múltiplos números
-                            telefones_cadastro = [t.strip() for t in consulta.telefone_cadastro.split('/')]
-                            for tel in telefones_cadastro:
-                                if tel:
-                                    numero_formatado = formatar_numero(tel)
-                                    if numero_formatado and numero_formatado not in numeros_adicionados:
-                                        tel_obj = TelefoneConsulta(
-                                            consulta_id=consulta.id,
-                                            numero=numero_formatado,
-                                            prioridade=prioridade_atual
-                                        )
-                                        db.session.add(tel_obj)
-                                        numeros_adicionados.add(numero_formatado)
-                                        prioridade_atual += 1
-
-                        if consulta.telefone_registro:
-                            # Dividir por " / " caso haja múltiplos números
-                            telefones_registro = [t.strip() for t in consulta.telefone_registro.split('/')]
-                            for tel in telefones_registro:
-                                if tel:
-                                    numero_formatado = formatar_numero(tel)
-                                    if numero_formatado and numero_formatado not in numeros_adicionados:
-                                        tel_obj = TelefoneConsulta(
-                                            consulta_id=consulta.id,
-                                            numero=numero_formatado,
-                                            prioridade=prioridade_atual
-                                        )
-                                        db.session.add(tel_obj)
-                                        numeros_adicionados.add(numero_formatado)
-                                        prioridade_atual += 1
-
-                        consultas_criadas += 1
-
-                    except Exception as e:
-                        logger.error(f"Erro ao processar linha {idx+2}: {e}")
-                        continue
-
-                # Atualizar estatísticas da campanha
-                campanha.total_consultas = consultas_criadas
-                campanha.status = 'pronta' if consultas_criadas > 0 else 'erro'
-                campanha.status_msg = f'{consultas_criadas} consultas importadas'
+                db.session.commit()
 
+                # Salvar arquivo temporário (pasta de uploads é compartilhada entre web e worker)
+                temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
+                os.makedirs(temp_dir, exist_ok=True)
+                ext = os.path.splitext(arquivo.filename)[1].lower()
+                temp_path = os.path.join(temp_dir, f'consultas_{campanha.id}_{int(time.time() * 1000)}{ext}')
+                arquivo.save(temp_path)
+
+                # Processar planilha de forma ASSÍNCRONA com Celery
+                task = importar_consultas_task.delay(temp_path, campanha.id)
+                campanha.celery_task_id = task.id
                 db.session.commit()
 
-                flash(f'Campanha criada com sucesso! {consultas_criadas} consultas importadas.', 'success')
-                return redirect(url_for('consultas_campanha_detalhe', id=campanha.id))
+                logger.info(f"Task {task.id} de importação iniciada para campanha de consultas {campanha.id}")
+
+                return redirect(url_for('consultas_importar_progresso', id=campanha.id, task_id=task.id))
 
             except Exception as e:
                 db.session.rollback()
@@ -768,6 +621,29 @@ def init_consultas_routes(app, db):
         return render_template('consultas_importar.html')
 
 
+    @app.route('/consultas/campanha/<int:id>/importacao')
+    @login_required
+    def consultas_importar_progresso(id):
+        """Página de progresso da importação da planilha de consultas"""
+        campanha = CampanhaConsulta.query.get_or_404(id)
+
+        if campanha.criador_id != current_user.id and not current_user.is_admin:
+            flash('Acesso negado', 'danger')
+            return redirect(url_for('consultas_dashboard'))
+
+        task_id = request.args.get('task_id') or campanha.celery_task_id
+        if not task_id:
+            return redirect(url_for('consultas_campanha_detalhe', id=id))
+
+        return render_template(
+            'progresso_campanha.html',
+            campanha=campanha,
+            task_id=task_id,
+            url_concluido=url_for('consultas_campanha_detalhe', id=id),
+            url_voltar=url_for('consultas_dashboard')
+        )
+
+
     # =========================================================================
     # DETALHES DA CAMPANHA
     # =========================================================================
@@ -902,6 +778,8 @@ def init_consultas_routes(app, db):
         campanha.status = 'pausado'
         campanha.status_msg = 'Pausado pelo usuário'
         db.session.commit()
+        from progresso_campanhas import invalidar_progresso
+        invalidar_progresso('consulta', campanha.id)
 
         flash('Campanha pausada', 'info')
         return redirect(url_for('consultas_campanha_detalhe', id=id))
@@ -1081,14 +959,9 @@ def init_consultas_routes(app, db):
             consulta.campanha.atualizar_stats()
             db.session.commit()
 
-            # Iniciar envio em background (OCR + mensagens + arquivo + pesquisa)
-            t = threading.Thread(
-                target=enviar_comprovante_background,
-                args=(current_user.id, consulta.id, filepath, telefone, base_url)
-            )
-            t.daemon = True
-            t.start()
-            logger.info(f"Thread de envio de comprovante iniciada para consulta {consulta.id}")
+            # Enfileirar envio (OCR + mensagens + arquivo) no worker de comprovantes
+            enviar_comprovante_background(current_user.id, consulta.id, filepath, telefone, base_url)
+            logger.info(f"Envio de comprovante enfileirado para consulta {consulta.id}")
 
             return jsonify({'sucesso': True, 'mensagem': 'Comprovante salvo! Enviando para o paciente em segundo plano...'})
 
@@ -1269,80 +1142,9 @@ _Hospital Universitário Walter Cantídio_"""
         if campanha.criador_id != current_user.id and not current_user.is_admin:
             return jsonify({'erro': 'Acesso negado'}), 403
 
-        campanha.pode_enviar_hoje()
-        db.session.commit()
-
-        ultimo_log = LogMsgConsulta.query.filter_by(
-            campanha_id=campanha.id, direcao='enviada', status='sucesso'
-        ).order_by(LogMsgConsulta.id.desc()).first()
-
-        ultimo_nome = None
-        ultimo_telefone = None
-        ultimo_quando = None
-        proximo_em_segs = None
-        if ultimo_log:
-            consulta_ult = db.session.get(AgendamentoConsulta, ultimo_log.consulta_id) if ultimo_log.consulta_id else None
-            ultimo_nome = consulta_ult.paciente if consulta_ult else None
-            ultimo_telefone = ultimo_log.telefone
-            try:
-                import pytz
-                if ultimo_log.data.tzinfo is None:
-                    dt_local = pytz.utc.localize(ultimo_log.data).astimezone(TZ_FORTALEZA)
-                else:
-                    dt_local = ultimo_log.data.astimezone(TZ_FORTALEZA)
-                ultimo_quando = dt_local.strftime('%d/%m %H:%M:%S')
-            except Exception:
-                ultimo_quando = ultimo_log.data.strftime('%d/%m %H:%M:%S')
-            if campanha.status == 'enviando' and ultimo_log.data:
-                intervalo = campanha.tempo_entre_envios or 15
-                segs_passados = (datetime.utcnow() - ultimo_log.data).total_seconds()
-                proximo_em_segs = max(int(intervalo - segs_passados), 0)
-
-        proximo_paciente = None
-        if campanha.status == 'enviando':
-            prox = AgendamentoConsulta.query.filter_by(
-                campanha_id=campanha.id, status='AGUARDANDO_ENVIO'
-            ).order_by(AgendamentoConsulta.id).first()
-            if prox:
-                telefones = [t for t in [
-                    prox.telefone_cadastro,
-                    prox.telefone_registro if prox.telefone_registro != prox.telefone_cadastro else None
-                ] if t]
-                proximo_paciente = {'nome': prox.paciente, 'telefone': ', '.join(telefones)}
-
-        erros_recentes = []
-        erros_q = LogMsgConsulta.query.filter_by(
-            campanha_id=campanha.id, status='erro'
-        ).order_by(LogMsgConsulta.id.desc()).limit(5).all()
-        for e in erros_q:
-            cons_err = db.session.get(AgendamentoConsulta, e.consulta_id) if e.consulta_id else None
-            erros_recentes.append({
-                'nome': cons_err.paciente if cons_err else '-',
-                'telefone': e.telefone or '-',
-                'erro': (e.erro or '')[:200],
-                'quando': e.data.strftime('%d/%m %H:%M') if e.data else '-',
-            })
-
-        return jsonify({
-            'status': campanha.status,
-            'status_msg': campanha.status_msg,
-            'total_consultas': campanha.total_consultas,
-            'total_enviados': campanha.total_enviados,
-            'total_confirmados': campanha.total_confirmados,
-            'total_rejeitados': campanha.total_rejeitados,
-            'total_aguardando_comprovante': campanha.total_aguardando_comprovante or 0,
-            'enviados_hoje': campanha.enviados_hoje or 0,
-            'meta_diaria': campanha.meta_diaria or 50,
-            'intervalo_segs': campanha.tempo_entre_envios or 15,
-            'ultimo_enviado': {
-                'nome': ultimo_nome,
-                'telefone': ultimo_telefone,
-                'quando': ultimo_quando,
-            } if ultimo_nome else None,
-            'proximo_paciente': proximo_paciente,
-            'proximo_em_segs': proximo_em_segs,
-            'erros_recentes': erros_recentes,
-        })
+        # Snapshot compartilhado entre as abas, com ETag/304 (ver progresso_campanhas.py)
+        from progresso_campanhas import resposta_progresso
+        return resposta_progresso('consulta', campanha.id)
 
 
     # =========================================================================
@@ -1719,73 +1521,25 @@ _Hospital Universitário Walter Cantídio_"""
     @login_required
     def pesquisas_dashboard():
         """Dashboard de pesquisas de satisfação"""
-        from sqlalchemy import func
-        
-        # Buscar pesquisas do usuário
-        pesquisas = PesquisaSatisfacao.query.filter_by(usuario_id=current_user.id).order_by(PesquisaSatisfacao.data_resposta.desc()).all()
-        
-        # Calcular estatísticas
-        total = len(pesquisas)
-        respondidas = len([p for p in pesquisas if not p.pulou])
-        puladas = len([p for p in pesquisas if p.pulou])
-        
-        # Média de notas (NPS)
-        notas = [p.nota_satisfacao for p in pesquisas if p.nota_satisfacao is not None]
-        media_nota = round(sum(notas) / len(notas), 1) if notas else 0
-        
-        # % atendimento ágil
-        atenciosos = [p for p in pesquisas if p.equipe_atenciosa is not None]
-        pct_agil = round(len([p for p in atenciosos if p.equipe_atenciosa]) / len(atenciosos) * 100, 1) if atenciosos else 0
-        
-        # Comentários recentes
-        comentarios = [p for p in pesquisas if p.comentario and len(p.comentario.strip()) > 0][:10]
-        
-        # Especialidades para filtro
-        especialidades = list(set([p.especialidade for p in pesquisas if p.especialidade]))
-        especialidades.sort()
-        
-        return render_template('pesquisas_dashboard.html',
-            pesquisas=pesquisas,
-            total=total,
-            respondidas=respondidas,
-            puladas=puladas,
-            media_nota=media_nota,
-            pct_agil=pct_agil,
-            comentarios=comentarios,
-            especialidades=especialidades
-        )
+        from dashboard_pesquisas import dados_dashboard_pesquisas
+
+        return render_template('pesquisas_dashboard.html', **dados_dashboard_pesquisas(
+            current_user.id,
+            especialidade=request.args.get('especialidade', '').strip() or None,
+            apos=request.args.get('apos'),
+            antes=request.args.get('antes')
+        ))
 
     @app.route('/api/consultas/pesquisas/export')
     @login_required
     def pesquisas_export_csv():
         """Exportar pesquisas para CSV"""
-        import csv
-        from io import StringIO
-        
-        pesquisas = PesquisaSatisfacao.query.filter_by(usuario_id=current_user.id).order_by(PesquisaSatisfacao.data_resposta.desc()).all()
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Header
-        writer.writerow(['Data', 'Especialidade', 'Tipo', 'Nota', 'Equipe Ágil', 'Comentário', 'Pulou'])
-        
-        for p in pesquisas:
-            writer.writerow([
-                p.data_resposta.strftime('%d/%m/%Y %H:%M') if p.data_resposta else '',
-                p.especialidade or '',
-                p.tipo_agendamento or '',
-                p.nota_satisfacao or '',
-                'Sim' if p.equipe_atenciosa else ('Não' if p.equipe_atenciosa is False else ''),
-                p.comentario or '',
-                'Sim' if p.pulou else 'Não'
-            ])
-        
-        output.seek(0)
-        
-        from flask import Response
+        from flask import Response, stream_with_context
+        from dashboard_pesquisas import linhas_csv_pesquisas
+
+        especialidade = request.args.get('especialidade', '').strip() or None
         return Response(
-            output.getvalue(),
+            stream_with_context(linhas_csv_pesquisas(current_user.id, especialidade)),
             mimetype='text/csv',
             headers={'Content-Disposition': 'attachment; filename=pesquisas_satisfacao.csv'}
         )
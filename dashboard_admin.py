@@ -0,0 +1,496 @@
+"""
+=============================================================================
+DASHBOARD ADMINISTRATIVO - SNAPSHOT PRÉ-CALCULADO
+=============================================================================
+As ~40 agregações do /admin/dashboard (usuários, campanhas dos três modos,
+pesquisas, desempenho por usuário) são calculadas pela
+task tasks.atualizar_snapshots_dashboard a cada 5 minutos e gravadas em
+snapshots_dashboard, uma linha por modo. A página faz uma única leitura.
+As séries de 30 dias vêm de daily_metrics (ver metricas_diarias.py).
+
+Se o snapshot não existir ou estiver mais velho que SNAPSHOT_TTL (beat
+parado), ele é recalculado na própria requisição; ?atualizar=1 força o
+recálculo sob demanda. Só uma requisição por modo recalcula (trava SET NX no
+Redis, ou lock do processo com o Redis fora); as demais servem o snapshot
+antigo ou, se ainda não há nenhum, esperam o da que está recalculando.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from cache_redis import obter_redis, marcar_indisponivel
+
+logger = logging.getLogger(__name__)
+
+MODOS_DASHBOARD = ('todos', 'consulta', 'fila', 'scih')
+
+# Idade máxima do snapshot antes de recalcular na requisição (3 ciclos da task)
+SNAPSHOT_TTL = timedelta(minutes=15)
+
+# Validade da trava de recálculo (segundos): bem acima do recálculo mais lento,
+# só para não ficar presa se o processo morrer no meio
+TRAVA_RECALCULO_TTL = 300
+
+# Sem snapshot nenhum e outra requisição recalculando: quanto esperar por ele
+ESPERA_SNAPSHOT = 30
+
+_travas_locais = {modo: threading.Lock() for modo in MODOS_DASHBOARD}
+
+
+def _valor(v):
+    """Converte Decimal (SUM/AVG no PostgreSQL) em int/float serializável"""
+    if isinstance(v, Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    return v
+
+
+def _linhas(rows):
+    """Resultado de query agregada -> lista de dicts (o template acessa por atributo)"""
+    return [{k: _valor(v) for k, v in row._mapping.items()} for row in rows]
+
+
+# =============================================================================
+# CÁLCULO
+# =============================================================================
+
+def calcular_dashboard_geral():
+    """Métricas que não dependem do modo selecionado"""
+    from sqlalchemy import func, case
+    from metricas_diarias import series_diarias
+    from app import (
+        db, Usuario, Campanha, Contato, LogMsg, CampanhaConsulta, AgendamentoConsulta,
+        LogMsgConsulta, PesquisaSatisfacao, CampanhaSCIH, PacienteSCIH, RespostaSCIH
+    )
+
+    d = {}
+
+    # =====================================================================
+    # USUÁRIOS
+    # =====================================================================
+    d['usuarios_admin'] = Usuario.query.filter_by(is_admin=True).count()
+    d['usuarios_fila'] = Usuario.query.filter_by(tipo_sistema='BUSCA_ATIVA').count()
+    d['usuarios_consulta'] = Usuario.query.filter_by(tipo_sistema='AGENDAMENTO_CONSULTA').count()
+
+    # =====================================================================
+    # MODO FILA (BUSCA_ATIVA)
+    # =====================================================================
+    d['total_campanhas_fila'] = Campanha.query.count()
+    d['campanhas_fila_ativas'] = Campanha.query.filter(Campanha.status.in_(['validando', 'pronta', 'enviando'])).count()
+
+    stats_fila = db.session.query(
+        func.coalesce(func.sum(Campanha.total_contatos), 0).label('total_contatos'),
+        func.coalesce(func.sum(Campanha.total_enviados), 0).label('total_enviados'),
+        func.coalesce(func.sum(Campanha.total_confirmados), 0).label('total_confirmados'),
+        func.coalesce(func.sum(Campanha.total_rejeitados), 0).label('total_rejeitados'),
+        func.coalesce(func.sum(Campanha.total_erros), 0).label('total_erros')
+    ).first()
+
+    d['fila_total_contatos'] = _valor(stats_fila.total_contatos or 0)
+    d['fila_total_enviados'] = _valor(stats_fila.total_enviados or 0)
+    d['fila_total_confirmados'] = _valor(stats_fila.total_confirmados or 0)
+    d['fila_total_rejeitados'] = _valor(stats_fila.total_rejeitados or 0)
+    d['fila_total_erros'] = _valor(stats_fila.total_erros or 0)
+    d['fila_taxa_confirmacao'] = round(
+        (d['fila_total_confirmados'] / d['fila_total_enviados'] * 100), 1
+    ) if d['fila_total_enviados'] > 0 else 0
+
+    # =====================================================================
+    # MODO CONSULTA (AGENDAMENTO_CONSULTA)
+    # =====================================================================
+    d['total_campanhas_consulta'] = CampanhaConsulta.query.count()
+    d['campanhas_consulta_ativas'] = CampanhaConsulta.query.filter(CampanhaConsulta.status.in_(['pronta', 'enviando'])).count()
+
+    stats_consulta = db.session.query(
+        func.coalesce(func.sum(CampanhaConsulta.total_consultas), 0).label('total_consultas'),
+        func.coalesce(func.sum(CampanhaConsulta.total_enviados), 0).label('total_enviados'),
+        func.coalesce(func.sum(CampanhaConsulta.total_confirmados), 0).label('total_confirmados'),
+        func.coalesce(func.sum(CampanhaConsulta.total_rejeitados), 0).label('total_rejeitados')
+    ).first()
+
+    d['consulta_total'] = _valor(stats_consulta.total_consultas or 0)
+    d['consulta_enviados'] = _valor(stats_consulta.total_enviados or 0)
+    d['consulta_confirmados'] = _valor(stats_consulta.total_confirmados or 0)
+    d['consulta_rejeitados'] = _valor(stats_consulta.total_rejeitados or 0)
+    d['consulta_taxa_confirmacao'] = round(
+        (d['consulta_confirmados'] / d['consulta_enviados'] * 100), 1
+    ) if d['consulta_enviados'] > 0 else 0
+
+    # =====================================================================
+    # MODO SCIH (PESQUISA_SCIH)
+    # =====================================================================
+    d['total_campanhas_scih'] = CampanhaSCIH.query.count()
+    d['campanhas_scih_ativas'] = CampanhaSCIH.query.filter(CampanhaSCIH.status.in_(['enviando', 'pausado'])).count()
+    d['usuarios_scih'] = Usuario.query.filter_by(tipo_sistema='PESQUISA_SCIH').count()
+
+    d['scih_total_pacientes'] = db.session.query(func.coalesce(func.count(PacienteSCIH.id), 0)).scalar() or 0
+    d['scih_total_enviados'] = PacienteSCIH.query.filter(
+        PacienteSCIH.status.in_(['ENVIADO', 'RESPONDIDO', 'SEM_RESPOSTA'])
+    ).count()
+    d['scih_total_respondidos'] = PacienteSCIH.query.filter_by(status='RESPONDIDO').count()
+    d['scih_total_sem_resposta'] = PacienteSCIH.query.filter_by(status='SEM_RESPOSTA').count()
+    d['scih_total_erros'] = PacienteSCIH.query.filter_by(status='ERRO').count()
+    d['scih_taxa_resposta'] = round(
+        (d['scih_total_respondidos'] / d['scih_total_enviados'] * 100), 1
+    ) if d['scih_total_enviados'] > 0 else 0
+
+    d['scih_com_sintoma'] = RespostaSCIH.query.filter_by(apresentou_sintoma=True).count()
+    d['scih_buscou_atendimento'] = RespostaSCIH.query.filter_by(buscou_atendimento=True).count()
+    d['scih_usou_remedio'] = RespostaSCIH.query.filter_by(usou_remedio=True).count()
+
+    # =====================================================================
+    # AGENDAMENTO DE CONSULTAS - DETALHES
+    # =====================================================================
+    d['total_disparos_msg1'] = AgendamentoConsulta.query.filter_by(mensagem_enviada=True).count()
+    d['total_comprovantes_enviados'] = AgendamentoConsulta.query.filter_by(status='CONFIRMADO').count()
+    d['total_aguardando_comprovante'] = AgendamentoConsulta.query.filter_by(status='AGUARDANDO_COMPROVANTE').count()
+    d['total_cancelados'] = AgendamentoConsulta.query.filter_by(status='CANCELADO').count()
+
+    # =====================================================================
+    # MENSAGENS E CONFIRMAÇÃO POR USUÁRIO
+    # =====================================================================
+    d['msgs_por_usuario_consulta'] = _linhas(db.session.query(
+        Usuario.nome,
+        Usuario.id.label('usuario_id'),
+        func.count(LogMsgConsulta.id).label('total_msgs'),
+        func.sum(case((LogMsgConsulta.direcao == 'enviada', 1), else_=0)).label('enviadas'),
+        func.sum(case((LogMsgConsulta.direcao == 'recebida', 1), else_=0)).label('recebidas')
+    ).join(CampanhaConsulta, CampanhaConsulta.id == LogMsgConsulta.campanha_id
+    ).join(Usuario, Usuario.id == CampanhaConsulta.criador_id
+    ).group_by(Usuario.id, Usuario.nome
+    ).order_by(func.count(LogMsgConsulta.id).desc()
+    ).limit(15).all())
+
+    d['msgs_por_usuario_fila'] = _linhas(db.session.query(
+        Usuario.nome,
+        Usuario.id.label('usuario_id'),
+        func.count(LogMsg.id).label('total_msgs'),
+        func.sum(case((LogMsg.direcao == 'enviada', 1), else_=0)).label('enviadas'),
+        func.sum(case((LogMsg.direcao == 'recebida', 1), else_=0)).label('recebidas')
+    ).join(Campanha, Campanha.id == LogMsg.campanha_id
+    ).join(Usuario, Usuario.id == Campanha.criador_id
+    ).group_by(Usuario.id, Usuario.nome
+    ).order_by(func.count(LogMsg.id).desc()
+    ).limit(15).all())
+
+    d['confirmacao_por_usuario'] = _linhas(db.session.query(
+        Usuario.nome,
+        func.count(AgendamentoConsulta.id).label('total'),
+        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('confirmados'),
+        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados'),
+        func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).label('enviados')
+    ).join(CampanhaConsulta, CampanhaConsulta.id == AgendamentoConsulta.campanha_id
+    ).join(Usuario, Usuario.id == CampanhaConsulta.criador_id
+    ).group_by(Usuario.id, Usuario.nome
+    ).having(func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)) > 0
+    ).order_by(func.count(AgendamentoConsulta.id).desc()
+    ).limit(15).all())
+
+    # =====================================================================
+    # PESQUISAS DE SATISFAÇÃO
+    # =====================================================================
+    d['total_pesquisas'] = PesquisaSatisfacao.query.count()
+    d['pesquisas_respondidas'] = PesquisaSatisfacao.query.filter(PesquisaSatisfacao.nota_satisfacao.isnot(None)).count()
+    d['pesquisas_puladas'] = PesquisaSatisfacao.query.filter_by(pulou=True).count()
+
+    media_nota = db.session.query(func.avg(PesquisaSatisfacao.nota_satisfacao)).filter(
+        PesquisaSatisfacao.nota_satisfacao.isnot(None)
+    ).scalar() or 0
+    d['media_nota'] = round(float(media_nota), 1)
+
+    total_com_resposta_atenciosa = PesquisaSatisfacao.query.filter(PesquisaSatisfacao.equipe_atenciosa.isnot(None)).count()
+    equipe_atenciosa_sim = PesquisaSatisfacao.query.filter_by(equipe_atenciosa=True).count()
+    d['pct_atenciosa'] = round(
+        (equipe_atenciosa_sim / total_com_resposta_atenciosa * 100), 1
+    ) if total_com_resposta_atenciosa > 0 else 0
+
+    distribuicao_notas = db.session.query(
+        PesquisaSatisfacao.nota_satisfacao,
+        func.count(PesquisaSatisfacao.id)
+    ).filter(PesquisaSatisfacao.nota_satisfacao.isnot(None)
+    ).group_by(PesquisaSatisfacao.nota_satisfacao
+    ).order_by(PesquisaSatisfacao.nota_satisfacao
+    ).all()
+    d['notas_labels'] = [str(n[0]) for n in distribuicao_notas]
+    d['notas_data'] = [n[1] for n in distribuicao_notas]
+
+    comentarios = db.session.query(
+        PesquisaSatisfacao.nota_satisfacao,
+        PesquisaSatisfacao.especialidade,
+        PesquisaSatisfacao.comentario,
+        PesquisaSatisfacao.data_resposta,
+        AgendamentoConsulta.paciente
+    ).join(AgendamentoConsulta, AgendamentoConsulta.id == PesquisaSatisfacao.consulta_id
+    ).filter(
+        PesquisaSatisfacao.comentario.isnot(None),
+        PesquisaSatisfacao.comentario != ''
+    ).order_by(PesquisaSatisfacao.data_resposta.desc()
+    ).limit(20).all()
+    # Pares (pesquisa, paciente), como o template espera
+    d['comentarios_recentes'] = [
+        [{
+            'nota_satisfacao': c.nota_satisfacao,
+            'especialidade': c.especialidade,
+            'comentario': c.comentario,
+            'data_resposta': c.data_resposta.strftime('%d/%m/%Y %H:%M') if c.data_resposta else None,
+        }, c.paciente]
+        for c in comentarios
+    ]
+
+    d['total_comentarios'] = db.session.query(func.count(PesquisaSatisfacao.id)).filter(
+        PesquisaSatisfacao.comentario.isnot(None),
+        PesquisaSatisfacao.comentario != ''
+    ).scalar() or 0
+
+    # =====================================================================
+    # GRÁFICOS - EVOLUÇÃO DIÁRIA (últimos 30 dias, de daily_metrics)
+    # =====================================================================
+    d['dias_labels'], series = series_diarias('consulta', ('msg1_enviadas', 'comprovantes_enviados', 'rejeitados'))
+    d['msg1_data'] = series['msg1_enviadas']
+    d['comprovantes_data'] = series['comprovantes_enviados']
+    d['rejeitados_data'] = series['rejeitados']
+
+    d['fila_dias_labels'], series = series_diarias('fila', ('enviadas', 'confirmados', 'rejeitados'))
+    d['fila_enviados_data'] = series['enviadas']
+    d['fila_confirmados_data'] = series['confirmados']
+    d['fila_rejeitados_data'] = series['rejeitados']
+
+    fila_status_counts = db.session.query(
+        Contato.status,
+        func.count(Contato.id).label('total')
+    ).group_by(Contato.status).all()
+    d['fila_status_labels'] = [r.status or 'pendente' for r in fila_status_counts]
+    d['fila_status_data'] = [r.total for r in fila_status_counts]
+
+    # =====================================================================
+    # ESPECIALIDADES
+    # =====================================================================
+    d['especialidades_top'] = _linhas(db.session.query(
+        AgendamentoConsulta.especialidade,
+        func.count(AgendamentoConsulta.id).label('total'),
+        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('confirmados'),
+        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados')
+    ).filter(AgendamentoConsulta.especialidade.isnot(None)
+    ).group_by(AgendamentoConsulta.especialidade
+    ).order_by(func.count(AgendamentoConsulta.id).desc()
+    ).limit(10).all())
+
+    d['notas_por_especialidade'] = _linhas(db.session.query(
+        PesquisaSatisfacao.especialidade,
+        func.avg(PesquisaSatisfacao.nota_satisfacao).label('media_nota'),
+        func.count(PesquisaSatisfacao.id).label('total_respostas'),
+        func.sum(case((PesquisaSatisfacao.equipe_atenciosa == True, 1), else_=0)).label('atenciosa_sim'),
+        func.count(case((PesquisaSatisfacao.equipe_atenciosa.isnot(None), 1))).label('total_atenciosa')
+    ).filter(
+        PesquisaSatisfacao.especialidade.isnot(None),
+        PesquisaSatisfacao.nota_satisfacao.isnot(None)
+    ).group_by(PesquisaSatisfacao.especialidade
+    ).order_by(func.count(PesquisaSatisfacao.id).desc()
+    ).limit(20).all())
+
+    # =====================================================================
+    # TOTAIS GERAIS DO SISTEMA
+    # =====================================================================
+    d['total_msgs_sistema'] = LogMsgConsulta.query.count() + LogMsg.query.count()
+    d['total_campanhas'] = d['total_campanhas_fila'] + d['total_campanhas_consulta']
+    d['total_enviados'] = d['fila_total_enviados'] + d['consulta_enviados']
+    d['total_confirmados'] = d['fila_total_confirmados'] + d['consulta_confirmados']
+    d['taxa_confirmacao_geral'] = round(
+        (d['total_confirmados'] / d['total_enviados'] * 100), 1
+    ) if d['total_enviados'] > 0 else 0
+
+    # Listas de usuários para exportação
+    d['usuarios_export'] = [
+        {'id': u.id, 'nome': u.nome}
+        for u in db.session.query(Usuario.id, Usuario.nome).filter_by(tipo_sistema='AGENDAMENTO_CONSULTA').order_by(Usuario.nome)
+    ]
+    d['usuarios_fila_export'] = [
+        {'id': u.id, 'nome': u.nome}
+        for u in db.session.query(Usuario.id, Usuario.nome).filter_by(tipo_sistema='BUSCA_ATIVA').order_by(Usuario.nome)
+    ]
+
+    return d
+
+
+def calcular_dashboard_modo(modo):
+    """Métricas filtradas pelo modo selecionado ('consulta', 'fila', 'scih' ou 'todos')"""
+    from sqlalchemy import func, case
+    from app import db, Usuario, CampanhaConsulta, AgendamentoConsulta, PesquisaSatisfacao
+
+    tipos = {'consulta': 'AGENDAMENTO_CONSULTA', 'fila': 'BUSCA_ATIVA', 'scih': 'PESQUISA_SCIH'}
+    d = {'modo_selecionado': modo}
+
+    usuarios = Usuario.query
+    if modo in tipos:
+        usuarios = usuarios.filter_by(tipo_sistema=tipos[modo])
+    d['total_usuarios'] = usuarios.count()
+    d['usuarios_ativos'] = usuarios.filter_by(ativo=True).count()
+
+    # Desempenho por usuário (modo consulta); o filtro vale só para consulta/fila
+    desempenho_query = db.session.query(
+        Usuario.id,
+        Usuario.nome,
+        Usuario.tipo_sistema,
+        func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).label('disparos_msg1'),
+        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('comprovantes_enviados'),
+        func.sum(case((AgendamentoConsulta.status == 'AGUARDANDO_COMPROVANTE', 1), else_=0)).label('aguardando_comprovante'),
+        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados'),
+        func.sum(case((AgendamentoConsulta.status == 'CANCELADO', 1), else_=0)).label('cancelados'),
+        func.count(AgendamentoConsulta.id).label('total_agendamentos')
+    ).join(CampanhaConsulta, CampanhaConsulta.criador_id == Usuario.id
+    ).join(AgendamentoConsulta, AgendamentoConsulta.campanha_id == CampanhaConsulta.id
+    )
+
+    stats_query = db.session.query(
+        Usuario.id,
+        Usuario.nome,
+        Usuario.tipo_sistema,
+        func.count(func.distinct(CampanhaConsulta.id)).label('campanhas_criadas'),
+        func.count(AgendamentoConsulta.id).label('total_agendamentos'),
+        func.sum(case((AgendamentoConsulta.status == 'CONFIRMADO', 1), else_=0)).label('confirmados'),
+        func.sum(case((AgendamentoConsulta.status == 'REJEITADO', 1), else_=0)).label('rejeitados'),
+        func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).label('enviados'),
+        func.count(PesquisaSatisfacao.id).label('total_pesquisas'),
+        func.avg(PesquisaSatisfacao.nota_satisfacao).label('media_nota_usuario')
+    ).outerjoin(CampanhaConsulta, CampanhaConsulta.criador_id == Usuario.id
+    ).outerjoin(AgendamentoConsulta, AgendamentoConsulta.campanha_id == CampanhaConsulta.id
+    ).outerjoin(PesquisaSatisfacao, PesquisaSatisfacao.consulta_id == AgendamentoConsulta.id
+    )
+
+    if modo in ('consulta', 'fila'):
+        desempenho_query = desempenho_query.filter(Usuario.tipo_sistema == tipos[modo])
+        stats_query = stats_query.filter(Usuario.tipo_sistema == tipos[modo])
+
+    d['desempenho_usuarios'] = _linhas(desempenho_query.group_by(Usuario.id, Usuario.nome, Usuario.tipo_sistema
+    ).having(func.count(AgendamentoConsulta.id) > 0
+    ).order_by(func.sum(case((AgendamentoConsulta.mensagem_enviada == True, 1), else_=0)).desc()
+    ).all())
+
+    d['stats_detalhadas_usuario'] = _linhas(stats_query.group_by(Usuario.id, Usuario.nome, Usuario.tipo_sistema
+    ).having(func.count(AgendamentoConsulta.id) > 0
+    ).order_by(func.count(AgendamentoConsulta.id).desc()
+    ).limit(20).all())
+
+    return d
+
+
+# =============================================================================
+# SNAPSHOT
+# =============================================================================
+
+def _chave(modo):
+    return f'admin:{modo}'
+
+
+def salvar_snapshot(modo, dados, tempo_ms):
+    """Grava (ou substitui) o snapshot do modo"""
+    from sqlalchemy.exc import IntegrityError
+    from app import db, SnapshotDashboard
+
+    agora = datetime.utcnow()
+    dados_json = json.dumps(dados, ensure_ascii=False)
+    snapshot = SnapshotDashboard.query.filter_by(chave=_chave(modo)).first()
+    if snapshot:
+        snapshot.dados_json = dados_json
+        snapshot.gerado_em = agora
+        snapshot.tempo_ms = tempo_ms
+    else:
+        db.session.add(SnapshotDashboard(chave=_chave(modo), dados_json=dados_json, gerado_em=agora, tempo_ms=tempo_ms))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo criou o snapshot ao mesmo tempo: o dele vale
+        db.session.rollback()
+    return agora
+
+
+def atualizar_snapshots(modos=MODOS_DASHBOARD):
+    """Recalcula e grava os snapshots (métricas gerais calculadas uma vez só)"""
+    inicio = time.time()
+    geral = calcular_dashboard_geral()
+    tempo_geral = time.time() - inicio
+
+    resultado = {}
+    for modo in modos:
+        inicio_modo = time.time()
+        dados = dict(geral, **calcular_dashboard_modo(modo))
+        tempo_ms = int((tempo_geral + time.time() - inicio_modo) * 1000)
+        resultado[modo] = (dados, salvar_snapshot(modo, dados, tempo_ms))
+    logger.info(f"Snapshots do dashboard admin atualizados ({', '.join(modos)}) em {time.time() - inicio:.1f}s")
+    return resultado
+
+
+def _adquirir_trava(modo):
+    """
+    Trava do recálculo do modo na requisição: SET NX no Redis (vale para
+    todos os processos) ou, com o Redis fora, um lock do próprio processo.
+
+    Returns:
+        função que libera a trava, ou None se outra requisição já recalcula
+    """
+    r = obter_redis()
+    if r is not None:
+        chave = f'dashboard_admin:recalculo:{modo}'
+        try:
+            if not r.set(chave, '1', nx=True, ex=TRAVA_RECALCULO_TTL):
+                return None
+
+            def liberar():
+                try:
+                    r.delete(chave)
+                except Exception as e:
+                    marcar_indisponivel(e)
+            return liberar
+        except Exception as e:
+            marcar_indisponivel(e)
+
+    trava = _travas_locais[modo]
+    return trava.release if trava.acquire(blocking=False) else None
+
+
+def _ler_snapshot(modo):
+    from app import SnapshotDashboard
+    return SnapshotDashboard.query.filter_by(chave=_chave(modo)).first()
+
+
+def obter_dashboard(modo, forcar=False):
+    """
+    Dados do dashboard do modo: do snapshot, ou recalculados se não houver
+    snapshot, se ele passou de SNAPSHOT_TTL ou se forcar=True.
+
+    Se outra requisição já está recalculando o modo, devolve o snapshot
+    existente (mesmo expirado) em vez de recalcular de novo.
+
+    Returns:
+        (dados, gerado_em) - gerado_em em UTC
+    """
+    if modo not in MODOS_DASHBOARD:
+        modo = 'todos'
+
+    snapshot = None
+    if not forcar:
+        snapshot = _ler_snapshot(modo)
+        if snapshot and datetime.utcnow() - snapshot.gerado_em <= SNAPSHOT_TTL:
+            return json.loads(snapshot.dados_json), snapshot.gerado_em
+
+    liberar = _adquirir_trava(modo)
+    if liberar is None:
+        snapshot = snapshot or _ler_snapshot(modo)
+        fim = time.time() + ESPERA_SNAPSHOT
+        while snapshot is None and time.time() < fim:
+            time.sleep(1)
+            snapshot = _ler_snapshot(modo)
+        if snapshot:
+            return json.loads(snapshot.dados_json), snapshot.gerado_em
+        logger.warning(f"Snapshot do dashboard admin ({modo}) não ficou pronto em {ESPERA_SNAPSHOT}s, recalculando")
+    elif not forcar:
+        logger.warning(f"Snapshot do dashboard admin ({modo}) ausente ou expirado, recalculando")
+
+    try:
+        return atualizar_snapshots((modo,))[modo]
+    finally:
+        if liberar:
+            liberar()
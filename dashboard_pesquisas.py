@@ -0,0 +1,148 @@
+"""
+=============================================================================
+PESQUISAS DE SATISFAÇÃO - DASHBOARD E EXPORTAÇÃO
+=============================================================================
+/consultas/pesquisas não carrega mais todas as pesquisas do usuário:
+
+- Cartões (total, puladas, nota média, % ágil, comentários) vêm de uma
+  única consulta agregada.
+- A lista de respostas é paginada por keyset em (data_resposta, id), mais
+  recentes primeiro (paginacao_keyset.py), e filtrada por especialidade
+  no banco.
+- As especialidades do filtro saem de um DISTINCT atendido pelo índice
+  (usuario_id, especialidade, data_resposta, id), o mesmo usado pela lista
+  filtrada; a lista sem filtro usa (usuario_id, data_resposta, id).
+- O CSV é gerado em streaming, em lotes, sem montar o arquivo em memória.
+"""
+
+import csv
+import logging
+from io import StringIO
+
+from paginacao_keyset import pagina_por_data
+
+logger = logging.getLogger(__name__)
+
+POR_PAGINA = 50
+
+# Comentários exibidos no card "Comentários Recentes"
+LIMITE_COMENTARIOS = 10
+
+# Linhas buscadas por lote na exportação
+LOTE_EXPORTACAO = 1000
+
+
+def _tem_comentario():
+    from sqlalchemy import func
+    from app import PesquisaSatisfacao
+    return func.length(func.trim(PesquisaSatisfacao.comentario)) > 0
+
+
+def estatisticas_pesquisas(usuario_id):
+    """Totais, nota média, % atendimento ágil e nº de comentários em uma consulta"""
+    from sqlalchemy import func, case
+    from app import db, PesquisaSatisfacao as P
+
+    row = db.session.query(
+        func.count(P.id).label('total'),
+        func.coalesce(func.sum(case((P.pulou.is_(True), 1), else_=0)), 0).label('puladas'),
+        func.avg(P.nota_satisfacao).label('media_nota'),
+        func.count(P.equipe_atenciosa).label('avaliaram_equipe'),
+        func.coalesce(func.sum(case((P.equipe_atenciosa.is_(True), 1), else_=0)), 0).label('agil'),
+        func.coalesce(func.sum(case((_tem_comentario(), 1), else_=0)), 0).label('comentarios')
+    ).filter(P.usuario_id == usuario_id).one()
+
+    total = int(row.total or 0)
+    puladas = int(row.puladas or 0)
+    avaliaram = int(row.avaliaram_equipe or 0)
+    return {
+        'total': total,
+        'respondidas': total - puladas,
+        'puladas': puladas,
+        'media_nota': round(float(row.media_nota), 1) if row.media_nota is not None else 0,
+        'pct_agil': round(int(row.agil or 0) / avaliaram * 100, 1) if avaliaram else 0,
+        'total_comentarios': int(row.comentarios or 0),
+    }
+
+
+def comentarios_recentes(usuario_id, limite=LIMITE_COMENTARIOS):
+    from app import PesquisaSatisfacao as P
+    return P.query.filter(P.usuario_id == usuario_id, _tem_comentario()).order_by(
+        P.data_resposta.desc(), P.id.desc()
+    ).limit(limite).all()
+
+
+def especialidades_pesquisas(usuario_id):
+    """Especialidades distintas do usuário, em ordem alfabética"""
+    from app import db, PesquisaSatisfacao as P
+    rows = db.session.query(P.especialidade).filter(
+        P.usuario_id == usuario_id, P.especialidade.isnot(None), P.especialidade != ''
+    ).distinct().order_by(P.especialidade).all()
+    return [r[0] for r in rows]
+
+
+def _consulta(usuario_id, especialidade=None):
+    from app import PesquisaSatisfacao as P
+    q = P.query.filter(P.usuario_id == usuario_id)
+    if especialidade:
+        q = q.filter(P.especialidade == especialidade)
+    return q
+
+
+def pagina_pesquisas(usuario_id, especialidade=None, apos=None, antes=None, por_pagina=POR_PAGINA):
+    """
+    Uma página de respostas, mais recentes primeiro.
+
+    Args:
+        apos: cursor da última linha da página anterior (avançar)
+        antes: cursor da primeira linha da página seguinte (voltar)
+    """
+    from app import PesquisaSatisfacao as P
+    return pagina_por_data(_consulta(usuario_id, especialidade), P.data_resposta, P.id, apos, antes, por_pagina)
+
+
+def dados_dashboard_pesquisas(usuario_id, especialidade=None, apos=None, antes=None):
+    """Contexto do template pesquisas_dashboard.html"""
+    return {
+        **estatisticas_pesquisas(usuario_id),
+        'comentarios': comentarios_recentes(usuario_id),
+        'especialidades': especialidades_pesquisas(usuario_id),
+        'especialidade': especialidade or '',
+        'pesquisas': pagina_pesquisas(usuario_id, especialidade, apos=apos, antes=antes),
+    }
+
+
+def linhas_csv_pesquisas(usuario_id, especialidade=None):
+    """Gera o CSV linha a linha (cabeçalho incluso), lendo as pesquisas em lotes"""
+    from app import db, PesquisaSatisfacao as P
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    def linha(valores):
+        writer.writerow(valores)
+        texto = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return texto
+
+    yield linha(['Data', 'Especialidade', 'Tipo', 'Nota', 'Equipe Ágil', 'Comentário', 'Pulou'])
+
+    q = db.session.query(
+        P.data_resposta, P.especialidade, P.tipo_agendamento, P.nota_satisfacao,
+        P.equipe_atenciosa, P.comentario, P.pulou
+    ).filter(P.usuario_id == usuario_id)
+    if especialidade:
+        q = q.filter(P.especialidade == especialidade)
+    q = q.order_by(P.data_resposta.desc(), P.id.desc()).execution_options(yield_per=LOTE_EXPORTACAO)
+
+    for p in q:
+        yield linha([
+            p.data_resposta.strftime('%d/%m/%Y %H:%M') if p.data_resposta else '',
+            p.especialidade or '',
+            p.tipo_agendamento or '',
+            p.nota_satisfacao or '',
+            'Sim' if p.equipe_atenciosa else ('Não' if p.equipe_atenciosa is False else ''),
+            p.comentario or '',
+            'Sim' if p.pulou else 'Não'
+        ])
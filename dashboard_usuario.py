@@ -0,0 +1,66 @@
+"""
+=============================================================================
+DASHBOARD DO USUÁRIO (MODO FILA) - SOMENTE LEITURA
+=============================================================================
+O /dashboard não recalcula nada: lê os contadores gravados em cada campanha
+(total_contatos, total_enviados, total_confirmados...), mantidos por
+Campanha.atualizar_stats() nos pontos de escrita (envio, webhook,
+confirmação/rejeição manual, importação da planilha).
+
+Os totais do usuário saem de uma única consulta agrupada sobre esses
+contadores, e o estado do WhatsApp é o último gravado em
+config_whatsapp.conectado (atualizado pelo webhook CONNECTION_UPDATE e a cada
+verificação feita por WhatsApp.conectado()), sem chamada à Evolution API.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def campanhas_usuario(usuario_id):
+    """Campanhas do usuário, mais recentes primeiro, com os contadores gravados"""
+    from app import Campanha
+    return Campanha.query.filter_by(criador_id=usuario_id).order_by(Campanha.data_criacao.desc()).all()
+
+
+def totais_usuario(usuario_id):
+    """Totais das campanhas do usuário em uma consulta (SUM dos contadores)"""
+    from sqlalchemy import func
+    from app import db, Campanha
+
+    row = db.session.query(
+        func.count(Campanha.id).label('campanhas'),
+        func.coalesce(func.sum(Campanha.total_contatos), 0).label('contatos'),
+        func.coalesce(func.sum(Campanha.total_confirmados), 0).label('confirmados'),
+        func.coalesce(func.sum(Campanha.total_rejeitados), 0).label('rejeitados')
+    ).filter(Campanha.criador_id == usuario_id).group_by(Campanha.criador_id).first()
+
+    if not row:
+        return {'campanhas': 0, 'contatos': 0, 'confirmados': 0, 'rejeitados': 0}
+    return {k: int(v or 0) for k, v in row._mapping.items()}
+
+
+def estado_whatsapp(usuario_id):
+    """
+    (ativo, conectado) a partir da configuração gravada, sem consultar a
+    Evolution API e sem criar a ConfigWhatsApp do usuário.
+    """
+    from app import ConfigGlobal, ConfigWhatsApp
+
+    cfg_global = ConfigGlobal.get()
+    ativo = bool(cfg_global.ativo and cfg_global.evolution_api_url and cfg_global.evolution_api_key)
+    cfg_user = ConfigWhatsApp.query.filter_by(usuario_id=usuario_id).first()
+    conectado = bool(ativo and cfg_user and cfg_user.conectado)
+    return ativo, conectado
+
+
+def dados_dashboard(usuario_id):
+    """Contexto do template dashboard.html"""
+    ativo, conectado = estado_whatsapp(usuario_id)
+    return {
+        'campanhas': campanhas_usuario(usuario_id),
+        'stats': totais_usuario(usuario_id),
+        'whatsapp_ativo': ativo,
+        'whatsapp_conectado': conectado,
+    }
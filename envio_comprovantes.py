@@ -0,0 +1,249 @@
+"""
+=============================================================================
+ENVIO DE COMPROVANTES - MODO CONSULTA
+=============================================================================
+Envio do comprovante ao paciente (OCR + mensagem + arquivo + histórico).
+
+Executado pela task tasks.enviar_comprovante_task na fila dedicada
+"comprovantes" (worker com concorrência baixa), nunca dentro do processo web.
+O andamento fica em AgendamentoConsulta.envio_comprovante_status:
+
+    PENDENTE -> ENVIANDO -> MENSAGEM_ENVIADA -> ENVIADO
+                                             -> ERRO (esgotou as tentativas)
+
+Em um retry, se a mensagem de texto já foi enviada, só o arquivo é reenviado.
+
+Comprovantes antecipados (upload em lote na campanha) têm o OCR feito logo
+após o upload (tasks.ocr_comprovante_antecipado_task); no envio os dados já
+extraídos são reaproveitados e o paciente não espera pelo OCR.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre a mensagem de texto e o arquivo
+INTERVALO_MENSAGEM_ARQUIVO = 7
+
+
+class ErroEnvioComprovante(Exception):
+    """Falha temporária no envio (WhatsApp fora, erro na API...), pode ser repetida"""
+
+
+class ErroPermanenteComprovante(Exception):
+    """Falha que um retry não resolve (WhatsApp não configurado, arquivo ausente)"""
+
+
+def marcar_status_envio(consulta, status, erro=None):
+    """Atualiza o status de envio do comprovante (sem commit)"""
+    consulta.envio_comprovante_status = status
+    consulta.envio_comprovante_erro = (erro or '')[:300] or None
+    consulta.envio_comprovante_em = datetime.utcnow()
+
+
+def processar_ocr_comprovante_antecipado(comp_id):
+    """
+    Extrai os dados de um comprovante antecipado e guarda no próprio registro.
+    Preenche hora_aghu da consulta vinculada (se ainda vazio) para que a MSG1
+    já saia com o horário. Requer app context.
+
+    Returns:
+        dict com os dados extraídos, ou None (comprovante inexistente ou falha no OCR)
+    """
+    from app import db, ComprovanteAntecipado, extrair_dados_comprovante
+
+    comp = db.session.get(ComprovanteAntecipado, comp_id)
+    if not comp:
+        logger.warning(f"[OCR ANTECIPADO] Comprovante {comp_id} não encontrado")
+        return None
+    if comp.ocr_status == 'CONCLUIDO' and comp.dados_ocr:
+        return json.loads(comp.dados_ocr)
+
+    dados = extrair_dados_comprovante(comp.filepath)
+    comp.ocr_em = datetime.utcnow()
+    if not dados:
+        comp.ocr_status = 'ERRO'
+        db.session.commit()
+        logger.warning(f"[OCR ANTECIPADO] Falha no OCR de {comp.filename} (comprovante {comp_id})")
+        return None
+
+    comp.dados_ocr = json.dumps(dados, ensure_ascii=False)
+    comp.ocr_status = 'CONCLUIDO'
+
+    if comp.consulta:
+        aplicar_hora_ocr(comp.consulta, dados)
+
+    db.session.commit()
+    logger.info(f"[OCR ANTECIPADO] Dados extraídos de {comp.filename} (comprovante {comp_id})")
+    return dados
+
+
+def aplicar_hora_ocr(consulta, dados):
+    """Grava em consulta.hora_aghu o horário do comprovante, se ainda vazio (sem commit)"""
+    hora = ((dados or {}).get('hora') or '').strip()
+    if hora and hora != '00:00' and not (consulta.hora_aghu or '').strip():
+        consulta.hora_aghu = hora
+        logger.info(f"[OCR ANTECIPADO] Horário {hora} salvo em consulta {consulta.id} ({consulta.paciente})")
+
+
+def dados_ocr_precomputados(consulta_id, filepath):
+    """Dados do OCR feito no upload do comprovante antecipado, se houver"""
+    from app import ComprovanteAntecipado
+
+    comp = ComprovanteAntecipado.query.filter_by(
+        consulta_id=consulta_id, filepath=filepath, ocr_status='CONCLUIDO'
+    ).order_by(ComprovanteAntecipado.id.desc()).first()
+    if comp and comp.dados_ocr:
+        return json.loads(comp.dados_ocr)
+    return None
+
+
+def enviar_comprovante(usuario_id, consulta_id, filepath, telefone, base_url):
+    """
+    Envia o comprovante de uma consulta. Requer app context.
+
+    Returns:
+        True se enviado (ou já enviado antes), False se a consulta não existe
+
+    Raises:
+        ErroEnvioComprovante: falha temporária (a task faz retry)
+        ErroPermanenteComprovante: falha definitiva (a task marca ERRO sem retry)
+    """
+    from app import (
+        db, AgendamentoConsulta, LogMsgConsulta, WhatsApp, Paciente, HistoricoConsulta,
+        extrair_dados_comprovante, formatar_mensagem_comprovante
+    )
+
+    logger.info(f"[COMPROVANTE] Iniciando envio para consulta {consulta_id}")
+
+    consulta = db.session.get(AgendamentoConsulta, consulta_id)
+    if not consulta:
+        logger.error(f"[COMPROVANTE] Consulta {consulta_id} não encontrada")
+        return False
+
+    if consulta.envio_comprovante_status == 'ENVIADO':
+        logger.info(f"[COMPROVANTE] Consulta {consulta_id} já teve o comprovante enviado")
+        return True
+
+    if not filepath or not os.path.isfile(filepath):
+        raise ErroPermanenteComprovante(f"Arquivo do comprovante não encontrado: {filepath}")
+
+    # Falhas definitivas antes de qualquer gravação de status ou OCR
+    ws = WhatsApp(usuario_id)
+    if not ws.ok():
+        raise ErroPermanenteComprovante(f"WhatsApp não configurado para usuário {usuario_id}")
+
+    mensagem_ja_enviada = consulta.envio_comprovante_status == 'MENSAGEM_ENVIADA'
+    consulta.envio_comprovante_tentativas = (consulta.envio_comprovante_tentativas or 0) + 1
+    if not mensagem_ja_enviada:
+        marcar_status_envio(consulta, 'ENVIANDO')
+    db.session.commit()
+
+    # Dados do comprovante: do OCR feito no upload (antecipado) ou via OCR agora
+    # (cacheado por conteúdo do arquivo)
+    try:
+        dados_ocr = dados_ocr_precomputados(consulta_id, filepath)
+        if dados_ocr:
+            logger.info(f"[COMPROVANTE] Dados do OCR feito no upload: {dados_ocr}")
+        else:
+            dados_ocr = extrair_dados_comprovante(filepath) or {}
+            if dados_ocr:
+                logger.info(f"[COMPROVANTE] Dados extraídos via OCR: {dados_ocr}")
+    except Exception as ocr_err:
+        logger.warning(f"[COMPROVANTE] Erro ao extrair dados via OCR (continuando sem): {ocr_err}")
+        dados_ocr = {}
+
+    if not mensagem_ja_enviada:
+        # Mensagem de texto (personalizada com dados do OCR + link público)
+        link_comprovante = f"{base_url}/consulta/comprovante/{consulta_id}"
+        msg = formatar_mensagem_comprovante(consulta=consulta, dados_ocr=dados_ocr, link_comprovante=link_comprovante)
+        ok_msg, result_msg = ws.enviar(telefone, msg)
+        if not ok_msg:
+            raise ErroEnvioComprovante(f"Erro ao enviar mensagem: {result_msg}")
+
+        db.session.add(LogMsgConsulta(
+            campanha_id=consulta.campanha_id,
+            consulta_id=consulta.id,
+            direcao='enviada',
+            telefone=telefone,
+            mensagem=f'{msg[:200]}... [COMPROVANTE ANEXO]',
+            status='sucesso',
+            msg_id=result_msg
+        ))
+        marcar_status_envio(consulta, 'MENSAGEM_ENVIADA')
+        db.session.commit()
+
+        # Aguardar antes de enviar o arquivo
+        time.sleep(INTERVALO_MENSAGEM_ARQUIVO)
+
+    ok_file, result_file = ws.enviar_arquivo(telefone, filepath)
+    if not ok_file:
+        raise ErroEnvioComprovante(f"Erro ao enviar arquivo: {result_file}")
+
+    marcar_status_envio(consulta, 'ENVIADO')
+    db.session.commit()
+
+    # =====================================================
+    # HISTÓRICO DO PACIENTE
+    # =====================================================
+    try:
+        paciente_db = Paciente.query.filter_by(usuario_id=usuario_id, telefone=telefone).first()
+        if not paciente_db:
+            paciente_db = Paciente.query.filter_by(usuario_id=usuario_id, nome=dados_ocr.get('paciente', consulta.paciente)).first()
+
+        if not paciente_db:
+            paciente_db = Paciente(
+                usuario_id=usuario_id,
+                nome=dados_ocr.get('paciente', consulta.paciente),
+                telefone=telefone,
+                data_nascimento=dados_ocr.get('data_nascimento'),
+                prontuario=dados_ocr.get('prontuario'),
+                codigo=dados_ocr.get('codigo')
+            )
+            db.session.add(paciente_db)
+            db.session.commit()
+        else:
+            if dados_ocr.get('data_nascimento'): paciente_db.data_nascimento = dados_ocr.get('data_nascimento')
+            if dados_ocr.get('prontuario'): paciente_db.prontuario = dados_ocr.get('prontuario')
+            if dados_ocr.get('codigo'): paciente_db.codigo = dados_ocr.get('codigo')
+            db.session.commit()
+
+        historico = HistoricoConsulta(
+            paciente_id=paciente_db.id,
+            consulta_id=consulta.id,
+            usuario_id=usuario_id,
+            nro_consulta=dados_ocr.get('nro_consulta'),
+            data_consulta=dados_ocr.get('data'),
+            hora_consulta=dados_ocr.get('hora'),
+            dia_semana=dados_ocr.get('dia'),
+            grade=dados_ocr.get('grade'),
+            unidade_funcional=dados_ocr.get('unidade_funcional'),
+            andar=dados_ocr.get('andar'),
+            ala_bloco=dados_ocr.get('ala_bloco'),
+            setor=dados_ocr.get('setor'),
+            sala=dados_ocr.get('sala'),
+            tipo_consulta=dados_ocr.get('consulta'),
+            tipo_demanda=dados_ocr.get('tipo'),
+            equipe=dados_ocr.get('equipe'),
+            profissional=dados_ocr.get('profissional'),
+            especialidade=consulta.especialidade,
+            exames=consulta.exames,
+            marcado_por=dados_ocr.get('marcado_por'),
+            observacao=dados_ocr.get('observacao'),
+            nro_autorizacao=dados_ocr.get('nro_autorizacao'),
+            status='CONFIRMADA',
+            comprovante_path=filepath
+        )
+        db.session.add(historico)
+        db.session.commit()
+        logger.info(f"[COMPROVANTE] Histórico salvo para paciente {paciente_db.nome}")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[COMPROVANTE] Erro ao salvar histórico: {e}")
+
+    logger.info(f"[COMPROVANTE] Envio concluído para consulta {consulta_id}")
+    return True
@@ -0,0 +1,106 @@
+"""
+=============================================================================
+HISTÓRICO DE MENSAGENS (/logs) - PAGINAÇÃO POR CURSOR
+=============================================================================
+A tabela logs cresce a cada mensagem enviada/recebida, então /logs não usa
+paginate() (COUNT completo + OFFSET):
+
+- Paginação por keyset em (data, id), mais recentes primeiro: o cursor é o
+  (data, id) da última/primeira linha exibida, e qualquer página custa o
+  mesmo que a primeira (paginacao_keyset.py).
+- Índices compostos (data, id), (campanha_id, data, id) e
+  (direcao, data, id) atendem a listagem sem filtro e os filtros de
+  campanha e direção; (contato_id, data, id) atende o histórico do contato.
+- O total exibido é aproximado: estatística do planner (pg_class.reltuples)
+  sem filtros no PostgreSQL, ou COUNT guardado em cache por TTL_TOTAL.
+"""
+
+import logging
+import time
+
+from cache_redis import obter_redis, marcar_indisponivel
+from paginacao_keyset import pagina_por_data
+
+logger = logging.getLogger(__name__)
+
+POR_PAGINA = 100
+
+# Validade do total em cache (segundos)
+TTL_TOTAL = 300
+
+_totais_locais = {}
+
+
+def _consulta(campanha_id=None, direcao=None):
+    from app import LogMsg
+    q = LogMsg.query
+    if campanha_id:
+        q = q.filter(LogMsg.campanha_id == campanha_id)
+    if direcao:
+        q = q.filter(LogMsg.direcao == direcao)
+    return q
+
+
+def pagina_logs(campanha_id=None, direcao=None, apos=None, antes=None, por_pagina=POR_PAGINA):
+    """
+    Uma página do histórico, mais recentes primeiro.
+
+    Args:
+        apos: cursor da última linha da página anterior (avançar)
+        antes: cursor da primeira linha da página seguinte (voltar)
+    """
+    from app import LogMsg
+    return pagina_por_data(_consulta(campanha_id, direcao), LogMsg.data, LogMsg.id, apos, antes, por_pagina)
+
+
+def _estimativa_planner():
+    """reltuples da tabela logs no PostgreSQL (None se indisponível ou nunca analisada)"""
+    from sqlalchemy import text
+    from app import db
+
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    try:
+        estimativa = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'logs'::regclass")
+        ).scalar()
+    except Exception as e:
+        db.session.rollback()
+        logger.debug(f"Estimativa de linhas de logs indisponível: {e}")
+        return None
+    return int(estimativa) if estimativa is not None and estimativa >= 0 else None
+
+
+def total_aproximado(campanha_id=None, direcao=None):
+    """Total de mensagens para os filtros, aproximado (estimativa do planner ou COUNT em cache)"""
+    if not campanha_id and not direcao:
+        estimativa = _estimativa_planner()
+        if estimativa is not None:
+            return estimativa
+
+    chave = f"logs:total:{campanha_id or ''}:{direcao or ''}"
+    agora = time.time()
+
+    local = _totais_locais.get(chave)
+    if local and local[1] > agora:
+        return local[0]
+
+    r = obter_redis()
+    if r is not None:
+        try:
+            valor = r.get(chave)
+            if valor is not None:
+                _totais_locais[chave] = (int(valor), agora + TTL_TOTAL)
+                return int(valor)
+        except Exception as e:
+            marcar_indisponivel(e)
+            r = None
+
+    total = _consulta(campanha_id, direcao).order_by(None).count()
+    _totais_locais[chave] = (total, agora + TTL_TOTAL)
+    if r is not None:
+        try:
+            r.setex(chave, TTL_TOTAL, total)
+        except Exception as e:
+            marcar_indisponivel(e)
+    return total
@@ -0,0 +1,346 @@
+"""
+=============================================================================
+IMPORTACAO EM LOTE
+=============================================================================
+Camada de persistência em massa usada pelas importações de planilha.
+
+Em vez de um db.session.add() + flush() por registro (um round-trip por
+paciente), cada lote é gravado com poucos statements:
+- INSERT ... RETURNING id multi-linha para as entidades "pai" (Contato)
+- INSERT executemany para as entidades "filhas" (Telefone)
+
+Cada lote é commitado separadamente, o que permite reportar progresso e
+repetir apenas o lote que falhou, sem refazer o arquivo inteiro.
+"""
+
+import logging
+import time
+
+from sqlalchemy import insert
+
+from telefones import telefones_por_linha
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de registros "pai" gravados por lote/commit
+TAMANHO_LOTE = 1000
+
+# Tentativas por lote antes de desistir da importação
+MAX_TENTATIVAS_LOTE = 3
+
+
+def inserir_retornando_ids(tabela, linhas):
+    """
+    Insere várias linhas em uma tabela e retorna os ids na mesma ordem das linhas.
+
+    Usa INSERT ... RETURNING multi-linha (insertmanyvalues do SQLAlchemy 2.x),
+    suportado por PostgreSQL e SQLite >= 3.35.
+    """
+    from app import db
+
+    if not linhas:
+        return []
+
+    stmt = insert(tabela).returning(tabela.c.id, sort_by_parameter_order=True)
+    resultado = db.session.execute(stmt, linhas)
+    return [row[0] for row in resultado]
+
+
+def inserir_linhas(tabela, linhas):
+    """Insere várias linhas em uma tabela com um único executemany"""
+    from app import db
+
+    if linhas:
+        db.session.execute(insert(tabela), linhas)
+
+
+def processar_em_lotes(itens, persistir_lote, tamanho_lote=TAMANHO_LOTE,
+                       max_tentativas=MAX_TENTATIVAS_LOTE, inicio=0, ao_progredir=None):
+    """
+    Persiste uma lista de itens em lotes, com commit e retry por lote.
+
+    Args:
+        itens: lista de itens a persistir (ordem determinística)
+        persistir_lote: função que recebe a sublista do lote e grava no banco
+        tamanho_lote: quantidade de itens por commit
+        max_tentativas: tentativas por lote antes de propagar o erro
+        inicio: índice do primeiro item ainda não persistido (retomada)
+        ao_progredir: callback(processados, total) chamado após cada commit
+
+    Returns:
+        int: quantidade de itens persistidos (incluindo os anteriores a `inicio`)
+    """
+    from app import db
+
+    total = len(itens)
+    processados = min(inicio, total)
+
+    for i in range(processados, total, tamanho_lote):
+        lote = itens[i:i + tamanho_lote]
+
+        for tentativa in range(1, max_tentativas + 1):
+            try:
+                persistir_lote(lote)
+                db.session.commit()
+                break
+            except Exception as e:
+                db.session.rollback()
+                if tentativa >= max_tentativas:
+                    logger.error(f"Lote {i}-{i + len(lote)} falhou após {tentativa} tentativas: {e}")
+                    raise
+                espera = 2 ** tentativa
+                logger.warning(f"Lote {i}-{i + len(lote)} falhou (tentativa {tentativa}): {e}. Repetindo em {espera}s")
+                time.sleep(espera)
+
+        processados += len(lote)
+        if ao_progredir:
+            ao_progredir(processados, total)
+
+    return processados
+
+
+def salvar_contatos_em_lote(campanha_id, pessoas, inicio=0, ao_progredir=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava contatos da fila cirúrgica e seus telefones em lote.
+
+    Args:
+        campanha_id: ID da campanha
+        pessoas: lista de dicts {'nome', 'nascimento', 'procedimento',
+                 'procedimento_normalizado' (opcional), 'telefones': [(original, fmt), ...]}
+        inicio: quantidade de pessoas já gravadas em uma execução anterior
+        ao_progredir: callback(processados, total)
+
+    Returns:
+        int: total de contatos gravados
+    """
+    from app import Contato, Telefone
+
+    def persistir(lote):
+        ids = inserir_retornando_ids(Contato.__table__, [
+            {
+                'campanha_id': campanha_id,
+                'nome': p['nome'][:200],
+                'data_nascimento': p['nascimento'],
+                'procedimento': (p['procedimento'] or '')[:500],
+                'procedimento_normalizado': p['procedimento_normalizado'][:300] if p.get('procedimento_normalizado') else None,
+                'status': 'pendente',
+            }
+            for p in lote
+        ])
+
+        telefones = []
+        for contato_id, p in zip(ids, lote):
+            for i, (original, fmt) in enumerate(p['telefones']):
+                telefones.append({
+                    'contato_id': contato_id,
+                    'numero': original[:20],
+                    'numero_fmt': fmt,
+                    'prioridade': i + 1,
+                })
+        inserir_linhas(Telefone.__table__, telefones)
+
+    return processar_em_lotes(
+        pessoas, persistir,
+        tamanho_lote=tamanho_lote,
+        inicio=inicio,
+        ao_progredir=ao_progredir
+    )
+
+
+# =============================================================================
+# MODO CONSULTA - PLANILHA AGHU
+# =============================================================================
+
+# Campo do AgendamentoConsulta -> colunas candidatas da planilha (primeira não vazia vence)
+COLUNAS_CONSULTA = {
+    'posicao': ['POSICAO'],
+    'cod_master': ['COD MASTER'],
+    'codigo_aghu': ['CODIGO AGHU'],
+    'paciente': ['PACIENTE'],
+    'telefone_cadastro': ['TELEFONE CADASTRO'],
+    'telefone_registro': ['TELEFONE REGISTRO'],
+    'data_registro': ['DATA DO REGISTRO'],
+    'procedencia': ['PROCEDÊNCIA'],
+    'medico_solicitante': ['MEDICO_SOLICITANTE', 'MEDICO SOLICITANTE', 'MEDICO'],
+    'tipo': ['TIPO'],
+    'observacoes': ['OBSERVAÇÕES'],
+    'exames': ['EXAMES'],
+    'sub_especialidade': ['SUB-ESPECIALIDADE'],
+    'especialidade': ['ESPECIALIDADE'],
+    'grade_aghu': ['GRADE_AGHU'],
+    'prioridade': ['PRIORIDADE'],
+    'indicacao_data': ['INDICACAO DATA'],
+    'data_requisicao': ['DATA REQUISIÇÃO'],
+    'data_exata_ou_dias': ['DATA EXATA OU DIAS'],
+    'estimativa_agendamento': ['ESTIMATIVA AGENDAMENTO'],
+    'data_aghu': ['DATA AGHU'],
+    'hora_aghu': ['HORA AGHU', 'HORA', 'HORARIO', 'HORÁRIO'],
+    'paciente_voltar_posto_sms': ['PACIENTE_VOLTAR_POSTO_SMS'],
+    'motivo_remarcacao': ['MOTIVO_REMARCACAO'],
+    'data_anterior': ['DATA_ANTERIOR'],
+}
+
+COLUNAS_CONSULTA_OBRIGATORIAS = ['PACIENTE', 'TIPO']
+
+TIPOS_CONSULTA_VALIDOS = ['RETORNO', 'INTERCONSULTA', 'REMARCACAO']
+
+
+def _coluna_coalescida(df, candidatas):
+    """Retorna a primeira coluna não vazia entre as candidatas (vetorizado)"""
+    import pandas as pd
+
+    presentes = [c for c in candidatas if c in df.columns]
+    if not presentes:
+        return pd.Series('', index=df.index, dtype=object)
+
+    serie = df[presentes[0]]
+    for c in presentes[1:]:
+        serie = serie.where(serie != '', df[c])
+    return serie.str.strip()
+
+
+def preparar_agendamentos(df):
+    """
+    Converte a planilha de consultas em registros prontos para inserção.
+
+    As colunas são mapeadas uma única vez e todas as transformações
+    (strip, upper, normalização de TIPO) são feitas por coluna, sem iterrows.
+
+    Args:
+        df: DataFrame lido com dtype=str
+
+    Returns:
+        list[dict]: um dict por agendamento com os campos do modelo
+    """
+    import pandas as pd
+
+    df = df.fillna('').astype(str)
+
+    dados = pd.DataFrame({
+        campo: _coluna_coalescida(df, candidatas)
+        for campo, candidatas in COLUNAS_CONSULTA.items()
+    })
+
+    # Linhas sem paciente são descartadas
+    vazias = dados['paciente'] == ''
+    if vazias.any():
+        logger.warning(f"{int(vazias.sum())} linhas sem paciente ignoradas")
+    dados = dados[~vazias]
+
+    # TIPO: aceitar variações de INTERCONSULTA, demais inválidos viram RETORNO
+    tipo = dados['tipo'].str.upper()
+    interconsulta = tipo.str.contains('INTERCONSULTA', regex=False)
+    tipo = tipo.mask(interconsulta, 'INTERCONSULTA')
+    invalidos = ~tipo.isin(TIPOS_CONSULTA_VALIDOS)
+    if invalidos.any():
+        logger.warning(f"{int(invalidos.sum())} linhas com tipo inválido ajustadas para RETORNO")
+    dados['tipo'] = tipo.mask(invalidos, 'RETORNO')
+
+    # Para INTERCONSULTA, ignorar campo EXAMES (pode conter data de registro)
+    dados['exames'] = dados['exames'].mask(interconsulta, '')
+
+    dados['paciente_voltar_posto_sms'] = dados['paciente_voltar_posto_sms'].str.upper()
+
+    registros = dados.to_dict('records')
+
+    # Telefones: múltiplos números separados por " / " em cada célula;
+    # TELEFONE CADASTRO vem antes de TELEFONE REGISTRO e duplicatas são removidas
+    telefones_linha = telefones_por_linha(
+        dados['telefone_cadastro'] + '/' + dados['telefone_registro'],
+        separadores='/'
+    )
+    for idx, registro in zip(dados.index, registros):
+        registro['telefones'] = [canonico for _, canonico in telefones_linha.get(idx, [])]
+
+    return registros
+
+
+def salvar_agendamentos_em_lote(campanha_id, usuario_id, agendamentos, inicio=0,
+                                ao_progredir=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava agendamentos de consulta e seus telefones em lote.
+
+    Args:
+        campanha_id: ID da CampanhaConsulta
+        usuario_id: ID do usuário dono da campanha
+        agendamentos: lista de dicts retornada por preparar_agendamentos()
+                      (campos do modelo + 'telefones': lista de números canônicos)
+        inicio: quantidade de agendamentos já gravados em uma execução anterior
+        ao_progredir: callback(processados, total)
+
+    Returns:
+        int: total de agendamentos gravados
+    """
+    from app import AgendamentoConsulta, TelefoneConsulta
+
+    def persistir(lote):
+        ids = inserir_retornando_ids(AgendamentoConsulta.__table__, [
+            dict(
+                {k: v for k, v in a.items() if k != 'telefones'},
+                campanha_id=campanha_id,
+                usuario_id=usuario_id,
+                status='AGUARDANDO_ENVIO',
+                tentativas_contato=0,
+                data_ultima_tentativa=None,
+                cancelado_sem_resposta=False,
+            )
+            for a in lote
+        ])
+
+        telefones = []
+        for consulta_id, a in zip(ids, lote):
+            for prioridade, numero in enumerate(a['telefones'], 1):
+                telefones.append({
+                    'consulta_id': consulta_id,
+                    'numero': numero,
+                    'prioridade': prioridade,
+                })
+        inserir_linhas(TelefoneConsulta.__table__, telefones)
+
+    return processar_em_lotes(
+        agendamentos, persistir,
+        tamanho_lote=tamanho_lote,
+        inicio=inicio,
+        ao_progredir=ao_progredir
+    )
+
+
+# =============================================================================
+# MODO SCIH - PACIENTES
+# =============================================================================
+
+def salvar_pacientes_scih_em_lote(campanha_id, criador_id, pacientes, gerar_tokens,
+                                  ao_progredir=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava pacientes de uma campanha SCIH em lote.
+
+    Args:
+        campanha_id: ID da CampanhaSCIH
+        criador_id: ID do usuário dono da campanha
+        pacientes: lista de dicts {'nome', 'telefone', 'idade', 'data_cirurgia'}
+        gerar_tokens: função(n) que devolve n tokens únicos da pesquisa
+        ao_progredir: callback(processados, total)
+
+    Returns:
+        int: total de pacientes gravados
+    """
+    from app import PacienteSCIH
+
+    def persistir(lote):
+        tokens = gerar_tokens(len(lote))
+        inserir_linhas(PacienteSCIH.__table__, [
+            dict(
+                p,
+                campanha_id=campanha_id,
+                criador_id=criador_id,
+                token=token,
+                status='AGUARDANDO_ENVIO',
+            )
+            for p, token in zip(lote, tokens)
+        ])
+
+    return processar_em_lotes(
+        pacientes, persistir,
+        tamanho_lote=tamanho_lote,
+        ao_progredir=ao_progredir
+    )
@@ -0,0 +1,273 @@
+"""
+=============================================================================
+MÉTRICAS DIÁRIAS - TABELA DE AGREGADOS PARA OS GRÁFICOS
+=============================================================================
+Os gráficos de evolução diária (dashboard admin e detalhes do usuário) leem
+daily_metrics: um valor por (dia, usuário, modo, métrica), em vez de agrupar
+por dia as tabelas de agendamentos, logs e contatos a cada acesso.
+
+A task tasks.atualizar_metricas_diarias (a cada 5 minutos) recalcula a
+janela dos gráficos e os dias mais antigos afetados desde a última
+execução, estes achados por marcas d'água:
+
+- agendamentos_consultas.updated_at  (envio da MSG1, confirmação/rejeição;
+                                      índice ix_agendamentos_consultas_updated_at)
+- logs.id                            (mensagens da fila, só inserção)
+- contatos.data_resposta             (confirmação/rejeição na fila)
+
+A janela exibida nos gráficos (DIAS_GRAFICOS + hoje) é sempre recalculada
+inteira: exclusões (campanha, consulta, usuário) e datas que mudam de dia não
+movem nenhuma marca d'água, e sem isso o dia antigo ficaria com a contagem
+velha. Na primeira execução (sem marca) todo o histórico é calculado, em
+blocos de 31 dias. Os dias são em UTC, como nas consultas que os gráficos
+faziam antes.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta, date
+
+logger = logging.getLogger(__name__)
+
+CHAVE_MARCA = 'metricas_diarias:marca'
+BLOCO_RECONSTRUCAO = 31  # dias por consulta na reconstrução completa
+DIAS_GRAFICOS = 30       # gráficos mostram de (hoje - DIAS_GRAFICOS) até hoje
+
+
+def _definicoes():
+    """
+    (modo, metrica) -> (coluna de data, coluna do usuário, joins, filtros)
+    Usuário = criador da campanha, como no dashboard.
+    """
+    from app import AgendamentoConsulta, CampanhaConsulta, LogMsg, Contato, Campanha
+
+    ag_join = [(CampanhaConsulta, CampanhaConsulta.id == AgendamentoConsulta.campanha_id)]
+    return {
+        ('consulta', 'msg1_enviadas'): (
+            AgendamentoConsulta.data_envio_mensagem, CampanhaConsulta.criador_id, ag_join,
+            [AgendamentoConsulta.mensagem_enviada == True]
+        ),
+        ('consulta', 'comprovantes_enviados'): (
+            AgendamentoConsulta.data_confirmacao, CampanhaConsulta.criador_id, ag_join,
+            [AgendamentoConsulta.status == 'CONFIRMADO']
+        ),
+        ('consulta', 'rejeitados'): (
+            AgendamentoConsulta.data_confirmacao, CampanhaConsulta.criador_id, ag_join,
+            [AgendamentoConsulta.status == 'REJEITADO']
+        ),
+        ('fila', 'enviadas'): (
+            LogMsg.data, Campanha.criador_id, [(Campanha, Campanha.id == LogMsg.campanha_id)],
+            [LogMsg.direcao == 'enviada']
+        ),
+        ('fila', 'confirmados'): (
+            Contato.data_resposta, Campanha.criador_id, [(Campanha, Campanha.id == Contato.campanha_id)],
+            [Contato.confirmado == True]
+        ),
+        ('fila', 'rejeitados'): (
+            Contato.data_resposta, Campanha.criador_id, [(Campanha, Campanha.id == Contato.campanha_id)],
+            [Contato.rejeitado == True]
+        ),
+    }
+
+
+def _como_data(valor):
+    """func.date() devolve date no PostgreSQL e string no SQLite"""
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+
+# =============================================================================
+# RECÁLCULO
+# =============================================================================
+
+def recalcular_dias(dias):
+    """Recalcula (apaga e insere) todas as métricas dos dias informados. Sem commit."""
+    from sqlalchemy import func
+    from app import db, MetricaDiaria
+
+    dias = sorted({d for d in dias if d})
+    if not dias:
+        return 0
+
+    conjunto = set(dias)
+    inicio = datetime.combine(dias[0], datetime.min.time())
+    fim = datetime.combine(dias[-1] + timedelta(days=1), datetime.min.time())
+
+    MetricaDiaria.query.filter(MetricaDiaria.dia.in_(dias)).delete(synchronize_session=False)
+
+    linhas = []
+    for (modo, metrica), (coluna_data, coluna_usuario, joins, filtros) in _definicoes().items():
+        # Filtro por intervalo na coluna (usa índice); func.date só no GROUP BY
+        q = db.session.query(
+            func.date(coluna_data).label('dia'),
+            coluna_usuario.label('usuario_id'),
+            func.count().label('total')
+        )
+        for tabela, condicao in joins:
+            q = q.join(tabela, condicao)
+        q = q.filter(coluna_data >= inicio, coluna_data < fim, *filtros
+        ).group_by(func.date(coluna_data), coluna_usuario)
+
+        for r in q:
+            dia = _como_data(r.dia)
+            if dia in conjunto:
+                linhas.append({
+                    'dia': dia, 'usuario_id': r.usuario_id, 'modo': modo,
+                    'metrica': metrica, 'valor': r.total
+                })
+
+    if linhas:
+        db.session.execute(MetricaDiaria.__table__.insert(), linhas)
+    return len(linhas)
+
+
+def _ler_marca():
+    from app import SnapshotDashboard
+    registro = SnapshotDashboard.query.filter_by(chave=CHAVE_MARCA).first()
+    return json.loads(registro.dados_json) if registro else None
+
+
+def _gravar_marca(marca):
+    from app import db, SnapshotDashboard
+    registro = SnapshotDashboard.query.filter_by(chave=CHAVE_MARCA).first()
+    if not registro:
+        registro = SnapshotDashboard(chave=CHAVE_MARCA)
+        db.session.add(registro)
+    registro.dados_json = json.dumps(marca)
+    registro.gerado_em = datetime.utcnow()
+
+
+def _marca_atual():
+    """Marcas d'água no estado atual das tabelas (lidas ANTES do recálculo)"""
+    from sqlalchemy import func
+    from app import db, AgendamentoConsulta, LogMsg, Contato
+
+    def iso(v):
+        return v.isoformat() if v else None
+
+    return {
+        'agendamentos': iso(db.session.query(func.max(AgendamentoConsulta.updated_at)).scalar()),
+        'logs': db.session.query(func.max(LogMsg.id)).scalar() or 0,
+        'contatos': iso(db.session.query(func.max(Contato.data_resposta)).scalar()),
+    }
+
+
+def _dias_afetados(marca):
+    """Dias com linhas inseridas/alteradas desde a marca anterior"""
+    from sqlalchemy import func
+    from app import db, AgendamentoConsulta, LogMsg, Contato
+
+    dias = set()
+
+    if marca.get('agendamentos'):
+        desde = datetime.fromisoformat(marca['agendamentos'])
+        for envio, confirmacao in db.session.query(
+            func.date(AgendamentoConsulta.data_envio_mensagem),
+            func.date(AgendamentoConsulta.data_confirmacao)
+        ).filter(AgendamentoConsulta.updated_at > desde).distinct():
+            dias.update((_como_data(envio), _como_data(confirmacao)))
+
+    for (dia,) in db.session.query(func.date(LogMsg.data)).filter(LogMsg.id > marca.get('logs', 0)).distinct():
+        dias.add(_como_data(dia))
+
+    if marca.get('contatos'):
+        desde = datetime.fromisoformat(marca['contatos'])
+        for (dia,) in db.session.query(func.date(Contato.data_resposta)).filter(Contato.data_resposta > desde).distinct():
+            dias.add(_como_data(dia))
+
+    dias.discard(None)
+    return dias
+
+
+def _primeiro_dia():
+    """Dia mais antigo com algum dado de qualquer métrica"""
+    from sqlalchemy import func
+    from app import db
+
+    candidatos = []
+    for coluna_data, _, _, _ in _definicoes().values():
+        valor = db.session.query(func.min(coluna_data)).scalar()
+        if valor:
+            candidatos.append(_como_data(valor))
+    return min(candidatos) if candidatos else None
+
+
+def reconstruir_metricas_diarias():
+    """Recalcula todo o histórico, em blocos de BLOCO_RECONSTRUCAO dias"""
+    from app import db
+
+    marca = _marca_atual()
+    hoje = datetime.utcnow().date()
+    dia = _primeiro_dia() or hoje
+    total = 0
+    while dia <= hoje:
+        bloco = [dia + timedelta(days=i) for i in range(BLOCO_RECONSTRUCAO) if dia + timedelta(days=i) <= hoje]
+        total += recalcular_dias(bloco)
+        db.session.commit()
+        dia = bloco[-1] + timedelta(days=1)
+    _gravar_marca(marca)
+    db.session.commit()
+    logger.info(f"Métricas diárias reconstruídas: {total} linhas")
+    return total
+
+
+def atualizar_metricas_diarias():
+    """Recalcula os dias afetados desde a última execução (ou tudo, na primeira)"""
+    from app import db
+
+    marca_anterior = _ler_marca()
+    if marca_anterior is None:
+        return reconstruir_metricas_diarias()
+
+    marca = _marca_atual()
+    hoje = datetime.utcnow().date()
+    janela = [hoje - timedelta(days=i) for i in range(DIAS_GRAFICOS + 1)]
+    # Um intervalo só para a janela; dias antigos um a um, para o intervalo
+    # de recalcular_dias não se estender do dia antigo até hoje
+    antigos = _dias_afetados(marca_anterior) - set(janela)
+    total = recalcular_dias(janela)
+    for dia in antigos:
+        total += recalcular_dias([dia])
+    dias = len(janela) + len(antigos)
+    _gravar_marca(marca)
+    db.session.commit()
+    logger.info(f"Métricas diárias atualizadas: {dias} dias, {total} linhas")
+    return total
+
+
+# =============================================================================
+# LEITURA
+# =============================================================================
+
+def series_diarias(modo, metricas, dias=DIAS_GRAFICOS, usuario_id=None):
+    """
+    Séries diárias das métricas, do dia (hoje - dias) até hoje, com zero nos
+    dias sem dados. Uma consulta para todas as métricas.
+
+    Returns:
+        (labels 'dd/mm', {metrica: [valores]})
+    """
+    from sqlalchemy import func
+    from app import db, MetricaDiaria
+
+    hoje = datetime.utcnow().date()
+    inicio = hoje - timedelta(days=dias)
+    datas = [inicio + timedelta(days=i) for i in range(dias + 1)]
+
+    q = db.session.query(
+        MetricaDiaria.dia, MetricaDiaria.metrica, func.sum(MetricaDiaria.valor).label('valor')
+    ).filter(
+        MetricaDiaria.modo == modo,
+        MetricaDiaria.metrica.in_(metricas),
+        MetricaDiaria.dia >= inicio
+    )
+    if usuario_id is not None:
+        q = q.filter(MetricaDiaria.usuario_id == usuario_id)
+
+    valores = {(_como_data(r.dia), r.metrica): int(r.valor or 0)
+               for r in q.group_by(MetricaDiaria.dia, MetricaDiaria.metrica)}
+    labels = [d.strftime('%d/%m') for d in datas]
+    return labels, {m: [valores.get((d, m), 0) for d in datas] for m in metricas}
@@ -0,0 +1,38 @@
+"""
+Script de migração para os índices da busca de contatos em /campanha/<id>.
+
+PostgreSQL: extensão pg_trgm e índices GIN de trigramas em contatos.nome e
+telefones.numero_fmt (ILIKE '%termo%' passa a usar índice).
+SQLite: tabela FTS5 contatos_busca e seus triggers (a mesma preparação feita
+na inicialização do app).
+Execute: python migrate_busca_contatos.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+PASSOS_POSTGRES = [
+    ('extensão pg_trgm', "CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+    ('ix_contatos_nome_trgm', "CREATE INDEX IF NOT EXISTS ix_contatos_nome_trgm ON contatos USING gin (nome gin_trgm_ops)"),
+    ('ix_telefones_numero_fmt_trgm', "CREATE INDEX IF NOT EXISTS ix_telefones_numero_fmt_trgm ON telefones USING gin (numero_fmt gin_trgm_ops)"),
+]
+
+with app.app_context():
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as conn:
+            for nome, sql in PASSOS_POSTGRES:
+                try:
+                    conn.execute(text(sql))
+                    conn.commit()
+                    print(f"[OK] {nome}")
+                except Exception as e:
+                    conn.rollback()
+                    print(f"[ERRO] {nome}: {e}")
+    else:
+        from busca_contatos import preparar_busca_sqlite
+        if preparar_busca_sqlite():
+            print("[OK] Tabela FTS5 contatos_busca e triggers")
+        else:
+            print("[ERRO] FTS5 indisponível neste SQLite; a busca usará ILIKE sem índice")
+
+    print("\nMigração concluída.")
@@ -0,0 +1,29 @@
+"""
+Script de migração para guardar o OCR feito no upload dos comprovantes antecipados.
+Execute: python migrate_comprovante_antecipado_ocr.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+COLUNAS = [
+    ('ocr_status', 'VARCHAR(20)'),
+    ('dados_ocr', 'TEXT'),
+    ('ocr_em', 'TIMESTAMP'),
+]
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        for coluna, tipo in COLUNAS:
+            try:
+                conn.execute(text(f"""
+                    ALTER TABLE comprovantes_antecipados
+                    ADD COLUMN IF NOT EXISTS {coluna} {tipo}
+                """))
+                conn.commit()
+                print(f"[OK] Coluna '{coluna}' adicionada em comprovantes_antecipados")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] {coluna}: {e}")
+
+    print("\nMigração concluída. Reinicie web e workers (o worker de comprovantes passa a ouvir a fila ocr_comprovantes).")
@@ -0,0 +1,52 @@
+"""
+Script de migração para adicionar o nome normalizado (indexado) em comprovantes_antecipados.
+
+Com ele, o matching comprovante x paciente na confirmação é uma consulta
+indexada em vez de normalizar em Python todos os comprovantes da campanha.
+Execute: python migrate_comprovante_nome_normalizado.py
+"""
+
+from app import app, db, normalizar_nome_paciente
+from sqlalchemy import text
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        try:
+            conn.execute(text("""
+                ALTER TABLE comprovantes_antecipados
+                ADD COLUMN IF NOT EXISTS nome_normalizado VARCHAR(200)
+            """))
+            conn.commit()
+            print("[OK] Coluna 'nome_normalizado' adicionada em comprovantes_antecipados")
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERRO] nome_normalizado: {e}")
+
+        try:
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_comprovantes_antecipados_campanha_nome
+                ON comprovantes_antecipados (campanha_id, nome_normalizado, usado)
+            """))
+            conn.commit()
+            print("[OK] Índice (campanha_id, nome_normalizado, usado) criado")
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERRO] índice nome_normalizado: {e}")
+
+        # Preencher o nome normalizado dos registros existentes
+        try:
+            registros = conn.execute(text(
+                "SELECT id, nome_paciente FROM comprovantes_antecipados WHERE nome_normalizado IS NULL"
+            )).fetchall()
+            if registros:
+                conn.execute(
+                    text("UPDATE comprovantes_antecipados SET nome_normalizado = :nome WHERE id = :id"),
+                    [{'id': r.id, 'nome': normalizar_nome_paciente(r.nome_paciente)} for r in registros]
+                )
+                conn.commit()
+            print(f"[OK] Nome normalizado preenchido em {len(registros)} comprovantes")
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERRO] preenchimento nome_normalizado: {e}")
+
+    print("\nMigração concluída. Reinicie web e worker.")
@@ -0,0 +1,31 @@
+"""
+Script de migração para adicionar o status de envio do comprovante em agendamentos_consultas.
+Execute: python migrate_envio_comprovante_fields.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+COLUNAS = [
+    ('envio_comprovante_status', 'VARCHAR(20)'),
+    ('envio_comprovante_erro', 'VARCHAR(300)'),
+    ('envio_comprovante_task_id', 'VARCHAR(100)'),
+    ('envio_comprovante_tentativas', 'INTEGER DEFAULT 0'),
+    ('envio_comprovante_em', 'TIMESTAMP'),
+]
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        for coluna, tipo in COLUNAS:
+            try:
+                conn.execute(text(f"""
+                    ALTER TABLE agendamentos_consultas
+                    ADD COLUMN IF NOT EXISTS {coluna} {tipo}
+                """))
+                conn.commit()
+                print(f"[OK] Coluna '{coluna}' adicionada em agendamentos_consultas")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] {coluna}: {e}")
+
+    print("\nMigração concluída. Reinicie web e worker (e suba o celery_worker_comprovantes).")
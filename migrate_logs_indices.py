@@ -0,0 +1,39 @@
+"""
+Script de migração para criar os índices da paginação por cursor do
+histórico de mensagens (/logs) e do histórico por contato/consulta.
+Execute: python migrate_logs_indices.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+INDICES = [
+    ('ix_logs_data_id', 'logs (data, id)'),
+    ('ix_logs_campanha_data', 'logs (campanha_id, data, id)'),
+    ('ix_logs_direcao_data', 'logs (direcao, data, id)'),
+    ('ix_logs_contato_data', 'logs (contato_id, data, id)'),
+    ('ix_logs_msgs_consultas_consulta_data', 'logs_msgs_consultas (consulta_id, data, id)'),
+]
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        for nome, definicao in INDICES:
+            try:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON {definicao}"))
+                conn.commit()
+                print(f"[OK] Índice {nome} criado em {definicao}")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] {nome}: {e}")
+
+        if db.engine.dialect.name == 'postgresql':
+            # Atualiza reltuples, usado como total aproximado em /logs
+            try:
+                conn.execute(text("ANALYZE logs"))
+                conn.commit()
+                print("[OK] ANALYZE logs")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] ANALYZE logs: {e}")
+
+    print("\nMigração concluída.")
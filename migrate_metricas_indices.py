@@ -0,0 +1,26 @@
+"""
+Script de migração para criar o índice em agendamentos_consultas.updated_at,
+marca d'água usada pela task de métricas diárias (metricas_diarias.py) para
+achar os agendamentos alterados desde a última execução.
+Execute: python migrate_metricas_indices.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+INDICES = [
+    ('ix_agendamentos_consultas_updated_at', 'agendamentos_consultas (updated_at)'),
+]
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        for nome, definicao in INDICES:
+            try:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON {definicao}"))
+                conn.commit()
+                print(f"[OK] Índice {nome} criado em {definicao}")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] {nome}: {e}")
+
+    print("\nMigração concluída.")
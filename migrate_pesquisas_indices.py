@@ -0,0 +1,26 @@
+"""
+Script de migração para criar os índices do dashboard de pesquisas de
+satisfação (lista paginada por usuário, filtro e DISTINCT de especialidade).
+Execute: python migrate_pesquisas_indices.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+INDICES = [
+    ('ix_pesquisas_usuario_data', 'pesquisas_satisfacao (usuario_id, data_resposta, id)'),
+    ('ix_pesquisas_usuario_especialidade', 'pesquisas_satisfacao (usuario_id, especialidade, data_resposta, id)'),
+]
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        for nome, definicao in INDICES:
+            try:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON {definicao}"))
+                conn.commit()
+                print(f"[OK] Índice {nome} criado em {definicao}")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] {nome}: {e}")
+
+    print("\nMigração concluída.")
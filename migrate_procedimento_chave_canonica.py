@@ -0,0 +1,53 @@
+"""
+Script de migração para adicionar a chave canônica em procedimentos_normalizados.
+
+A chave (sem acentos, código SUS e abreviações) permite que variações do
+mesmo procedimento reaproveitem a normalização já existente.
+Execute: python migrate_procedimento_chave_canonica.py
+"""
+
+from app import app, db
+from cache_procedimentos import chave_procedimento
+from sqlalchemy import text
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        try:
+            conn.execute(text("""
+                ALTER TABLE procedimentos_normalizados
+                ADD COLUMN IF NOT EXISTS chave_canonica VARCHAR(300)
+            """))
+            conn.commit()
+            print("[OK] Coluna 'chave_canonica' adicionada em procedimentos_normalizados")
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERRO] chave_canonica: {e}")
+
+        try:
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_procedimentos_normalizados_chave_canonica
+                ON procedimentos_normalizados (chave_canonica)
+            """))
+            conn.commit()
+            print("[OK] Índice em chave_canonica criado")
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERRO] índice chave_canonica: {e}")
+
+        # Preencher a chave dos registros existentes
+        try:
+            registros = conn.execute(text(
+                "SELECT id, termo_original FROM procedimentos_normalizados"
+            )).fetchall()
+            if registros:
+                conn.execute(
+                    text("UPDATE procedimentos_normalizados SET chave_canonica = :chave WHERE id = :id"),
+                    [{'id': r.id, 'chave': chave_procedimento(r.termo_original)} for r in registros]
+                )
+                conn.commit()
+            print(f"[OK] Chave canônica preenchida em {len(registros)} procedimentos")
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERRO] preenchimento chave_canonica: {e}")
+
+    print("\nMigração concluída. Reinicie web e worker.")
@@ -0,0 +1,29 @@
+"""
+Script de migração para criar os índices usados pelos relatórios paginados.
+
+Contatos por campanha (keyset por id ou por nome) e telefone principal de
+cada contato, buscado na mesma consulta da página.
+Execute: python migrate_relatorio_indices.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+INDICES = [
+    ('ix_contatos_campanha_id', 'contatos (campanha_id, id)'),
+    ('ix_contatos_campanha_nome', 'contatos (campanha_id, nome, id)'),
+    ('ix_telefones_contato_prioridade', 'telefones (contato_id, prioridade, id)'),
+]
+
+with app.app_context():
+    with db.engine.connect() as conn:
+        for nome, definicao in INDICES:
+            try:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON {definicao}"))
+                conn.commit()
+                print(f"[OK] Índice {nome} criado em {definicao}")
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERRO] {nome}: {e}")
+
+    print("\nMigração concluída.")
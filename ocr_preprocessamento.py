@@ -0,0 +1,221 @@
+"""
+=============================================================================
+OCR ADAPTATIVO - COMPROVANTES DIGITALIZADOS
+=============================================================================
+Pré-processamento e OCR em estágios, do mais barato ao mais caro, parando
+assim que todos os campos do comprovante forem encontrados:
+
+1. ocr_regioes:  1ª página, 200 dpi, tons de cinza binarizado, só as regiões
+                 de interesse (onde ficam Paciente/Data/Hora/Profissional/...)
+2. ocr_pagina:   1ª página inteira, 200 dpi, binarizada
+3. ocr_completo: todas as páginas a 300 dpi coloridas (comportamento antigo)
+
+Se nenhum estágio encontrar todos os campos, vale o texto do estágio que
+encontrou mais campos. As regiões de interesse vêm de regioes_ocr.json
+(gerado por benchmark_ocr.py --aprender-regioes) ou do padrão abaixo.
+
+"Adaptativo" se refere à escada de estágios, não à resolução: o DPI de cada
+estágio é fixo (DPI_RAPIDO nos estágios 1 e 2, DPI_COMPLETO no 3) e não é
+escolhido por documento.
+
+A decisão de parar depende de extrair_campos encontrar todos os campos; o
+chamador deve passar uma extração que só conte campos ancorados em rótulo
+(ex: "Hora:", não qualquer hh:mm), senão um estágio barato pode parar com a
+data/hora de impressão do cabeçalho.
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Resolução fixa por estágio (ver docstring do módulo)
+DPI_RAPIDO = 200    # estágios 1 e 2
+DPI_COMPLETO = 300  # estágio 3
+
+# Imagens (JPG/PNG) são redimensionadas para esta largura aproximada antes do OCR
+LARGURA_ALVO_IMAGEM = 1700  # ~A4 a 200 dpi
+
+ARQUIVO_REGIOES = os.environ.get(
+    'OCR_REGIOES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regioes_ocr.json')
+)
+
+# Frações da página (x0, y0, x1, y1). No layout AGHU os dados da consulta
+# ficam no cabeçalho, na metade superior da primeira página.
+REGIOES_PADRAO = [(0.0, 0.0, 1.0, 0.55)]
+
+_regioes = None
+
+
+def carregar_regioes():
+    """Regiões de interesse aprendidas (regioes_ocr.json) ou o padrão"""
+    global _regioes
+    if _regioes is None:
+        try:
+            with open(ARQUIVO_REGIOES, encoding='utf-8') as f:
+                _regioes = [tuple(r) for r in json.load(f)['regioes']]
+            logger.info(f"Regiões de OCR carregadas de {ARQUIVO_REGIOES}: {_regioes}")
+        except FileNotFoundError:
+            _regioes = list(REGIOES_PADRAO)
+        except Exception as e:
+            logger.warning(f"Erro ao ler {ARQUIVO_REGIOES} ({e}), usando regiões padrão")
+            _regioes = list(REGIOES_PADRAO)
+    return _regioes
+
+
+# =============================================================================
+# PRÉ-PROCESSAMENTO
+# =============================================================================
+
+def limiar_otsu(img_cinza):
+    """Limiar de binarização pelo método de Otsu (histograma da imagem em tons de cinza)"""
+    histograma = img_cinza.histogram()[:256]
+    total = sum(histograma)
+    soma_total = sum(i * h for i, h in enumerate(histograma))
+
+    soma_fundo = peso_fundo = 0
+    melhor_limiar, melhor_variancia = 127, 0.0
+    for limiar, h in enumerate(histograma):
+        peso_fundo += h
+        if peso_fundo == 0:
+            continue
+        peso_frente = total - peso_fundo
+        if peso_frente == 0:
+            break
+        soma_fundo += limiar * h
+        media_fundo = soma_fundo / peso_fundo
+        media_frente = (soma_total - soma_fundo) / peso_frente
+        variancia = peso_fundo * peso_frente * (media_fundo - media_frente) ** 2
+        if variancia > melhor_variancia:
+            melhor_limiar, melhor_variancia = limiar, variancia
+    return melhor_limiar
+
+
+def binarizar(img):
+    """Tons de cinza + binarização (preto/branco), reduz ruído de fundo e tempo do Tesseract"""
+    cinza = img.convert('L')
+    limiar = limiar_otsu(cinza)
+    return cinza.point(lambda p: 255 if p > limiar else 0)
+
+
+def ajustar_resolucao(img, largura_alvo=LARGURA_ALVO_IMAGEM):
+    """Redimensiona fotos muito grandes ou muito pequenas para a resolução útil ao OCR"""
+    largura, altura = img.size
+    if not largura or abs(largura - largura_alvo) / largura_alvo < 0.25:
+        return img
+    escala = largura_alvo / largura
+    return img.resize((int(largura * escala), int(altura * escala)))
+
+
+def recortar(img, regiao):
+    """Recorta uma região dada em frações da página"""
+    x0, y0, x1, y1 = regiao
+    largura, altura = img.size
+    return img.crop((int(x0 * largura), int(y0 * altura), int(x1 * largura), int(y1 * altura)))
+
+
+def carregar_paginas(filepath, dpi, so_primeira=False, tons_de_cinza=False):
+    """Páginas do arquivo como imagens PIL (PDF rasterizado no dpi pedido)"""
+    from PIL import Image
+
+    if os.path.splitext(filepath)[1].lower() == '.pdf':
+        from pdf2image import convert_from_path
+        kwargs = {'dpi': dpi, 'grayscale': tons_de_cinza}
+        if so_primeira:
+            kwargs.update(first_page=1, last_page=1)
+        return convert_from_path(filepath, **kwargs)
+
+    img = Image.open(filepath)
+    if tons_de_cinza:
+        img = ajustar_resolucao(img.convert('L'))
+    return [img]
+
+
+# =============================================================================
+# OCR EM ESTÁGIOS
+# =============================================================================
+
+def _ocr(imagens):
+    import pytesseract
+    return '\n'.join(pytesseract.image_to_string(img, lang='por') for img in imagens) + '\n'
+
+
+def _primeira_pagina_binarizada(filepath, contexto):
+    """1ª página a 200 dpi binarizada, rasterizada uma única vez para os estágios 1 e 2"""
+    if 'pagina' not in contexto:
+        contexto['pagina'] = binarizar(
+            carregar_paginas(filepath, DPI_RAPIDO, so_primeira=True, tons_de_cinza=True)[0]
+        )
+    return contexto['pagina']
+
+
+def ocr_regioes(filepath, contexto):
+    """Estágio 1: só as regiões de interesse da 1ª página, binarizada, 200 dpi"""
+    pagina = _primeira_pagina_binarizada(filepath, contexto)
+    return _ocr([recortar(pagina, regiao) for regiao in carregar_regioes()])
+
+
+def ocr_pagina(filepath, contexto):
+    """Estágio 2: 1ª página inteira, binarizada, 200 dpi"""
+    return _ocr([_primeira_pagina_binarizada(filepath, contexto)])
+
+
+def ocr_completo(filepath, contexto=None):
+    """Estágio 3: todas as páginas a 300 dpi, coloridas (OCR original)"""
+    return _ocr(carregar_paginas(filepath, DPI_COMPLETO))
+
+
+ESTAGIOS = (
+    ('ocr_regioes', ocr_regioes),
+    ('ocr_pagina', ocr_pagina),
+    ('ocr_completo', ocr_completo),
+)
+
+
+def ocr_adaptativo(filepath, extrair_campos, normalizar=None, estagios=ESTAGIOS):
+    """
+    Roda os estágios de OCR até que extrair_campos(texto) encontre todos os campos.
+
+    Args:
+        filepath: PDF digitalizado ou imagem
+        extrair_campos: função texto -> dict de campos (None = não encontrado);
+            deve considerar só campos ancorados em rótulo, pois decide a parada
+        normalizar: função opcional aplicada ao texto retornado
+        estagios: sequência de (nome, função (filepath, contexto) -> texto)
+
+    Returns:
+        (texto, nome_do_estagio) ou (None, None) se o OCR não estiver disponível
+    """
+    try:
+        import pytesseract  # noqa: F401
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        logger.warning("pytesseract ou PIL não disponível para OCR")
+        return None, None
+
+    contexto = {}
+    melhor = (None, None, -1)
+    for nome, estagio in estagios:
+        try:
+            texto = estagio(filepath, contexto)
+        except ImportError:
+            logger.warning("pdf2image não disponível para processar PDF")
+            return None, None
+        except Exception as e:
+            logger.error(f"Erro no OCR ({nome}) de {filepath}: {e}")
+            continue
+
+        campos = extrair_campos(texto)
+        encontrados = sum(1 for v in campos.values() if v)
+        logger.info(f"OCR {nome}: {encontrados}/{len(campos)} campos em {os.path.basename(filepath)}")
+        if encontrados > melhor[2]:
+            melhor = (texto, nome, encontrados)
+        if encontrados == len(campos):
+            break
+
+    texto, nome, _ = melhor
+    if texto is None:
+        return None, None
+    return (normalizar(texto) if normalizar else texto), nome
@@ -0,0 +1,113 @@
+"""
+=============================================================================
+PAGINAÇÃO POR KEYSET (CURSOR)
+=============================================================================
+Base comum das listagens paginadas sem OFFSET e sem COUNT (contatos da
+campanha, histórico de mensagens, pesquisas de satisfação, relatórios):
+
+- A página é ordenada por uma chave única (ex: (data, id)) e o cursor é a
+  chave da primeira/última linha exibida; avançar filtra chave < cursor (ou
+  >, em ordem crescente), então qualquer página custa o mesmo que a primeira.
+- Busca-se uma linha a mais que a página para saber se existe a seguinte.
+- Cursores compostos vão na URL como JSON [valor, id] em base64.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+POR_PAGINA = 50
+
+
+def codificar_cursor(valor, ultimo_id):
+    return base64.urlsafe_b64encode(json.dumps([valor, ultimo_id]).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """(valor, id) do cursor, ou None se vazio/inválido"""
+    if not cursor:
+        return None
+    try:
+        valor, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return valor, int(ultimo_id)
+    except Exception:
+        return None
+
+
+class PaginaKeyset:
+    """Página keyset: items + cursores para a anterior/próxima"""
+
+    def __init__(self, items, has_prev, has_next, cursor):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.cursor_anterior = cursor(items[0]) if items else None
+        self.cursor_proximo = cursor(items[-1]) if items else None
+
+
+def pagina_keyset(q, colunas, cursor, apos=None, antes=None, decrescente=False, por_pagina=POR_PAGINA):
+    """
+    Uma página de q ordenada pela chave colunas.
+
+    Args:
+        colunas: colunas da chave de ordenação, a última única (ex: (LogMsg.data, LogMsg.id))
+        cursor: função item -> cursor exibido nos links Anterior/Próximo
+        apos: posição (valores da chave) da última linha da página anterior (avançar)
+        antes: posição da primeira linha da página seguinte (voltar)
+        decrescente: True = maiores primeiro (mais recentes, no caso de datas)
+    """
+    from sqlalchemy import tuple_
+
+    chave = tuple_(*colunas) if len(colunas) > 1 else colunas[0]
+    crescente = [c.asc() for c in colunas]
+    invertida = [c.desc() for c in colunas]
+    if decrescente:
+        crescente, invertida = invertida, crescente
+
+    def depois(posicao):
+        valor = tuple_(*posicao) if len(colunas) > 1 else posicao[0]
+        return chave < valor if decrescente else chave > valor
+
+    def antes_de(posicao):
+        valor = tuple_(*posicao) if len(colunas) > 1 else posicao[0]
+        return chave > valor if decrescente else chave < valor
+
+    if antes:
+        linhas = q.filter(antes_de(antes)).order_by(*invertida).limit(por_pagina + 1).all()
+        has_prev = len(linhas) > por_pagina
+        return PaginaKeyset(list(reversed(linhas[:por_pagina])), has_prev, True, cursor)
+
+    if apos:
+        q = q.filter(depois(apos))
+    linhas = q.order_by(*crescente).limit(por_pagina + 1).all()
+    return PaginaKeyset(linhas[:por_pagina], bool(apos), len(linhas) > por_pagina, cursor)
+
+
+def _posicao_data(cursor):
+    """(data, id) do cursor, ou None se vazio/inválido"""
+    posicao = decodificar_cursor(cursor)
+    if not posicao or not posicao[0]:
+        return None
+    try:
+        return datetime.fromisoformat(posicao[0]), posicao[1]
+    except (TypeError, ValueError):
+        return None
+
+
+def pagina_por_data(q, coluna_data, coluna_id, apos=None, antes=None, por_pagina=POR_PAGINA):
+    """
+    Página de q em (coluna_data, coluna_id), mais recentes primeiro.
+
+    Args:
+        apos: cursor da última linha da página anterior (avançar)
+        antes: cursor da primeira linha da página seguinte (voltar)
+    """
+    def cursor(item):
+        data = getattr(item, coluna_data.key)
+        return codificar_cursor(data.isoformat() if data else None, getattr(item, coluna_id.key))
+
+    return pagina_keyset(
+        q, (coluna_data, coluna_id), cursor,
+        apos=_posicao_data(apos), antes=_posicao_data(antes),
+        decrescente=True, por_pagina=por_pagina
+    )
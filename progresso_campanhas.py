@@ -0,0 +1,515 @@
+"""
+=============================================================================
+PROGRESSO DAS CAMPANHAS - SNAPSHOT EM CACHE E EVENTOS (SSE)
+=============================================================================
+O progresso de uma campanha (contadores, último envio, próximo paciente,
+erros recentes) é calculado uma vez e compartilhado por todas as abas:
+
+- Os workers de envio chamam publicar_progresso() após cada envio: o
+  snapshot é recalculado, gravado no Redis e publicado no canal
+  progresso:<tipo>:<id>.
+- /api/progresso/<tipo>/<id>/eventos (Server-Sent Events) repassa as
+  publicações do canal para o navegador. Sem Redis, o stream relê o
+  snapshot em cache a cada TTL_SNAPSHOT segundos e só envia se mudou.
+  Cada stream prende uma thread do gunicorn, então cada processo aceita no
+  máximo MAX_STREAMS_POR_PROCESSO; acima disso a rota responde 503 e a
+  página volta ao polling (ETag/304).
+- Os endpoints de polling (api_status, progresso de consultas e SCIH) e o
+  status das tasks Celery devolvem o snapshot em cache, recalculado no
+  máximo a cada TTL_SNAPSHOT / TTL_TASK segundos.
+
+Cada campanha tem um contador de versão (progresso:versao:<tipo>:<id>),
+incrementado a cada mudança de estado (invalidar_progresso: envios,
+Campanha.atualizar_stats, pausa/cancelamento). A versão faz parte da chave
+do snapshot, então uma mudança é vista na hora, sem esperar o TTL. As
+respostas de polling levam ETag e devolvem 304 se nada mudou.
+
+Tipos: 'fila' (Campanha), 'consulta' (CampanhaConsulta), 'scih' (CampanhaSCIH).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from cache_redis import obter_redis, marcar_indisponivel
+
+logger = logging.getLogger(__name__)
+
+TIPOS_PROGRESSO = ('fila', 'consulta', 'scih')
+
+TTL_SNAPSHOT = 5      # segundos de validade do snapshot de progresso
+TTL_TASK = 2          # segundos de validade do status de uma task Celery
+TTL_LOCAL = 1         # cache no próprio processo (várias abas no mesmo worker web)
+MAX_LOCAL = 512       # entradas no cache do processo (LRU)
+
+INTERVALO_VERIFICACAO = 10  # com Redis: releitura do snapshot / keep-alive do stream
+DURACAO_MAX_STREAM = 300    # o navegador reconecta sozinho (EventSource) após este tempo
+RETRY_MS = 3000
+
+# Streams abertos ao mesmo tempo por processo web: cada um ocupa uma das
+# threads do gthread por até DURACAO_MAX_STREAM, e as demais precisam ficar
+# livres para o webhook e as páginas
+MAX_STREAMS_POR_PROCESSO = int(os.environ.get('MAX_STREAMS_SSE', '4'))
+
+_vagas_stream = threading.BoundedSemaphore(MAX_STREAMS_POR_PROCESSO)
+
+_local = OrderedDict()     # chave -> (expira_em, valor), mais recente no fim
+_versao_local = {}         # chave sem ':v<N>' -> chave versionada guardada em _local
+_lock = threading.Lock()
+
+_RE_VERSAO = re.compile(r'^(.*):v\d+$')
+
+
+def canal(tipo, campanha_id):
+    return f'progresso:{tipo}:{campanha_id}'
+
+
+def _chave(tipo, identificador):
+    return f'progresso:snap:{tipo}:{identificador}'
+
+
+def _chave_versao(tipo, campanha_id):
+    return f'progresso:versao:{tipo}:{campanha_id}'
+
+
+# =============================================================================
+# CACHE (processo -> Redis -> cálculo)
+# =============================================================================
+
+def _descartar_local(chave):
+    """Remove a entrada do cache do processo (chamar com _lock)"""
+    _local.pop(chave, None)
+    versao = _RE_VERSAO.match(chave)
+    if versao and _versao_local.get(versao.group(1)) == chave:
+        del _versao_local[versao.group(1)]
+
+
+def _guardar_local(chave, expira_em, valor):
+    """
+    Grava no cache do processo (chamar com _lock). A cada mudança de versão e
+    a cada task consultada surge uma chave nova, então o cache é limitado:
+    a versão anterior do mesmo snapshot sai na hora e, acima de MAX_LOCAL,
+    saem as expiradas e depois as menos usadas.
+    """
+    versao = _RE_VERSAO.match(chave)
+    if versao:
+        anterior = _versao_local.get(versao.group(1))
+        if anterior and anterior != chave:
+            _local.pop(anterior, None)
+        _versao_local[versao.group(1)] = chave
+
+    _local[chave] = (expira_em, valor)
+    _local.move_to_end(chave)
+
+    if len(_local) > MAX_LOCAL:
+        agora = time.time()
+        for expirada in [c for c, (expira, _) in _local.items() if expira <= agora]:
+            _descartar_local(expirada)
+    while len(_local) > MAX_LOCAL:
+        _descartar_local(next(iter(_local)))
+
+
+def _ler_local(chave):
+    with _lock:
+        item = _local.get(chave)
+        if not item:
+            return None
+        if item[0] <= time.time():
+            _descartar_local(chave)
+            return None
+        _local.move_to_end(chave)
+        return item[1]
+
+
+def _gravar(chave, valor, ttl):
+    r = obter_redis()
+    # Sem Redis o cache do processo vale pelo TTL inteiro
+    with _lock:
+        _guardar_local(chave, time.time() + (min(ttl, TTL_LOCAL) if r else ttl), valor)
+    if r:
+        try:
+            r.setex(chave, ttl, valor)
+        except Exception as e:
+            marcar_indisponivel(e)
+
+
+def obter_snapshot(chave, calcular, ttl):
+    """JSON em cache ou calculado por calcular() (dict) e gravado por ttl segundos"""
+    valor = _ler_local(chave)
+    if valor is not None:
+        return valor
+
+    r = obter_redis()
+    if r:
+        try:
+            valor = r.get(chave)
+        except Exception as e:
+            marcar_indisponivel(e)
+            valor = None
+        if valor:
+            with _lock:
+                _guardar_local(chave, time.time() + TTL_LOCAL, valor)
+            return valor
+
+    valor = json.dumps(calcular(), default=str)
+    _gravar(chave, valor, ttl)
+    return valor
+
+
+# =============================================================================
+# VERSÃO (invalidação)
+# =============================================================================
+
+TTL_VERSAO = 86400
+_versoes_locais = {}
+
+
+def versao_progresso(tipo, campanha_id):
+    """Versão atual do progresso da campanha (0 se nunca alterada / sem Redis)"""
+    r = obter_redis()
+    if r:
+        try:
+            return int(r.get(_chave_versao(tipo, campanha_id)) or 0)
+        except Exception as e:
+            marcar_indisponivel(e)
+    return _versoes_locais.get((tipo, campanha_id), 0)
+
+
+def invalidar_progresso(tipo, campanha_id):
+    """Incrementa a versão: o próximo acesso recalcula o snapshot"""
+    with _lock:
+        _versoes_locais[(tipo, campanha_id)] = _versoes_locais.get((tipo, campanha_id), 0) + 1
+    r = obter_redis()
+    if r:
+        try:
+            chave = _chave_versao(tipo, campanha_id)
+            pipe = r.pipeline()
+            pipe.incr(chave)
+            pipe.expire(chave, TTL_VERSAO)
+            pipe.execute()
+        except Exception as e:
+            marcar_indisponivel(e)
+
+
+# =============================================================================
+# CÁLCULO DO PROGRESSO
+# =============================================================================
+
+def _fortaleza(dt, fmt):
+    if not dt:
+        return None
+    try:
+        import pytz
+        from app import TZ_FORTALEZA
+        if dt.tzinfo is None:
+            dt = pytz.utc.localize(dt)
+        return dt.astimezone(TZ_FORTALEZA).strftime(fmt)
+    except Exception:
+        return dt.strftime(fmt)
+
+
+def _proximo_em_segs(status_enviando, ultimo_log, intervalo):
+    if not status_enviando or not ultimo_log or not ultimo_log.data:
+        return None
+    return max(int(intervalo - (datetime.utcnow() - ultimo_log.data).total_seconds()), 0)
+
+
+def _progresso_fila(campanha_id):
+    """Mesmo conteúdo do antigo api_status, com os contadores gravados na campanha"""
+    from app import db, Campanha
+
+    camp = db.session.get(Campanha, campanha_id)
+    if not camp:
+        return None
+    return {
+        'status': camp.status,
+        'status_msg': camp.status_msg,
+        'total_contatos': camp.total_contatos,
+        'total_validos': camp.total_validos,
+        'total_invalidos': camp.total_invalidos,
+        'total_enviados': camp.total_enviados,
+        'total_confirmados': camp.total_confirmados,
+        'total_rejeitados': camp.total_rejeitados,
+        'total_erros': camp.total_erros,
+        'pct_validacao': camp.pct_validacao(),
+        'pct_envio': camp.pct_envio(),
+        'pct_confirmacao': camp.pct_confirmacao(),
+        'percentual_validacao': camp.percentual_validacao(),
+        'percentual_envio': camp.percentual_envio(),
+        'percentual_confirmacao': camp.percentual_confirmacao(),
+        'percentual_conclusao': camp.percentual_conclusao(),
+        'pendentes_validar': camp.pendentes_validar(),
+        'pendentes_enviar': camp.pendentes_enviar()
+    }
+
+
+def _progresso_consulta(campanha_id):
+    """Atividade ao vivo do modo consulta"""
+    from app import db, CampanhaConsulta, AgendamentoConsulta, LogMsgConsulta, obter_hoje_fortaleza
+
+    campanha = db.session.get(CampanhaConsulta, campanha_id)
+    if not campanha:
+        return None
+    enviando = campanha.status == 'enviando'
+
+    ultimo_log = LogMsgConsulta.query.filter_by(
+        campanha_id=campanha.id, direcao='enviada', status='sucesso'
+    ).order_by(LogMsgConsulta.id.desc()).first()
+
+    ultimo_enviado = None
+    if ultimo_log:
+        consulta_ult = db.session.get(AgendamentoConsulta, ultimo_log.consulta_id) if ultimo_log.consulta_id else None
+        if consulta_ult:
+            ultimo_enviado = {
+                'nome': consulta_ult.paciente,
+                'telefone': ultimo_log.telefone,
+                'quando': _fortaleza(ultimo_log.data, '%d/%m %H:%M:%S'),
+            }
+
+    proximo_paciente = None
+    if enviando:
+        prox = AgendamentoConsulta.query.filter_by(
+            campanha_id=campanha.id, status='AGUARDANDO_ENVIO'
+        ).order_by(AgendamentoConsulta.id).first()
+        if prox:
+            telefones = [t for t in [
+                prox.telefone_cadastro,
+                prox.telefone_registro if prox.telefone_registro != prox.telefone_cadastro else None
+            ] if t]
+            proximo_paciente = {'nome': prox.paciente, 'telefone': ', '.join(telefones)}
+
+    erros_recentes = []
+    for e in LogMsgConsulta.query.filter_by(
+        campanha_id=campanha.id, status='erro'
+    ).order_by(LogMsgConsulta.id.desc()).limit(5):
+        cons_err = db.session.get(AgendamentoConsulta, e.consulta_id) if e.consulta_id else None
+        erros_recentes.append({
+            'nome': cons_err.paciente if cons_err else '-',
+            'telefone': e.telefone or '-',
+            'erro': (e.erro or '')[:200],
+            'quando': e.data.strftime('%d/%m %H:%M') if e.data else '-',
+        })
+
+    # Sem gravar: o contador do dia é zerado pelo worker em pode_enviar_hoje()
+    enviados_hoje = campanha.enviados_hoje if campanha.data_ultimo_envio == obter_hoje_fortaleza() else 0
+
+    return {
+        'status': campanha.status,
+        'status_msg': campanha.status_msg,
+        'total_consultas': campanha.total_consultas,
+        'total_enviados': campanha.total_enviados,
+        'total_confirmados': campanha.total_confirmados,
+        'total_rejeitados': campanha.total_rejeitados,
+        'total_aguardando_comprovante': campanha.total_aguardando_comprovante or 0,
+        'enviados_hoje': enviados_hoje or 0,
+        'meta_diaria': campanha.meta_diaria or 50,
+        'intervalo_segs': campanha.tempo_entre_envios or 15,
+        'ultimo_enviado': ultimo_enviado,
+        'proximo_paciente': proximo_paciente,
+        'proximo_em_segs': _proximo_em_segs(enviando, ultimo_log, campanha.tempo_entre_envios or 15),
+        'erros_recentes': erros_recentes,
+    }
+
+
+def _progresso_scih(campanha_id):
+    """Atividade ao vivo do modo SCIH"""
+    from app import db, CampanhaSCIH, PacienteSCIH, LogMsgSCIH, obter_hoje_fortaleza
+
+    camp = db.session.get(CampanhaSCIH, campanha_id)
+    if not camp:
+        return None
+    # Respostas chegam pelo formulário público, que não atualiza os contadores
+    camp.atualizar_stats()
+    enviando = camp.status == 'enviando'
+    intervalo = camp.calcular_intervalo()
+
+    ultimo_log = LogMsgSCIH.query.filter_by(
+        campanha_id=camp.id, direcao='enviada', status='sucesso'
+    ).order_by(LogMsgSCIH.id.desc()).first()
+
+    ultimo_enviado = None
+    if ultimo_log:
+        pac_ult = db.session.get(PacienteSCIH, ultimo_log.paciente_id) if ultimo_log.paciente_id else None
+        if pac_ult:
+            ultimo_enviado = {
+                'nome': pac_ult.nome,
+                'telefone': ultimo_log.telefone,
+                'quando': _fortaleza(ultimo_log.data, '%d/%m %H:%M:%S'),
+            }
+
+    proximo_paciente = None
+    if enviando:
+        prox = PacienteSCIH.query.filter_by(
+            campanha_id=camp.id, status='AGUARDANDO_ENVIO'
+        ).order_by(PacienteSCIH.id).first()
+        if prox:
+            proximo_paciente = {'nome': prox.nome, 'telefone': prox.telefone}
+
+    erros_recentes = []
+    for e in LogMsgSCIH.query.filter_by(
+        campanha_id=camp.id, status='erro'
+    ).order_by(LogMsgSCIH.id.desc()).limit(5):
+        pac_err = db.session.get(PacienteSCIH, e.paciente_id) if e.paciente_id else None
+        erros_recentes.append({
+            'nome': pac_err.nome if pac_err else '-',
+            'telefone': e.telefone or '-',
+            'erro': (e.erro or '')[:200],
+            'quando': _fortaleza(e.data, '%d/%m %H:%M') or '',
+        })
+
+    enviados_hoje = camp.enviados_hoje if camp.data_ultimo_envio == obter_hoje_fortaleza() else 0
+
+    return {
+        'status': camp.status,
+        'status_msg': camp.status_msg,
+        'total_pacientes': camp.total_pacientes,
+        'total_enviados': camp.total_enviados,
+        'total_respondidos': camp.total_respondidos,
+        'total_sem_resposta': camp.total_sem_resposta_count(),
+        'total_erros': camp.total_erros,
+        'pct_resposta': camp.pct_resposta(),
+        'enviados_hoje': enviados_hoje or 0,
+        'meta_diaria': camp.meta_diaria,
+        'intervalo_segs': intervalo,
+        'ultimo_enviado': ultimo_enviado,
+        'proximo_paciente': proximo_paciente,
+        'proximo_em_segs': _proximo_em_segs(enviando, ultimo_log, intervalo),
+        'erros_recentes': erros_recentes,
+    }
+
+
+_CALCULOS = {
+    'fila': _progresso_fila,
+    'consulta': _progresso_consulta,
+    'scih': _progresso_scih,
+}
+
+
+def calcular_progresso(tipo, campanha_id):
+    return _CALCULOS[tipo](campanha_id)
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+def _chave_snapshot(tipo, campanha_id):
+    return _chave(tipo, f'{campanha_id}:v{versao_progresso(tipo, campanha_id)}')
+
+
+def obter_progresso(tipo, campanha_id):
+    """Snapshot (JSON) da versão atual do progresso, no máximo TTL_SNAPSHOT segundos velho"""
+    return obter_snapshot(
+        _chave_snapshot(tipo, campanha_id), lambda: calcular_progresso(tipo, campanha_id), TTL_SNAPSHOT
+    )
+
+
+def resposta_progresso(tipo, campanha_id):
+    """Resposta JSON do snapshot com ETag; 304 se o navegador já tem esta versão"""
+    from flask import current_app, request
+
+    resp = current_app.response_class(obter_progresso(tipo, campanha_id), mimetype='application/json')
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+
+def obter_status_task(task_id, calcular, formato='processamento'):
+    """Status de uma task Celery em cache por TTL_TASK segundos (uma leitura do backend por período)"""
+    return obter_snapshot(_chave('task', f'{formato}:{task_id}'), calcular, TTL_TASK)
+
+
+def publicar_progresso(tipo, campanha_id):
+    """
+    Recalcula o snapshot e publica para os streams abertos. Chamado pelos
+    workers após cada envio; nunca interrompe o envio em caso de erro.
+    """
+    try:
+        valor = json.dumps(calcular_progresso(tipo, campanha_id), default=str)
+    except Exception as e:
+        logger.warning(f"Erro ao calcular progresso {tipo}:{campanha_id}: {e}")
+        return
+
+    invalidar_progresso(tipo, campanha_id)
+    _gravar(_chave_snapshot(tipo, campanha_id), valor, TTL_SNAPSHOT)
+    r = obter_redis()
+    if r:
+        try:
+            r.publish(canal(tipo, campanha_id), valor)
+        except Exception as e:
+            marcar_indisponivel(e)
+
+
+def reservar_stream():
+    """Reserva uma vaga de stream no processo (False se todas ocupadas)"""
+    return _vagas_stream.acquire(blocking=False)
+
+
+def liberar_stream():
+    _vagas_stream.release()
+
+
+def stream_progresso(tipo, campanha_id):
+    """
+    Gerador de Server-Sent Events: envia o snapshot atual e depois cada
+    publicação do canal. A conexão com o banco é devolvida ao pool após cada
+    leitura, então streams abertos não prendem conexões.
+    """
+    from app import db
+
+    def ler():
+        try:
+            return obter_progresso(tipo, campanha_id)
+        finally:
+            db.session.remove()
+
+    ultimo = ler()
+    yield f'retry: {RETRY_MS}\n\n'
+    yield f'data: {ultimo}\n\n'
+
+    pubsub = None
+    r = obter_redis()
+    if r:
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(canal(tipo, campanha_id))
+        except Exception as e:
+            marcar_indisponivel(e)
+            pubsub = None
+
+    fim = time.time() + DURACAO_MAX_STREAM
+    proxima_leitura = time.time() + (INTERVALO_VERIFICACAO if pubsub else TTL_SNAPSHOT)
+    try:
+        while time.time() < fim:
+            if pubsub:
+                try:
+                    msg = pubsub.get_message(timeout=1.0)
+                except Exception as e:
+                    marcar_indisponivel(e)
+                    pubsub, msg = None, None
+                if msg and msg.get('data') and msg['data'] != ultimo:
+                    ultimo = msg['data']
+                    yield f'data: {ultimo}\n\n'
+            else:
+                time.sleep(1)
+
+            if time.time() >= proxima_leitura:
+                # Mudanças que não passam pelos workers (webhook, pausa manual)
+                proxima_leitura = time.time() + (INTERVALO_VERIFICACAO if pubsub else TTL_SNAPSHOT)
+                atual = ler()
+                if atual != ultimo:
+                    ultimo = atual
+                    yield f'data: {ultimo}\n\n'
+                else:
+                    yield ': ping\n\n'
+    finally:
+        if pubsub:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
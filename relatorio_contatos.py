@@ -0,0 +1,134 @@
+"""
+=============================================================================
+RELATÓRIOS - CONTATOS PAGINADOS
+=============================================================================
+A tabela "Dados Detalhados" de /relatorios carrega os contatos da campanha
+sob demanda, em páginas, via /api/relatorios/<id>/contatos.
+
+- Paginação por keyset: o cursor é o (valor da ordenação, id) da última
+  linha da página anterior, então a página N custa o mesmo que a primeira
+  (sem OFFSET).
+- Filtro, busca e ordenação são feitos no banco.
+- O telefone principal (menor prioridade, depois menor id) vem na mesma
+  consulta: LEFT JOIN LATERAL no PostgreSQL, subconsultas correlacionadas
+  nos demais bancos (SQLite em desenvolvimento).
+"""
+
+from paginacao_keyset import codificar_cursor, decodificar_cursor
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+FILTROS_RELATORIO = ('todos', 'confirmados', 'rejeitados', 'enviados', 'pendentes', 'erros')
+
+# '-' = decrescente; 'id' = ordem de importação
+ORDENS_RELATORIO = ('id', '-id', 'nome', '-nome')
+
+
+def _condicao_filtro(filtro):
+    """Condição do filtro, na mesma precedência dos badges: confirmado > rejeitado > enviado > erro > pendente"""
+    from sqlalchemy import and_, or_
+    from app import Contato
+
+    nao_confirmado = Contato.confirmado.isnot(True)
+    nao_rejeitado = Contato.rejeitado.isnot(True)
+    nao_enviado = or_(Contato.status.is_(None), Contato.status != 'enviado')
+
+    if filtro == 'confirmados':
+        return Contato.confirmado.is_(True)
+    if filtro == 'rejeitados':
+        return and_(nao_confirmado, Contato.rejeitado.is_(True))
+    if filtro == 'enviados':
+        return and_(nao_confirmado, nao_rejeitado, Contato.status == 'enviado')
+    if filtro == 'erros':
+        return and_(nao_confirmado, nao_rejeitado, nao_enviado, Contato.erro.isnot(None))
+    if filtro == 'pendentes':
+        return and_(nao_confirmado, nao_rejeitado, nao_enviado, Contato.erro.is_(None))
+    return None
+
+
+def _colunas_telefone():
+    """(numero, data_envio, join lateral ou None) do telefone principal"""
+    from sqlalchemy import select
+    from app import db, Contato, Telefone
+
+    if db.engine.dialect.name == 'postgresql':
+        tel = select(Telefone.numero, Telefone.data_envio).where(
+            Telefone.contato_id == Contato.id
+        ).order_by(Telefone.prioridade, Telefone.id).limit(1).correlate(Contato).lateral('tel')
+        return tel.c.numero, tel.c.data_envio, tel
+
+    def principal(coluna):
+        return select(coluna).where(
+            Telefone.contato_id == Contato.id
+        ).order_by(Telefone.prioridade, Telefone.id).limit(1).correlate(Contato).scalar_subquery()
+
+    return principal(Telefone.numero), principal(Telefone.data_envio), None
+
+
+def pagina_contatos(campanha_id, filtro='todos', busca='', ordem='id', cursor=None, limite=LIMITE_PADRAO):
+    """
+    Uma página de contatos da campanha.
+
+    Returns:
+        dict com 'contatos' (lista) e 'proximo' (cursor da próxima página ou None)
+    """
+    from sqlalchemy import tuple_, true
+    from app import db, Contato
+
+    if ordem not in ORDENS_RELATORIO:
+        ordem = 'id'
+    descendente = ordem.startswith('-')
+    coluna_ordem = Contato.nome if ordem.lstrip('-') == 'nome' else Contato.id
+    limite = max(1, min(int(limite or LIMITE_PADRAO), LIMITE_MAXIMO))
+
+    numero, data_envio, lateral = _colunas_telefone()
+    q = db.session.query(
+        Contato.id, Contato.nome, Contato.procedimento, Contato.procedimento_normalizado,
+        Contato.status, Contato.confirmado, Contato.rejeitado, Contato.erro, Contato.resposta,
+        numero.label('telefone'), data_envio.label('data_envio')
+    ).filter(Contato.campanha_id == campanha_id)
+    if lateral is not None:
+        q = q.outerjoin(lateral, true())
+
+    condicao = _condicao_filtro(filtro)
+    if condicao is not None:
+        q = q.filter(condicao)
+    if busca:
+        q = q.filter(Contato.nome.ilike(f'%{busca}%'))
+
+    posicao = decodificar_cursor(cursor)
+    if coluna_ordem is Contato.id:
+        if posicao:
+            q = q.filter(Contato.id < posicao[1] if descendente else Contato.id > posicao[1])
+        q = q.order_by(Contato.id.desc() if descendente else Contato.id)
+    else:
+        if posicao:
+            chave, depois_de = tuple_(coluna_ordem, Contato.id), tuple_(*posicao)
+            q = q.filter(chave < depois_de if descendente else chave > depois_de)
+        q = q.order_by(*((coluna_ordem.desc(), Contato.id.desc()) if descendente else (coluna_ordem, Contato.id)))
+
+    linhas = q.limit(limite + 1).all()
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    contatos = [{
+        'id': r.id,
+        'nome': r.nome,
+        'telefone': r.telefone,
+        'procedimento': r.procedimento,
+        'procedimento_normalizado': r.procedimento_normalizado,
+        'status': r.status,
+        'confirmado': r.confirmado,
+        'rejeitado': r.rejeitado,
+        'erro': r.erro,
+        'data_envio': r.data_envio.isoformat() if r.data_envio else None,
+        'resposta': r.resposta
+    } for r in linhas]
+
+    proximo = None
+    if tem_mais and linhas:
+        ultima = linhas[-1]
+        proximo = codificar_cursor(ultima.nome if coluna_ordem is Contato.nome else ultima.id, ultima.id)
+
+    return {'contatos': contatos, 'proximo': proximo}
@@ -6,6 +6,7 @@ Pesquisa pós-cirúrgica enviada via WhatsApp para pacientes da Maternidade
 Escola Assis Chateaubriand. Templates fixos: CESARIANA e MASTOLOGIA.
 """
 
+import base64
 import json
 import logging
 import secrets
@@ -61,13 +62,90 @@ def _gerar_token():
     return secrets.token_urlsafe(24)
 
 
+def _gerar_tokens(quantidade):
+    """Gera vários tokens de uma vez (uma única leitura do gerador seguro)."""
+    bruto = secrets.token_bytes(24 * quantidade)
+    return [
+        base64.urlsafe_b64encode(bruto[i:i + 24]).rstrip(b'=').decode('ascii')
+        for i in range(0, len(bruto), 24)
+    ]
+
+
+# Colunas aceitas na planilha (cabeçalho já normalizado em maiúsculas)
+COLUNAS_SCIH = {
+    'nome': ['PACIENTE', 'NOME', 'NOME COMPLETO'],
+    'telefone': ['FONE', 'TELEFONE', 'CELULAR', 'CONTATO'],
+    'data_cirurgia': ['DATA CIRURGIA', 'DATA DA CIRURGIA', 'DATA'],
+    'idade': ['IDADE'],
+    'cirurgia': ['CIRURGIA', 'PROCEDIMENTO'],
+    'observacoes': ['OBSERVACOES', 'OBSERVAÇÕES', 'OBS'],
+}
+
+
+def _detectar_colunas(cabecalho):
+    """Mapeia cada campo do paciente para a coluna correspondente do cabeçalho (ou None)."""
+    cabecalho = [str(c).strip().upper() for c in cabecalho if c is not None]
+    return {
+        campo: next((c for c in cabecalho if c in candidatas), None)
+        for campo, candidatas in COLUNAS_SCIH.items()
+    }
+
+
+def _inspecionar_planilha(arquivo, linhas_amostra=5):
+    """
+    Lista as abas da planilha com cabeçalho, primeiras linhas e colunas detectadas.
+
+    Para .xlsx usa openpyxl em modo somente leitura: lê os metadados do
+    workbook e apenas as primeiras linhas de cada aba, sem carregar as
+    planilhas inteiras em memória. Arquivos .xls caem no pandas com nrows.
+    """
+    abas = []
+    nome_arquivo = (getattr(arquivo, 'filename', None) or str(arquivo)).lower()
+    arquivo = getattr(arquivo, 'stream', arquivo)
+
+    if nome_arquivo.endswith('.xls'):
+        xls = pd.ExcelFile(arquivo)
+        for nome in xls.sheet_names:
+            df = pd.read_excel(xls, sheet_name=nome, dtype=str, nrows=linhas_amostra).fillna('')
+            cabecalho = [str(c).strip() for c in df.columns]
+            abas.append({
+                'nome': nome,
+                'cabecalho': cabecalho,
+                'amostra': df.values.tolist(),
+                'colunas': _detectar_colunas(cabecalho),
+            })
+        return abas
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            linhas = [
+                ['' if v is None else str(v).strip() for v in linha]
+                for linha in ws.iter_rows(max_row=linhas_amostra + 1, values_only=True)
+            ]
+            cabecalho = linhas[0] if linhas else []
+            abas.append({
+                'nome': ws.title,
+                'cabecalho': cabecalho,
+                'amostra': linhas[1:],
+                'colunas': _detectar_colunas(cabecalho),
+            })
+    finally:
+        wb.close()
+
+    return abas
+
+
 def init_scih_routes(app, db):
     """Registra todas as rotas do módulo SCIH."""
 
     from app import (
-        CampanhaSCIH, PacienteSCIH, RespostaSCIH, LogMsgSCIH,
+        CampanhaSCIH, PacienteSCIH, RespostaSCIH,
         WhatsApp, ConfigWhatsApp, formatar_numero, csrf, TZ_FORTALEZA
     )
+    from importacao_lote import salvar_pacientes_scih_em_lote
 
     # Filtro Jinja: converte um datetime salvo em UTC para o horário de
     # Fortaleza (UTC-3) na hora de exibir. Datetimes naive são tratados como UTC.
@@ -162,48 +240,69 @@ def init_scih_routes(app, db):
                     flash('WhatsApp não está configurado corretamente.', 'danger')
                     return redirect(url_for('scih_dashboard'))
 
-                # Detectar abas disponíveis e ler a escolhida (ou a primeira)
+                # Detectar abas disponíveis (só metadados + cabeçalhos) e escolher a aba
                 try:
-                    xls = pd.ExcelFile(arquivo)
-                    abas_disponiveis = xls.sheet_names
+                    abas = _inspecionar_planilha(arquivo, linhas_amostra=0)
+                    abas_disponiveis = [a['nome'] for a in abas]
                 except Exception as e:
                     flash(f'Não consegui abrir o arquivo Excel: {e}', 'danger')
                     return redirect(request.url)
 
+                if not abas:
+                    flash('O arquivo Excel não possui abas.', 'danger')
+                    return redirect(request.url)
+
                 if aba:
                     # Tenta match case-insensitive
-                    match = next((s for s in abas_disponiveis if s.strip().lower() == aba.lower()), None)
-                    if not match:
+                    info_aba = next((a for a in abas if a['nome'].strip().lower() == aba.lower()), None)
+                    if not info_aba:
                         flash(
                             f'Aba "{aba}" não encontrada. Abas disponíveis: '
                             + ', '.join(abas_disponiveis),
                             'danger'
                         )
                         return redirect(request.url)
-                    aba_usada = match
                 else:
-                    aba_usada = abas_disponiveis[0]
-
-                df = pd.read_excel(xls, sheet_name=aba_usada, dtype=str).fillna('')
-
-                # Normalizar nomes de colunas (uppercase, sem espaços extras)
-                df.columns = [str(c).strip().upper() for c in df.columns]
+                    info_aba = abas[0]
+                aba_usada = info_aba['nome']
 
-                col_nome = next((c for c in df.columns if c in ['PACIENTE', 'NOME', 'NOME COMPLETO']), None)
-                col_tel = next((c for c in df.columns if c in ['FONE', 'TELEFONE', 'CELULAR', 'CONTATO']), None)
-                col_data = next((c for c in df.columns if c in ['DATA CIRURGIA', 'DATA DA CIRURGIA', 'DATA']), None)
-                col_idade = next((c for c in df.columns if c in ['IDADE']), None)
-                col_cirurgia = next((c for c in df.columns if c in ['CIRURGIA', 'PROCEDIMENTO']), None)
-                col_obs = next((c for c in df.columns if c in ['OBSERVACOES', 'OBSERVAÇÕES', 'OBS']), None)
+                colunas = info_aba['colunas']
+                col_nome = colunas['nome']
+                col_tel = colunas['telefone']
+                col_data = colunas['data_cirurgia']
+                col_idade = colunas['idade']
 
                 if not col_nome or not col_tel:
                     flash(
                         'Planilha precisa ter pelo menos as colunas PACIENTE (ou NOME) e FONE (ou TELEFONE). '
-                        f'Colunas detectadas na aba "{aba_usada}": {", ".join(df.columns)}',
+                        f'Colunas detectadas na aba "{aba_usada}": {", ".join(info_aba["cabecalho"])}',
                         'danger'
                     )
                     return redirect(request.url)
 
+                # Ler apenas a aba escolhida e apenas as colunas usadas
+                arquivo.stream.seek(0)
+                usadas = [c for c in (col_nome, col_tel, col_data, col_idade) if c]
+                df = pd.read_excel(
+                    arquivo, sheet_name=aba_usada, dtype=str,
+                    usecols=lambda c: str(c).strip().upper() in usadas
+                ).fillna('')
+                df.columns = [str(c).strip().upper() for c in df.columns]
+                # Cabeçalhos que só diferem em caixa/espaços ('Fone' e 'FONE ')
+                # viram o mesmo nome: fica a primeira coluna, como em _detectar_colunas
+                df = df.loc[:, ~df.columns.duplicated()]
+
+                nomes = df[col_nome].str.strip()
+                telefones = df[col_tel].str.strip()
+                validos = (nomes != '') & (telefones != '')
+
+                pacientes = pd.DataFrame({
+                    'nome': nomes[validos],
+                    'telefone': telefones[validos],
+                    'idade': df.loc[validos, col_idade].str.strip() if col_idade else None,
+                    'data_cirurgia': df.loc[validos, col_data].str.strip() if col_data else None,
+                }).to_dict('records')
+
                 camp = CampanhaSCIH(
                     criador_id=current_user.id,
                     nome=nome,
@@ -215,26 +314,17 @@ def init_scih_routes(app, db):
                     status='pendente',
                 )
                 db.session.add(camp)
-                db.session.flush()
-
-                criados = 0
-                for _, row in df.iterrows():
-                    nome_pac = str(row.get(col_nome, '')).strip()
-                    tel_raw = str(row.get(col_tel, '')).strip()
-                    if not nome_pac or not tel_raw:
-                        continue
-                    paciente = PacienteSCIH(
-                        campanha_id=camp.id,
-                        criador_id=current_user.id,
-                        nome=nome_pac,
-                        telefone=tel_raw,
-                        idade=str(row.get(col_idade, '')).strip() if col_idade else None,
-                        data_cirurgia=str(row.get(col_data, '')).strip() if col_data else None,
-                        token=_gerar_token(),
-                        status='AGUARDANDO_ENVIO',
+                db.session.commit()
+
+                try:
+                    criados = salvar_pacientes_scih_em_lote(
+                        camp.id, current_user.id, pacientes, _gerar_tokens
                     )
-                    db.session.add(paciente)
-                    criados += 1
+                except Exception:
+                    # Não deixar campanha parcialmente importada
+                    db.session.delete(camp)
+                    db.session.commit()
+                    raise
 
                 camp.total_pacientes = criados
                 db.session.commit()
@@ -249,6 +339,25 @@ def init_scih_routes(app, db):
 
         return render_template('scih/importar.html', templates=TEMPLATES_PESQUISA)
 
+    @app.route('/scih/importar/inspecionar', methods=['POST'])
+    @login_required
+    def scih_importar_inspecionar():
+        """Lista abas, cabeçalhos e colunas detectadas sem importar a planilha."""
+        if not _exige_scih():
+            return jsonify({'erro': 'Acesso negado'}), 403
+
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename.lower().endswith(('.xlsx', '.xls')):
+            return jsonify({'erro': 'Envie um arquivo .xlsx ou .xls'}), 400
+
+        try:
+            abas = _inspecionar_planilha(arquivo)
+        except Exception as e:
+            logger.warning(f"Erro ao inspecionar planilha SCIH: {e}")
+            return jsonify({'erro': f'Não consegui abrir o arquivo Excel: {e}'}), 400
+
+        return jsonify({'abas': abas})
+
     # =========================================================================
     # DETALHE DA CAMPANHA
     # =========================================================================
@@ -340,6 +449,8 @@ def init_scih_routes(app, db):
         camp.status = 'pausado'
         camp.status_msg = 'Pausado pelo usuário'
         db.session.commit()
+        from progresso_campanhas import invalidar_progresso
+        invalidar_progresso('scih', camp.id)
         flash('Campanha pausada.', 'info')
         return redirect(url_for('scih_campanha_detalhe', id=id))
 
@@ -438,71 +549,9 @@ def init_scih_routes(app, db):
         camp = CampanhaSCIH.query.get_or_404(id)
         if camp.criador_id != current_user.id and not current_user.is_admin:
             return jsonify({'erro': 'acesso negado'}), 403
-        camp.atualizar_stats()
-
-        # Atividade ao vivo: último envio bem-sucedido + próximo previsto + erros recentes
-        ultimo_log = LogMsgSCIH.query.filter_by(
-            campanha_id=camp.id, direcao='enviada', status='sucesso'
-        ).order_by(LogMsgSCIH.id.desc()).first()
-
-        ultimo_nome = None
-        ultimo_telefone = None
-        ultimo_quando = None
-        proximo_em_segs = None
-        if ultimo_log:
-            pac_ult = db.session.get(PacienteSCIH, ultimo_log.paciente_id) if ultimo_log.paciente_id else None
-            ultimo_nome = pac_ult.nome if pac_ult else None
-            ultimo_telefone = ultimo_log.telefone
-            ultimo_quando = _fortaleza_dt(ultimo_log.data, '%d/%m %H:%M:%S')
-            if camp.status == 'enviando' and ultimo_log.data:
-                intervalo = camp.calcular_intervalo()
-                from datetime import datetime as _dt
-                segs_passados = (_dt.utcnow() - ultimo_log.data).total_seconds()
-                proximo_em_segs = max(int(intervalo - segs_passados), 0)
-
-        proximo_paciente = None
-        if camp.status == 'enviando':
-            prox = PacienteSCIH.query.filter_by(
-                campanha_id=camp.id, status='AGUARDANDO_ENVIO'
-            ).order_by(PacienteSCIH.id).first()
-            if prox:
-                proximo_paciente = {'nome': prox.nome, 'telefone': prox.telefone}
-
-        erros_recentes_q = LogMsgSCIH.query.filter_by(
-            campanha_id=camp.id, status='erro'
-        ).order_by(LogMsgSCIH.id.desc()).limit(5).all()
-        erros_recentes = []
-        for e in erros_recentes_q:
-            pac_err = db.session.get(PacienteSCIH, e.paciente_id) if e.paciente_id else None
-            erros_recentes.append({
-                'nome': pac_err.nome if pac_err else '-',
-                'telefone': e.telefone or '-',
-                'erro': (e.erro or '')[:200],
-                'quando': _fortaleza_dt(e.data, '%d/%m %H:%M'),
-            })
-
-        return jsonify({
-            'status': camp.status,
-            'status_msg': camp.status_msg,
-            'total_pacientes': camp.total_pacientes,
-            'total_enviados': camp.total_enviados,
-            'total_respondidos': camp.total_respondidos,
-            'total_sem_resposta': camp.total_sem_resposta_count(),
-            'total_erros': camp.total_erros,
-            'pct_resposta': camp.pct_resposta(),
-            'enviados_hoje': camp.enviados_hoje or 0,
-            'meta_diaria': camp.meta_diaria,
-            'intervalo_segs': camp.calcular_intervalo(),
-            # Atividade ao vivo
-            'ultimo_enviado': {
-                'nome': ultimo_nome,
-                'telefone': ultimo_telefone,
-                'quando': ultimo_quando,
-            } if ultimo_nome else None,
-            'proximo_paciente': proximo_paciente,
-            'proximo_em_segs': proximo_em_segs,
-            'erros_recentes': erros_recentes,
-        })
+        # Snapshot compartilhado entre as abas, com ETag/304 (ver progresso_campanhas.py)
+        from progresso_campanhas import resposta_progresso
+        return resposta_progresso('scih', camp.id)
 
     # =========================================================================
     # RESULTADOS COM FILTROS (pra Dr. Marcus classificar infecções)
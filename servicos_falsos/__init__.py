@@ -0,0 +1,26 @@
+"""
+=============================================================================
+SERVIÇOS FALSOS - EVOLUTION API E DEEPSEEK PARA TESTES LOCAIS
+=============================================================================
+Servidor HTTP que substitui a Evolution API (WhatsApp) e o endpoint
+compatível com OpenAI usado pelo DeepSeekAI, para medir a vazão das
+campanhas sem depender de serviços externos.
+
+Uso:
+    python -m servicos_falsos --porta 8099 --latencia 150 --taxa-erro 0.02 \\
+        --limite-por-minuto 60 --webhook-url http://localhost:5000/webhook/whatsapp
+
+Depois, no sistema:
+- Admin > Configurações: URL da Evolution API = http://localhost:8099
+  (a API Key é qualquer valor, a menos que --apikey seja informado)
+- .env: AI_API_BASE_URL=http://localhost:8099
+
+Endpoints de controle (prefixo /_falso):
+- GET  /_falso/stats      contadores de requisições, erros e mensagens
+- GET/POST /_falso/config  lê/altera latência, taxas e limites em tempo real
+- POST /_falso/webhook     dispara uma mensagem recebida sintética para o sistema
+"""
+
+from servicos_falsos.servidor import ConfigFalsa, criar_app
+
+__all__ = ['ConfigFalsa', 'criar_app']
@@ -0,0 +1,49 @@
+"""
+Executa os serviços falsos: python -m servicos_falsos --help
+"""
+
+import argparse
+import logging
+
+from servicos_falsos.servidor import ConfigFalsa, criar_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evolution API e DeepSeek falsos para testes locais')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--porta', type=int, default=8099)
+    parser.add_argument('--apikey', default='', help='Exigir esta apikey (vazio = aceita qualquer uma)')
+    parser.add_argument('--latencia', type=int, default=100, help='Latência média da Evolution (ms)')
+    parser.add_argument('--variacao', type=int, default=50, help='Variação da latência da Evolution (ms)')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração de respostas 500 da Evolution')
+    parser.add_argument('--limite-por-minuto', type=int, default=0, help='Envios por instância por minuto (0 = sem limite)')
+    parser.add_argument('--taxa-inexistente', type=float, default=0.1, help='Fração de números sem WhatsApp')
+    parser.add_argument('--webhook-url', default='', help='URL do /webhook/whatsapp do sistema')
+    parser.add_argument('--taxa-resposta', type=float, default=0.0, help='Fração de mensagens que recebem resposta')
+    parser.add_argument('--atraso-resposta', type=float, default=5.0, help='Segundos até a resposta chegar')
+    parser.add_argument('--latencia-ia', type=int, default=1500, help='Latência média do /chat/completions (ms)')
+    parser.add_argument('--taxa-erro-ia', type=float, default=0.0, help='Fração de respostas 500 da IA')
+    parser.add_argument('--taxa-omissao-ia', type=float, default=0.0, help='Fração de termos omitidos nos lotes da IA')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = ConfigFalsa(
+        apikey=args.apikey,
+        latencia_ms=args.latencia,
+        variacao_ms=args.variacao,
+        taxa_erro=args.taxa_erro,
+        limite_por_minuto=args.limite_por_minuto,
+        taxa_inexistente=args.taxa_inexistente,
+        webhook_url=args.webhook_url,
+        taxa_resposta=args.taxa_resposta,
+        atraso_resposta_s=args.atraso_resposta,
+        latencia_ia_ms=args.latencia_ia,
+        taxa_erro_ia=args.taxa_erro_ia,
+        taxa_omissao_ia=args.taxa_omissao_ia,
+    )
+    criar_app(config).run(host=args.host, port=args.porta, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+"""
+Servidor Flask que imita a Evolution API v2 e o /chat/completions do DeepSeek.
+
+Só implementa o que a classe WhatsApp e o DeepSeekAI (app.py) usam, com
+respostas no mesmo formato dos serviços reais. Latência, taxa de erro e
+limite de envios por minuto são configuráveis (ConfigFalsa) e podem ser
+alterados com o servidor rodando via /_falso/config.
+"""
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from datetime import datetime
+
+import requests
+from flask import Flask, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# PNG 1x1 usado como "QR Code"
+QRCODE_FALSO = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk'
+    '+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+class ConfigFalsa:
+    """Parâmetros de simulação (todos alteráveis em tempo real)"""
+
+    def __init__(self, **kwargs):
+        # Evolution API
+        self.apikey = ''                 # Vazio = aceita qualquer apikey
+        self.latencia_ms = 100           # Latência média por requisição
+        self.variacao_ms = 50            # +/- sobre a latência média
+        self.taxa_erro = 0.0             # Fração de respostas HTTP 500
+        self.limite_por_minuto = 0       # Envios por instância por minuto (0 = sem limite)
+        self.taxa_inexistente = 0.1      # Fração de números "sem WhatsApp" (determinística por número)
+        self.instancias_automaticas = True  # Instância desconhecida já nasce conectada
+
+        # Respostas automáticas dos "pacientes"
+        self.webhook_url = ''            # Se vazio, usa a URL configurada via /webhook/set
+        self.taxa_resposta = 0.0         # Fração de mensagens enviadas que recebem resposta
+        self.atraso_resposta_s = 5.0     # Tempo até a resposta chegar
+        self.respostas = ['SIM', 'NAO', '1', '2', 'Ok, obrigado']
+
+        # Endpoint de IA (/chat/completions)
+        self.latencia_ia_ms = 1500
+        self.variacao_ia_ms = 500
+        self.taxa_erro_ia = 0.0
+        self.taxa_omissao_ia = 0.0       # Fração de termos omitidos em respostas de lote
+
+        self.atualizar(**kwargs)
+
+    def atualizar(self, **kwargs):
+        for campo, valor in kwargs.items():
+            if not hasattr(self, campo):
+                raise ValueError(f'Parâmetro desconhecido: {campo}')
+            atual = getattr(self, campo)
+            if isinstance(atual, bool):
+                valor = valor if isinstance(valor, bool) else str(valor).lower() in ('1', 'true', 'sim')
+            elif isinstance(atual, (int, float)) and not isinstance(valor, list):
+                valor = type(atual)(valor)
+            setattr(self, campo, valor)
+
+    def como_dict(self):
+        return dict(vars(self))
+
+
+def _aguardar(media_ms, variacao_ms):
+    atraso = max(0.0, random.uniform(media_ms - variacao_ms, media_ms + variacao_ms))
+    if atraso:
+        time.sleep(atraso / 1000.0)
+
+
+def _numero_existe(numero, taxa_inexistente):
+    """Decide de forma determinística se o número 'tem WhatsApp'"""
+    return (zlib.crc32(numero.encode()) % 1000) >= taxa_inexistente * 1000
+
+
+def criar_app(config=None):
+    """Cria o app Flask dos serviços falsos"""
+    config = config or ConfigFalsa()
+    app = Flask(__name__)
+
+    instancias = {}     # nome -> {'estado': ..., 'webhook': {...}}
+    envios = {}         # nome -> deque de timestamps (limite por minuto)
+    stats = Counter()
+    lock = threading.Lock()
+
+    def contar(chave, n=1):
+        with lock:
+            stats[chave] += n
+
+    def obter_instancia(nome, criar=None):
+        with lock:
+            inst = instancias.get(nome)
+            if inst is None and (criar if criar is not None else config.instancias_automaticas):
+                inst = instancias[nome] = {'estado': 'open', 'webhook': {}}
+            return inst
+
+    def erro_evolution(status, mensagem):
+        return jsonify({'status': status, 'error': mensagem, 'response': {'message': [mensagem]}}), status
+
+    # -------------------------------------------------------------------------
+    # Latência, erros simulados e autenticação (só endpoints da Evolution)
+    # -------------------------------------------------------------------------
+
+    @app.before_request
+    def simular_rede():
+        caminho = request.path
+        if caminho.startswith('/_falso'):
+            return None
+
+        if caminho.endswith('/chat/completions'):
+            contar('ia_requisicoes')
+            _aguardar(config.latencia_ia_ms, config.variacao_ia_ms)
+            if random.random() < config.taxa_erro_ia:
+                contar('ia_erros')
+                return jsonify({'error': {'message': 'Falha simulada', 'type': 'server_error'}}), 500
+            return None
+
+        contar('evolution_requisicoes')
+        if config.apikey and request.headers.get('apikey') != config.apikey:
+            contar('evolution_nao_autorizado')
+            return erro_evolution(401, 'Unauthorized')
+
+        _aguardar(config.latencia_ms, config.variacao_ms)
+        if random.random() < config.taxa_erro:
+            contar('evolution_erros')
+            return erro_evolution(500, 'Internal Server Error (simulado)')
+        return None
+
+    # -------------------------------------------------------------------------
+    # Gerenciamento de instâncias
+    # -------------------------------------------------------------------------
+
+    @app.route('/instance/create', methods=['POST'])
+    def instancia_criar():
+        dados = request.get_json(silent=True) or {}
+        nome = dados.get('instanceName')
+        if not nome:
+            return erro_evolution(400, 'instanceName is required')
+        with lock:
+            if nome in instancias:
+                return erro_evolution(403, f'The "{nome}" name is already in use.')
+            instancias[nome] = {'estado': 'close', 'webhook': {}}
+        return jsonify({
+            'instance': {'instanceName': nome, 'instanceId': str(uuid.uuid4()), 'status': 'created'},
+            'hash': dados.get('token') or uuid.uuid4().hex,
+        }), 201
+
+    @app.route('/instance/fetchInstances', methods=['GET'])
+    def instancia_listar():
+        with lock:
+            return jsonify([
+                {'instance': {'instanceName': nome, 'status': inst['estado']}}
+                for nome, inst in instancias.items()
+            ])
+
+    @app.route('/instance/connect/<nome>', methods=['GET'])
+    def instancia_conectar(nome):
+        inst = obter_instancia(nome, criar=False)
+        if inst is None:
+            return erro_evolution(404, f'The "{nome}" instance does not exist')
+        # Simula o QR Code lido imediatamente
+        inst['estado'] = 'open'
+        return jsonify({'base64': QRCODE_FALSO, 'code': uuid.uuid4().hex, 'count': 1})
+
+    @app.route('/instance/connectionState/<nome>', methods=['GET'])
+    def instancia_estado(nome):
+        inst = obter_instancia(nome)
+        if inst is None:
+            return erro_evolution(404, f'The "{nome}" instance does not exist')
+        return jsonify({'instance': {'instanceName': nome, 'state': inst['estado']}})
+
+    @app.route('/instance/delete/<nome>', methods=['DELETE'])
+    def instancia_remover(nome):
+        with lock:
+            if instancias.pop(nome, None) is None:
+                return erro_evolution(404, f'The "{nome}" instance does not exist')
+        return jsonify({'status': 'SUCCESS', 'error': False, 'response': {'message': 'Instance deleted'}})
+
+    @app.route('/webhook/set/<nome>', methods=['POST'])
+    def webhook_definir(nome):
+        inst = obter_instancia(nome)
+        if inst is None:
+            return erro_evolution(404, f'The "{nome}" instance does not exist')
+        dados = request.get_json(silent=True) or {}
+        inst['webhook'] = dados.get('webhook', dados)
+        return jsonify(inst['webhook']), 201
+
+    @app.route('/webhook/find/<nome>', methods=['GET'])
+    def webhook_consultar(nome):
+        inst = obter_instancia(nome)
+        if inst is None:
+            return erro_evolution(404, f'The "{nome}" instance does not exist')
+        return jsonify(inst['webhook'])
+
+    # -------------------------------------------------------------------------
+    # Chat e mensagens
+    # -------------------------------------------------------------------------
+
+    @app.route('/chat/whatsappNumbers/<nome>', methods=['POST'])
+    def chat_numeros(nome):
+        if obter_instancia(nome) is None:
+            return erro_evolution(404, f'The "{nome}" instance does not exist')
+        numeros = (request.get_json(silent=True) or {}).get('numbers', [])
+        contar('numeros_verificados', len(numeros))
+        resultado = []
+        for numero in numeros:
+            digitos = ''.join(filter(str.isdigit, str(numero)))
+            existe = _numero_existe(digitos, config.taxa_inexistente)
+            resultado.append({
+                'exists': existe,
+                'jid': f'{digitos}@s.whatsapp.net' if existe else '',
+                'number': digitos,
+            })
+        return jsonify(resultado)
+
+    @app.route('/chat/sendPresence/<nome>', methods=['POST'])
+    def chat_presenca(nome):
+        if obter_instancia(nome) is None:
+            return erro_evolution(404, f'The "{nome}" instance does not exist')
+        contar('presencas')
+        return jsonify({'presence': (request.get_json(silent=True) or {}).get('presence')}), 201
+
+    def registrar_envio(nome, tipo):
+        """Valida instância/limite e monta a resposta de mensagem enviada"""
+        inst = obter_instancia(nome)
+        if inst is None:
+            return None, erro_evolution(404, f'The "{nome}" instance does not exist')
+        if inst['estado'] != 'open':
+            return None, erro_evolution(400, 'Connection Closed')
+
+        if config.limite_por_minuto:
+            agora = time.time()
+            with lock:
+                janela = envios.setdefault(nome, deque())
+                while janela and janela[0] < agora - 60:
+                    janela.popleft()
+                if len(janela) >= config.limite_por_minuto:
+                    stats['envios_limitados'] += 1
+                    return None, erro_evolution(429, 'Too Many Requests (simulado)')
+                janela.append(agora)
+
+        dados = request.get_json(silent=True) or {}
+        numero = ''.join(filter(str.isdigit, str(dados.get('number', ''))))
+        if not numero:
+            return None, erro_evolution(400, 'number is required')
+
+        contar(f'envios_{tipo}')
+        if dados.get('text') and random.random() < config.taxa_resposta:
+            threading.Timer(
+                config.atraso_resposta_s,
+                disparar_webhook, args=(nome, numero, random.choice(config.respostas))
+            ).start()
+
+        return numero, {
+            'key': {
+                'remoteJid': f'{numero}@s.whatsapp.net',
+                'fromMe': True,
+                'id': 'FALSO' + uuid.uuid4().hex[:16].upper(),
+            },
+            'messageTimestamp': int(time.time()),
+            'status': 'PENDING',
+        }
+
+    @app.route('/message/sendText/<nome>', methods=['POST'])
+    def mensagem_texto(nome):
+        numero, resposta = registrar_envio(nome, 'texto')
+        if numero is None:
+            return resposta
+        resposta['message'] = {'conversation': (request.get_json(silent=True) or {}).get('text', '')}
+        return jsonify(resposta), 201
+
+    @app.route('/message/sendMedia/<nome>', methods=['POST'])
+    def mensagem_midia(nome):
+        numero, resposta = registrar_envio(nome, 'midia')
+        if numero is None:
+            return resposta
+        dados = request.get_json(silent=True) or {}
+        resposta['message'] = {'documentMessage': {
+            'fileName': dados.get('fileName'),
+            'mimetype': dados.get('mimetype'),
+            'caption': dados.get('caption'),
+        }}
+        return jsonify(resposta), 201
+
+    # -------------------------------------------------------------------------
+    # Webhooks sintéticos (mensagens recebidas)
+    # -------------------------------------------------------------------------
+
+    def disparar_webhook(nome, numero, texto):
+        """Envia ao sistema um MESSAGES_UPSERT como se o paciente tivesse respondido"""
+        inst = obter_instancia(nome, criar=False) or {}
+        url = config.webhook_url or (inst.get('webhook') or {}).get('url')
+        if not url:
+            contar('webhooks_sem_url')
+            logger.warning(f'Sem URL de webhook para a instância {nome}')
+            return False
+
+        payload = {
+            'event': 'messages.upsert',
+            'instance': nome,
+            'data': {
+                'key': {
+                    'remoteJid': f'{numero}@s.whatsapp.net',
+                    'fromMe': False,
+                    'id': 'FALSO' + uuid.uuid4().hex[:16].upper(),
+                },
+                'pushName': 'Paciente Teste',
+                'message': {'conversation': texto},
+                'messageType': 'conversation',
+                'messageTimestamp': int(time.time()),
+            },
+            'date_time': datetime.utcnow().isoformat(),
+            'sender': f'{numero}@s.whatsapp.net',
+        }
+        try:
+            r = requests.post(url, json=payload, timeout=30)
+            contar('webhooks_enviados' if r.status_code < 400 else 'webhooks_erro')
+            return r.status_code < 400
+        except Exception as e:
+            contar('webhooks_erro')
+            logger.warning(f'Erro ao disparar webhook para {url}: {e}')
+            return False
+
+    # -------------------------------------------------------------------------
+    # IA compatível com OpenAI (DeepSeek)
+    # -------------------------------------------------------------------------
+
+    def normalizacao_falsa(termo):
+        palavra = (termo.split() or ['PROCEDIMENTO'])[0].upper()
+        return {
+            'termo_original': termo,
+            'termo_normalizado': f'Procedimento {palavra.title()}',
+            'termo_simples': f'CIRURGIA ({palavra})'[:50],
+            'explicacao': f'Resposta simulada para {termo}',
+        }
+
+    @app.route('/chat/completions', methods=['POST'])
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        dados = request.get_json(silent=True) or {}
+        mensagens = dados.get('messages') or [{}]
+        prompt = mensagens[-1].get('content', '')
+
+        if 'TERMOS MÉDICOS:' in prompt:
+            bloco = prompt.split('TERMOS MÉDICOS:', 1)[1].split('DIRETRIZES', 1)[0]
+            termos = re.findall(r'^\s*\d+\.\s+(.+?)\s*$', bloco, flags=re.MULTILINE)
+            termos = [t for t in termos if random.random() >= config.taxa_omissao_ia]
+            contar('ia_termos', len(termos))
+            conteudo = json.dumps([normalizacao_falsa(t) for t in termos], ensure_ascii=False)
+        elif 'TERMO MÉDICO:' in prompt:
+            termo = prompt.split('TERMO MÉDICO:', 1)[1].strip().splitlines()[0].strip()
+            contar('ia_termos')
+            item = normalizacao_falsa(termo)
+            item.pop('termo_original')
+            conteudo = json.dumps(item, ensure_ascii=False)
+        else:
+            conteudo = 'OK'
+
+        return jsonify({
+            'id': 'chatcmpl-' + uuid.uuid4().hex,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': dados.get('model', 'falso'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': conteudo},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(conteudo) // 4,
+                      'total_tokens': (len(prompt) + len(conteudo)) // 4},
+        })
+
+    # -------------------------------------------------------------------------
+    # Controle
+    # -------------------------------------------------------------------------
+
+    @app.route('/_falso/stats', methods=['GET'])
+    def falso_stats():
+        with lock:
+            return jsonify({'stats': dict(stats), 'instancias': {n: i['estado'] for n, i in instancias.items()}})
+
+    @app.route('/_falso/config', methods=['GET', 'POST'])
+    def falso_config():
+        if request.method == 'POST':
+            try:
+                config.atualizar(**(request.get_json(silent=True) or {}))
+            except (ValueError, TypeError) as e:
+                return jsonify({'erro': str(e)}), 400
+        return jsonify(config.como_dict())
+
+    @app.route('/_falso/webhook', methods=['POST'])
+    def falso_webhook():
+        """Dispara mensagens recebidas: {"instance", "numero" ou "numeros", "texto"}"""
+        dados = request.get_json(silent=True) or {}
+        nome = dados.get('instance')
+        numeros = dados.get('numeros') or [dados.get('numero')]
+        texto = dados.get('texto') or random.choice(config.respostas)
+        if not nome or not all(numeros):
+            return jsonify({'erro': 'Informe instance e numero/numeros'}), 400
+        enviados = sum(1 for numero in numeros if disparar_webhook(nome, str(numero), texto))
+        return jsonify({'enviados': enviados, 'total': len(numeros)})
+
+    @app.route('/_falso/reset', methods=['POST'])
+    def falso_reset():
+        with lock:
+            stats.clear()
+            envios.clear()
+        return jsonify({'status': 'ok'})
+
+    return app
@@ -62,6 +62,7 @@ def validar_campanha_task(self, campanha_id):
         Retry: Se houver erro temporário
     """
     from app import db, Campanha, Telefone, WhatsApp
+    from progresso_campanhas import publicar_progresso
     from datetime import datetime
 
     logger.info(f"Iniciando validação da campanha {campanha_id}")
@@ -128,6 +129,7 @@ def validar_campanha_task(self, campanha_id):
                     invalidos += 1
 
             db.session.commit()
+            publicar_progresso('fila', camp.id)
             time.sleep(1)  # Pausa entre lotes
 
         # Atualizar status dos contatos
@@ -140,7 +142,9 @@ def validar_campanha_task(self, campanha_id):
 
         camp.status = 'validada'
         camp.status_msg = f'{validos} validos, {invalidos} invalidos'
+        camp.atualizar_stats()
         db.session.commit()
+        publicar_progresso('fila', camp.id)
 
         logger.info(f"Validação concluída: {validos} válidos, {invalidos} inválidos")
 
@@ -183,6 +187,7 @@ def enviar_campanha_task(self, campanha_id):
         Retry: Se houver erro temporário (API indisponível, etc)
     """
     from app import db, Campanha, Contato, Telefone, LogMsg, WhatsApp
+    from progresso_campanhas import publicar_progresso
     from datetime import datetime
 
     logger.info(f"Iniciando envio da campanha {campanha_id}")
@@ -300,16 +305,17 @@ def enviar_campanha_task(self, campanha_id):
             # Envio
             if c.status == 'pronto_envio':
                 # Normalização JIT (Just-In-Time) - normaliza só quando for enviar
-                from app import ProcedimentoNormalizado, DeepSeekAI
+                from app import DeepSeekAI
+                from cache_procedimentos import cache_procedimentos
 
                 if not c.procedimento_normalizado and c.procedimento:
-                    # Verificar cache
-                    cached = ProcedimentoNormalizado.obter_ou_criar(c.procedimento)
-                    if cached and cached.aprovado and cached.termo_simples:
+                    # Verificar cache (memória -> Redis -> banco)
+                    cached = cache_procedimentos.obter(c.procedimento)
+                    if cached and cached['aprovado'] and cached['termo_simples']:
                         # Usar do cache
-                        c.procedimento_normalizado = cached.termo_simples
-                        logger.info(f"[JIT CACHE] '{c.procedimento}' -> '{cached.termo_simples}'")
-                        cached.incrementar_uso()
+                        c.procedimento_normalizado = cached['termo_simples']
+                        logger.info(f"[JIT CACHE] '{c.procedimento}' -> '{cached['termo_simples']}'")
+                        cache_procedimentos.registrar_uso(c.procedimento)
                         db.session.commit()
                     else:
                         # Normalizar via API
@@ -371,6 +377,7 @@ def enviar_campanha_task(self, campanha_id):
                 db.session.commit()
                 camp.atualizar_stats()
                 db.session.commit()
+                publicar_progresso('fila', camp.id)
 
                 # Aguardar intervalo calculado
                 if i < total - 1:
@@ -390,6 +397,7 @@ def enviar_campanha_task(self, campanha_id):
 
         camp.atualizar_stats()
         db.session.commit()
+        publicar_progresso('fila', camp.id)
 
         logger.info(f"Envio concluído: {enviados_pessoas} enviados, {erros} erros")
 
@@ -590,6 +598,67 @@ def limpar_tasks_antigas():
     return {'sucesso': True, 'limpeza': 'automática via result_expires'}
 
 
+@celery.task(
+    base=DatabaseTask,
+    name='tasks.descarregar_uso_procedimentos'
+)
+def descarregar_uso_procedimentos():
+    """
+    Grava em lote os contadores de uso de procedimentos normalizados
+    acumulados no cache (Redis / memória do processo)
+    Executada a cada 5 minutos
+    """
+    from cache_procedimentos import cache_procedimentos
+
+    try:
+        total = cache_procedimentos.descarregar_uso()
+        if total:
+            logger.info(f"Uso de procedimentos gravado: {total} incrementos")
+        return {'sucesso': True, 'incrementos': total}
+    except Exception as e:
+        logger.exception(f"Erro ao gravar uso de procedimentos: {e}")
+        return {'sucesso': False, 'erro': str(e)}
+
+
+@celery.task(
+    base=DatabaseTask,
+    name='tasks.atualizar_metricas_diarias'
+)
+def atualizar_metricas_diarias():
+    """
+    Atualiza daily_metrics (agregados diários dos gráficos) a partir das
+    marcas d'água da última execução
+    Executada a cada 5 minutos
+    """
+    from metricas_diarias import atualizar_metricas_diarias as atualizar
+
+    try:
+        linhas = atualizar()
+        return {'sucesso': True, 'linhas': linhas}
+    except Exception as e:
+        logger.exception(f"Erro ao atualizar métricas diárias: {e}")
+        return {'sucesso': False, 'erro': str(e)}
+
+
+@celery.task(
+    base=DatabaseTask,
+    name='tasks.atualizar_snapshots_dashboard'
+)
+def atualizar_snapshots_dashboard():
+    """
+    Recalcula os snapshots do dashboard administrativo (um por modo)
+    Executada a cada 5 minutos
+    """
+    from dashboard_admin import atualizar_snapshots
+
+    try:
+        modos = list(atualizar_snapshots())
+        return {'sucesso': True, 'modos': modos}
+    except Exception as e:
+        logger.exception(f"Erro ao atualizar snapshots do dashboard: {e}")
+        return {'sucesso': False, 'erro': str(e)}
+
+
 @celery.task(
     base=DatabaseTask,
     name='tasks.retomar_campanhas_automaticas'
@@ -771,6 +840,10 @@ def processar_planilha_task(self, arquivo_path, campanha_id):
         pessoas = {}
         total_linhas = len(df)
 
+        # Normalizar a coluna de telefones inteira de uma vez
+        from telefones import telefones_por_linha
+        telefones_linha = telefones_por_linha(df[col_tel])
+
         for idx, row in df.iterrows():
             # Atualizar progresso
             if idx % 10 == 0:
@@ -839,23 +912,7 @@ def processar_planilha_task(self, arquivo_path, campanha_id):
                 }
 
             # Telefones
-            tels = str(row.get(col_tel, '')).strip()
-            if tels and tels.lower() != 'nan':
-                for tel in tels.replace(',', ' ').replace(';', ' ').replace('/', ' ').split():
-                    tel = tel.strip()
-                    if not tel: continue
-                    # Formatar número
-                    num = ''.join(filter(str.isdigit, str(tel))).lstrip('0')
-                    if num:
-                        if num.startswith('55'):
-                            fmt = num if len(num) in [12, 13] else None
-                        elif len(num) in [10, 11]:
-                            fmt = '55' + num
-                        else:
-                            fmt = None
-
-                        if fmt:
-                            pessoas[chave]['telefones'].add((tel, fmt))
+            pessoas[chave]['telefones'].update(telefones_linha.get(idx, []))
 
         # Salvar contatos no banco (SEM normalizar - será feito JIT no envio)
         self.update_state(
@@ -871,52 +928,38 @@ def processar_planilha_task(self, arquivo_path, campanha_id):
         camp.status_msg = 'Salvando contatos...'
         db.session.commit()
 
-        criados = 0
-        total_pessoas = len(pessoas)
-
-        for idx, (chave, dados) in enumerate(pessoas.items(), 1):
-            if not dados['telefones']:
-                continue
+        # Salvar contatos com procedimento ORIGINAL (normalização será JIT)
+        # em lotes: INSERT multi-linha de contatos + telefones, commit por lote
+        from importacao_lote import salvar_contatos_em_lote
 
-            # Atualizar progresso
-            if idx % 10 == 0:
-                progresso = 50 + int((idx / total_pessoas) * 45)  # 50-95%
-                self.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'current': idx,
-                        'total': total_pessoas,
-                        'percent': progresso,
-                        'status': f'Salvando contato {idx}/{total_pessoas}: {dados["nome"][:30]}...'
-                    }
-                )
+        pessoas_com_telefone = [
+            dict(dados, telefones=sorted(dados['telefones']))
+            for dados in pessoas.values() if dados['telefones']
+        ]
 
-            # Salvar contato com procedimento ORIGINAL (normalização será JIT)
-            proc_original = dados['procedimento']
+        # Se a task for reentregue (worker caiu), retomar após os lotes já commitados
+        ja_salvos = camp.contatos.count()
+        if ja_salvos:
+            logger.info(f"Retomando importação da campanha {campanha_id} a partir do contato {ja_salvos}")
 
-            c = Contato(
-                campanha_id=campanha_id,
-                nome=dados['nome'][:200],
-                data_nascimento=dados['nascimento'],
-                procedimento=proc_original[:500],
-                procedimento_normalizado=None,  # Será preenchido JIT no envio
-                status='pendente'
+        def reportar_progresso(processados, total):
+            progresso = 50 + int((processados / total) * 45)  # 50-95%
+            self.update_state(
+                state='PROGRESS',
+                meta={
+                    'current': processados,
+                    'total': total,
+                    'percent': progresso,
+                    'status': f'Salvando contatos {processados}/{total}...'
+                }
             )
-            db.session.add(c)
-            db.session.flush()
-
-            for i, (original, fmt) in enumerate(dados['telefones']):
-                t = Telefone(
-                    contato_id=c.id,
-                    numero=original[:20],
-                    numero_fmt=fmt,
-                    prioridade=i+1
-                )
-                db.session.add(t)
 
-            criados += 1
-
-        db.session.commit()
+        criados = salvar_contatos_em_lote(
+            campanha_id,
+            pessoas_com_telefone,
+            inicio=ja_salvos,
+            ao_progredir=reportar_progresso
+        )
 
         # Atualizar estatísticas
         self.update_state(
@@ -971,6 +1014,216 @@ def processar_planilha_task(self, arquivo_path, campanha_id):
         raise
 
 
+@celery.task(
+    base=DatabaseTask,
+    bind=True,
+    name='tasks.importar_consultas_task',
+    max_retries=2,
+    default_retry_delay=30,
+    time_limit=1800,  # 30 minutos máximo
+    soft_time_limit=1700
+)
+def importar_consultas_task(self, arquivo_path, campanha_id):
+    """
+    Importa planilha de consultas (AGHU) de forma assíncrona com feedback de progresso
+
+    Args:
+        arquivo_path: Caminho do arquivo Excel
+        campanha_id: ID da campanha de consultas
+
+    Returns:
+        dict: Resultado da importação
+    """
+    from app import db, CampanhaConsulta, AgendamentoConsulta
+    from importacao_lote import (
+        preparar_agendamentos, salvar_agendamentos_em_lote, COLUNAS_CONSULTA_OBRIGATORIAS
+    )
+    import pandas as pd
+    import os
+
+    logger.info(f"Importando planilha de consultas para campanha {campanha_id}")
+
+    try:
+        self.update_state(
+            state='PROGRESS',
+            meta={
+                'current': 0,
+                'total': 100,
+                'percent': 0,
+                'status': 'Lendo arquivo Excel...'
+            }
+        )
+
+        camp = db.session.get(CampanhaConsulta, campanha_id)
+        if not camp:
+            return {'sucesso': False, 'erro': 'Campanha não encontrada'}
+
+        camp.status = 'processando'
+        camp.status_msg = 'Lendo planilha...'
+        db.session.commit()
+
+        df = pd.read_excel(arquivo_path, dtype=str)
+
+        colunas_faltando = [c for c in COLUNAS_CONSULTA_OBRIGATORIAS if c not in df.columns]
+        if colunas_faltando:
+            camp.status = 'erro'
+            camp.status_msg = f'Colunas obrigatórias faltando: {", ".join(colunas_faltando)}'
+            db.session.commit()
+            return {'sucesso': False, 'erro': camp.status_msg}
+
+        self.update_state(
+            state='PROGRESS',
+            meta={
+                'current': 10,
+                'total': 100,
+                'percent': 10,
+                'status': f'Processando {len(df)} linhas...'
+            }
+        )
+
+        agendamentos = preparar_agendamentos(df)
+        del df
+
+        camp.status_msg = 'Salvando consultas...'
+        db.session.commit()
+
+        # Se a task for reentregue (worker caiu), retomar após os lotes já commitados
+        ja_salvos = AgendamentoConsulta.query.filter_by(campanha_id=campanha_id).count()
+        if ja_salvos:
+            logger.info(f"Retomando importação da campanha de consultas {campanha_id} a partir da linha {ja_salvos}")
+
+        def reportar_progresso(processados, total):
+            progresso = 20 + int((processados / total) * 75)  # 20-95%
+            self.update_state(
+                state='PROGRESS',
+                meta={
+                    'current': processados,
+                    'total': total,
+                    'percent': progresso,
+                    'status': f'Salvando consultas {processados}/{total}...'
+                }
+            )
+
+        consultas_criadas = salvar_agendamentos_em_lote(
+            campanha_id,
+            camp.criador_id,
+            agendamentos,
+            inicio=ja_salvos,
+            ao_progredir=reportar_progresso
+        )
+
+        camp.total_consultas = consultas_criadas
+        camp.status = 'pronta' if consultas_criadas > 0 else 'erro'
+        camp.status_msg = f'{consultas_criadas} consultas importadas'
+        db.session.commit()
+
+        logger.info(f"Planilha de consultas importada: {consultas_criadas} consultas criadas")
+
+        if os.path.exists(arquivo_path):
+            try:
+                os.remove(arquivo_path)
+            except Exception as e:
+                logger.warning(f"Erro ao remover arquivo temporário: {e}")
+
+        return {
+            'sucesso': True,
+            'criados': consultas_criadas,
+            'campanha_id': campanha_id
+        }
+
+    except Exception as e:
+        logger.exception(f"Erro ao importar planilha de consultas: {e}")
+        db.session.rollback()
+        camp = db.session.get(CampanhaConsulta, campanha_id)
+        if camp:
+            camp.status = 'erro'
+            camp.status_msg = str(e)[:200]
+            db.session.commit()
+
+        if os.path.exists(arquivo_path):
+            try:
+                os.remove(arquivo_path)
+            except Exception as e2:
+                logger.warning(f"Erro ao remover arquivo temporário: {e2}")
+
+        raise
+
+
+@celery.task(
+    base=DatabaseTask,
+    bind=True,
+    name='tasks.enviar_comprovante_task',
+    max_retries=3,
+    time_limit=600,
+    soft_time_limit=540
+)
+def enviar_comprovante_task(self, usuario_id, consulta_id, filepath, telefone, base_url):
+    """
+    Envia o comprovante de uma consulta (OCR + mensagem + arquivo)
+    Roteada para a fila "comprovantes" (ver task_routes em celery_app.py)
+
+    Falhas temporárias (erro na Evolution API, banco fora do ar) são repetidas
+    com backoff (1, 2, 4 min); esgotadas as tentativas, ou em falha definitiva
+    (WhatsApp não configurado, arquivo ausente, erro inesperado), a consulta
+    fica com envio_comprovante_status = 'ERRO' na hora.
+    """
+    from sqlalchemy.exc import OperationalError
+    from app import db, AgendamentoConsulta
+    from envio_comprovantes import enviar_comprovante, marcar_status_envio, ErroEnvioComprovante
+
+    try:
+        enviado = enviar_comprovante(usuario_id, consulta_id, filepath, telefone, base_url)
+        return {'sucesso': enviado, 'consulta_id': consulta_id}
+
+    except Exception as e:
+        db.session.rollback()
+
+        temporaria = isinstance(e, (ErroEnvioComprovante, OperationalError))
+        if temporaria and self.request.retries < self.max_retries:
+            espera = 60 * (2 ** self.request.retries)
+            logger.warning(
+                f"Envio de comprovante da consulta {consulta_id} falhou ({e}). "
+                f"Nova tentativa em {espera}s ({self.request.retries + 1}/{self.max_retries})"
+            )
+            raise self.retry(exc=e, countdown=espera)
+
+        if temporaria:
+            logger.error(f"Envio de comprovante da consulta {consulta_id} falhou após {self.max_retries} tentativas: {e}")
+        else:
+            logger.error(f"Envio de comprovante da consulta {consulta_id} falhou sem possibilidade de retry: {e}")
+        consulta = db.session.get(AgendamentoConsulta, consulta_id)
+        if consulta:
+            marcar_status_envio(consulta, 'ERRO', str(e))
+            db.session.commit()
+        return {'sucesso': False, 'consulta_id': consulta_id, 'erro': str(e)}
+
+
+@celery.task(
+    base=DatabaseTask,
+    name='tasks.ocr_comprovante_antecipado_task',
+    time_limit=300,
+    soft_time_limit=270
+)
+def ocr_comprovante_antecipado_task(comp_id):
+    """
+    OCR de um comprovante antecipado logo após o upload
+    Roteada para a fila "ocr_comprovantes" (ver task_routes em celery_app.py)
+
+    Os dados ficam em ComprovanteAntecipado.dados_ocr e no cache de OCR, e o
+    envio após a confirmação do paciente não precisa mais esperar pelo OCR.
+    """
+    from app import db
+    from envio_comprovantes import processar_ocr_comprovante_antecipado
+
+    try:
+        dados = processar_ocr_comprovante_antecipado(comp_id)
+        return {'sucesso': dados is not None, 'comp_id': comp_id}
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro no OCR do comprovante antecipado {comp_id}: {e}")
+        return {'sucesso': False, 'comp_id': comp_id, 'erro': str(e)}
+
+
 @celery.task(
     base=DatabaseTask,
     name='tasks.retomar_campanhas_consultas_automaticas'
@@ -1177,6 +1430,7 @@ def enviar_campanha_consultas_task(self, campanha_id):
         LogMsgConsulta, WhatsApp, formatar_numero, formatar_mensagem_consulta_inicial,
         buscar_comprovante_antecipado, extrair_dados_comprovante
     )
+    from progresso_campanhas import publicar_progresso
     from datetime import datetime
 
     logger.info(f"Iniciando envio da campanha de consultas {campanha_id}")
@@ -1425,6 +1679,7 @@ def enviar_campanha_consultas_task(self, campanha_id):
             db.session.commit()
             camp.atualizar_stats()
             db.session.commit()
+            publicar_progresso('consulta', camp.id)
 
             # Aguardar intervalo calculado
             if i < total - 1 and sucesso_envio:
@@ -1447,6 +1702,7 @@ def enviar_campanha_consultas_task(self, campanha_id):
 
         camp.atualizar_stats()
         db.session.commit()
+        publicar_progresso('consulta', camp.id)
 
         logger.info(f"Envio concluído: {enviados} enviados, {erros} erros")
 
@@ -1492,6 +1748,7 @@ def enviar_campanha_scih_task(self, campanha_id, base_url):
         db, CampanhaSCIH, PacienteSCIH, LogMsgSCIH,
         WhatsApp, formatar_numero
     )
+    from progresso_campanhas import publicar_progresso
     from datetime import datetime
 
     logger.info(f"Iniciando envio SCIH campanha {campanha_id}")
@@ -1623,6 +1880,7 @@ def enviar_campanha_scih_task(self, campanha_id, base_url):
             db.session.commit()
             camp.atualizar_stats()
             db.session.commit()
+            publicar_progresso('scih', camp.id)
 
             if i < total - 1 and ok:
                 intervalo = camp.calcular_intervalo()
@@ -1642,6 +1900,7 @@ def enviar_campanha_scih_task(self, campanha_id, base_url):
 
         camp.atualizar_stats()
         db.session.commit()
+        publicar_progresso('scih', camp.id)
 
         logger.info(f"SCIH envio concluído: {enviados} enviados, {erros} erros, {restantes} pendentes")
         return {
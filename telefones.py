@@ -0,0 +1,184 @@
+"""
+=============================================================================
+TELEFONES - NORMALIZACAO
+=============================================================================
+Normalização de números de telefone compartilhada por importações e webhook.
+
+Forma canônica: apenas dígitos, com DDI 55 (ex: 5585999999999).
+Números brasileiros podem chegar com ou sem o 9º dígito, então toda busca
+usa as duas variantes:
+- com_nono: 13 dígitos (55 + DDD + 9 + 8 dígitos)
+- sem_nono: 12 dígitos (55 + DDD + 8 dígitos)
+
+API escalar (um número por vez) para webhook/rotas e API vetorizada
+(pandas) para normalizar colunas inteiras de planilhas.
+"""
+
+import re
+
+import pandas as pd
+
+# Separadores aceitos entre vários números na mesma célula
+SEPARADORES_TELEFONE = r'[/,;\s]+'
+
+
+# =============================================================================
+# API ESCALAR
+# =============================================================================
+
+def apenas_digitos(valor):
+    """Remove tudo que não for dígito"""
+    if valor is None:
+        return ''
+    return ''.join(filter(str.isdigit, str(valor)))
+
+
+def formatar_numero(num):
+    """
+    Retorna a forma canônica (55 + DDD + número) ou None se inválido.
+
+    Aceita números com DDI (12-13 dígitos) ou sem DDI (10-11 dígitos).
+    """
+    if not num:
+        return None
+    num = apenas_digitos(num).lstrip('0')
+    if not num:
+        return None
+    if num.startswith('55'):
+        return num if len(num) in [12, 13] else None
+    if len(num) in [10, 11]:
+        return '55' + num
+    return None
+
+
+def com_nono_digito(numero):
+    """Variante com 9º dígito (13 dígitos) de um número canônico"""
+    if numero and len(numero) == 12:
+        return numero[:4] + '9' + numero[4:]
+    return numero
+
+
+def sem_nono_digito(numero):
+    """Variante sem 9º dígito (12 dígitos) de um número canônico"""
+    if numero and len(numero) == 13:
+        return numero[:4] + numero[5:]
+    return numero
+
+
+def variantes_nono_digito(numero):
+    """
+    Lista de chaves de busca para um número: o próprio número primeiro,
+    seguido da variante com/sem 9º dígito (quando houver).
+    """
+    if not numero:
+        return []
+    variantes = [numero]
+    for alt in (com_nono_digito(numero), sem_nono_digito(numero)):
+        if alt not in variantes:
+            variantes.append(alt)
+    return variantes
+
+
+def normalizar_telefone(num):
+    """
+    Normaliza um número para (canonico, com_nono, sem_nono).
+
+    Retorna (None, None, None) se o número for inválido.
+    """
+    canonico = formatar_numero(num)
+    if not canonico:
+        return None, None, None
+    return canonico, com_nono_digito(canonico), sem_nono_digito(canonico)
+
+
+def separar_telefones(texto, separadores=SEPARADORES_TELEFONE):
+    """Divide uma célula com vários números (ex: "8599... / 8598...") em partes"""
+    if not texto:
+        return []
+    return [t for t in re.split(separadores, str(texto).strip()) if t]
+
+
+# =============================================================================
+# API VETORIZADA (pandas)
+# =============================================================================
+
+def formatar_numeros(serie):
+    """
+    Versão vetorizada de formatar_numero: recebe uma Series e devolve outra
+    Series (mesmo índice) com a forma canônica ou None.
+    """
+    digitos = (
+        serie.fillna('').astype(str)
+        .str.replace(r'\D', '', regex=True)
+        .str.lstrip('0')
+    )
+    tamanho = digitos.str.len()
+    com_ddi = digitos.str.startswith('55')
+
+    canonico = pd.Series(None, index=serie.index, dtype=object)
+    canonico = canonico.mask(com_ddi & tamanho.isin([12, 13]), digitos)
+    canonico = canonico.mask(~com_ddi & tamanho.isin([10, 11]), '55' + digitos)
+    return canonico
+
+
+def normalizar_telefones(serie):
+    """
+    Normaliza uma Series de números.
+
+    Returns:
+        DataFrame com colunas 'canonico', 'com_nono' e 'sem_nono'
+        (None nas linhas inválidas), mesmo índice da entrada.
+    """
+    canonico = formatar_numeros(serie)
+    tamanho = canonico.str.len()
+
+    com_nono = canonico.mask(tamanho == 12, canonico.str[:4] + '9' + canonico.str[4:])
+    sem_nono = canonico.mask(tamanho == 13, canonico.str[:4] + canonico.str[5:])
+
+    return pd.DataFrame({
+        'canonico': canonico,
+        'com_nono': com_nono,
+        'sem_nono': sem_nono,
+    })
+
+
+def explodir_telefones(serie, separadores=SEPARADORES_TELEFONE):
+    """
+    Divide células com vários números e normaliza todos de uma vez.
+
+    Returns:
+        DataFrame com uma linha por número válido, índice = índice da linha
+        original, colunas 'original', 'canonico', 'com_nono', 'sem_nono'.
+        A ordem dos números dentro de cada célula é preservada.
+    """
+    partes = (
+        serie.fillna('').astype(str).str.strip()
+        .str.split(separadores, regex=True)
+        .explode()
+        .str.strip()
+    )
+    partes = partes[partes.notna() & (partes != '')]
+
+    normalizados = normalizar_telefones(partes)
+    normalizados.insert(0, 'original', partes)
+    return normalizados[normalizados['canonico'].notna()]
+
+
+def telefones_por_linha(serie, separadores=SEPARADORES_TELEFONE):
+    """
+    Agrupa os números válidos de cada linha (sem duplicatas, em ordem).
+
+    Returns:
+        dict {indice_da_linha: [(original, canonico), ...]}
+    """
+    explodidos = explodir_telefones(serie, separadores)
+    duplicados = pd.DataFrame({
+        'linha': explodidos.index,
+        'canonico': explodidos['canonico'].values,
+    }).duplicated()
+    explodidos = explodidos[~duplicados.values]
+
+    resultado = {}
+    for idx, original, canonico in zip(explodidos.index, explodidos['original'], explodidos['canonico']):
+        resultado.setdefault(idx, []).append((original, canonico))
+    return resultado